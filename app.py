@@ -6,12 +6,17 @@ Aplicación Streamlit para Scraper de CSF
 import streamlit as st
 import pandas as pd
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import io
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
-
-from sat_scraper_cloud import SATScraper
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+
+import metrics
+import profiling
+from sat_scraper_cloud import SATScraper, EXCEL_SHEETS, STAGE_QR, STAGE_PDF_TEXT, STAGE_WEB
+from pipeline import PipelinedExecutor
 import utils
 
 # Configuración de la página con estilo corporativo
@@ -328,11 +333,121 @@ def create_footer(app_name, description):
     </div>
     """, unsafe_allow_html=True)
 
+@st.cache_resource(show_spinner=False)
+def get_scraper(timeout: int) -> SATScraper:
+    """
+    Scraper compartido entre recargas y sesiones: conserva la sesión HTTP (pool
+    keep-alive), los detectores QR por hilo y el cache de scraping (persistido en
+    SQLite si se define SCRAPER_CACHE_DB). Con SCRAPER_ARCHIVE_DIR cada página del
+    SAT descargada se archiva para volver a parsearla sin red
+    """
+    scraper = SATScraper()
+    scraper.request_timeout = timeout
+    scraper.collect_diagnostics = True
+    if os.environ.get('SCRAPER_CACHE_DB'):
+        scraper.use_cache_db(os.environ['SCRAPER_CACHE_DB'])
+    if os.environ.get('SCRAPER_ARCHIVE_DIR'):
+        scraper.use_archive(os.environ['SCRAPER_ARCHIVE_DIR'])
+    return scraper
+
+@st.cache_resource(show_spinner=False)
+def get_executor(timeout: int) -> PipelinedExecutor:
+    """
+    Pools de hilos de ambas etapas, uno por scraper. Los controles de workers lo
+    redimensionan en lugar de crear otro (un ejecutor desalojado del cache nunca
+    liberaba sus hilos)
+    """
+    return PipelinedExecutor(get_scraper(timeout))
+
+@st.cache_resource(show_spinner=False)
+def get_result_cache() -> utils.FileResultCache:
+    """
+    Resultados por archivo indexados por hash del contenido
+    """
+    return utils.FileResultCache()
+
+@st.cache_resource(show_spinner=False)
+def get_export_pool() -> ThreadPoolExecutor:
+    """
+    Hilo de fondo que genera los archivos Excel
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='csf-export')
+
+def set_results(results: List[Dict]) -> None:
+    """
+    Publica un nuevo conjunto de resultados: incrementa su versión y descarta las
+    vistas y exportaciones memoizadas
+    """
+    st.session_state.results = results
+    st.session_state.results_version = st.session_state.get('results_version', 0) + 1
+    st.session_state.view_cache = {}
+    st.session_state.excel_exports = {}
+
+def start_excel_export(scraper: SATScraper, sheets: Tuple[str, ...]) -> Future:
+    """
+    Exportación a Excel de la versión actual de resultados con las hojas indicadas.
+    Se genera en segundo plano una sola vez; retorna un Future con (bytes, ms)
+    """
+    exports = st.session_state.setdefault('excel_exports', {})
+    key = (st.session_state.get('results_version', 0), sheets)
+    if key not in exports:
+        results = st.session_state.results
+
+        def build() -> Tuple[bytes, float]:
+            start = time.perf_counter()
+            excel_bytes = scraper.export_to_excel(results, sheets=sheets)
+            return excel_bytes, (time.perf_counter() - start) * 1000
+
+        exports[key] = get_export_pool().submit(build)
+    return exports[key]
+
+def cached_view(name: str, builder, *args):
+    """
+    Vista derivada de los resultados (DataFrame, conteos), construida una sola vez
+    por versión de resultados y argumentos; las recargas de la UI la reutilizan
+    """
+    cache = st.session_state.setdefault('view_cache', {})
+    key = (st.session_state.get('results_version', 0), name) + args
+    if key not in cache:
+        cache[key] = builder(st.session_state.results, *args)
+    return cache[key]
+
+def render_paginated(df: pd.DataFrame, key: str, page_sizes=(50, 100, 500)) -> None:
+    """
+    Muestra el DataFrame por páginas: solo la página visible se envía al navegador
+    """
+    if len(df) <= page_sizes[0]:
+        st.dataframe(df, width='stretch')
+        return
+
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        page_size = st.selectbox("Filas por página", page_sizes, key=f"{key}_page_size")
+    pages = utils.page_count(len(df), page_size)
+    # La página vive solo en session_state (sin value=): se inicializa una vez y se
+    # ajusta si cambió el tamaño de página
+    page_key = f"{key}_page"
+    if page_key not in st.session_state:
+        st.session_state[page_key] = 1
+    elif st.session_state[page_key] > pages:
+        st.session_state[page_key] = pages
+    with col2:
+        page = st.number_input(f"Página (de {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+    with col3:
+        first = (page - 1) * page_size + 1
+        st.caption(f"Filas {first}–{min(page * page_size, len(df))} de {len(df)}")
+
+    st.dataframe(utils.paginate_dataframe(df, page, page_size), width='stretch')
+
 def main():
     """
     Función principal de la aplicación
     """
     
+    # Exponer /metrics si se configuró un puerto (p. ej. SCRAPER_METRICS_PORT=9108)
+    if os.environ.get('SCRAPER_METRICS_PORT'):
+        metrics.start_http_server(int(os.environ['SCRAPER_METRICS_PORT']))
+
     # Header principal con estilo corporativo
     create_main_header(
         title="📂 Scraper CSF SAT",
@@ -363,10 +478,14 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             max_workers = st.slider("🔄 Procesamiento paralelo", min_value=1, max_value=2, value=2,
-                                   help="Número máximo de archivos procesando simultáneamente (óptimo para hasta 10 archivos)")
+                                   help="Número máximo de archivos en extracción PDF/QR simultánea (etapa de CPU)")
         with col2:
             timeout = st.slider("⏱️ Timeout (segundos)", min_value=5, max_value=60, value=15,
                               help="Tiempo máximo de espera por solicitud")
+        io_workers = st.slider("🌐 Consultas SAT simultáneas", min_value=1, max_value=16, value=8,
+                               help="Número máximo de consultas al SAT en curso (etapa de red, independiente de la de CPU)")
+        enable_profiling = st.checkbox("🔬 Perfilar lote", value=False,
+                                       help="Registra cProfile, pilas muestreadas y asignaciones de memoria del lote (descargable en 📥 Descargar)")
         
         # Información
         st.subheader("ℹ️ Información")
@@ -384,13 +503,11 @@ def main():
         # Estadísticas de sesión
         if 'results' in st.session_state and st.session_state.results:
             st.subheader("📊 Estadísticas de Sesión")
-            total_files = len(st.session_state.results)
-            successful_scraping = len([r for r in st.session_state.results if r.get('scraping_exitoso')])
-            successful_pdf = len([r for r in st.session_state.results if r.get('extraccion_pdf_exitosa')])
+            counts = cached_view('counts', utils.count_results)
             
-            st.metric("📄 Total procesados", total_files)
-            st.metric("✅ Scraping exitoso", successful_scraping)
-            st.metric("📄 PDF exitoso", successful_pdf)
+            st.metric("📄 Total procesados", counts['total'])
+            st.metric("✅ Scraping exitoso", counts['scraping'])
+            st.metric("📄 PDF exitoso", counts['pdf'])
     
     # Contenido principal
     tab1, tab2, tab3, tab4 = st.tabs(["📤 Cargar PDFs", "📊 Resultados", "📈 Estadísticas", "📥 Descargar"])
@@ -425,7 +542,7 @@ def main():
             
             # Botón de procesamiento
             if st.button("🚀 Iniciar Procesamiento", type="primary", width='stretch'):
-                process_files(uploaded_files, enable_web_scraping, enable_pdf_extraction, max_workers, timeout)
+                process_files(uploaded_files, enable_web_scraping, enable_pdf_extraction, max_workers, timeout, io_workers, enable_profiling)
     
     with tab2:
         st.header("📊 Resultados del Procesamiento")
@@ -436,22 +553,22 @@ def main():
             
             with result_tab1:
                 st.subheader("📋 Resumen General")
-                summary_df = utils.create_summary_dataframe(st.session_state.results)
-                st.dataframe(summary_df, width='stretch')
+                summary_df = cached_view('summary', utils.create_summary_dataframe)
+                render_paginated(summary_df, 'summary')
             
             with result_tab2:
                 st.subheader("🌐 Datos Extraídos del Web")
-                detailed_df = utils.create_detailed_dataframe(st.session_state.results)
+                detailed_df = cached_view('detailed', utils.create_detailed_dataframe)
                 if not detailed_df.empty:
-                    st.dataframe(detailed_df, width='stretch')
+                    render_paginated(detailed_df, 'detailed')
                 else:
                     st.info("No hay datos del web para mostrar")
             
             with result_tab3:
                 st.subheader("📄 Datos Extraídos del PDF")
-                pdf_df = utils.create_pdf_dataframe(st.session_state.results)
+                pdf_df = cached_view('pdf', utils.create_pdf_dataframe)
                 if not pdf_df.empty:
-                    st.dataframe(pdf_df, width='stretch')
+                    render_paginated(pdf_df, 'pdf')
                 else:
                     st.info("No hay datos del PDF para mostrar")
         else:
@@ -464,10 +581,11 @@ def main():
             # Métricas principales
             col1, col2, col3, col4 = st.columns(4)
             
-            total_files = len(st.session_state.results)
-            successful_scraping = len([r for r in st.session_state.results if r.get('scraping_exitoso')])
-            successful_pdf = len([r for r in st.session_state.results if r.get('extraccion_pdf_exitosa')])
-            files_with_qr = len([r for r in st.session_state.results if r.get('url_encontrada')])
+            counts = cached_view('counts', utils.count_results)
+            total_files = counts['total']
+            successful_scraping = counts['scraping']
+            successful_pdf = counts['pdf']
+            files_with_qr = counts['qr']
             
             with col1:
                 st.metric("📄 Total PDFs", total_files)
@@ -483,9 +601,18 @@ def main():
             
             # Tabla de estadísticas detalladas
             st.subheader("📊 Estadísticas Detalladas")
-            stats_df = utils.create_stats_dataframe(st.session_state.results)
+            stats_df = cached_view('stats', lambda results: utils.create_stats_dataframe(results, counts))
             st.dataframe(stats_df, width='stretch')
             
+            # Tiempos por etapa (bloque de diagnóstico de cada archivo)
+            timing_df = cached_view('timing', utils.create_timing_dataframe)
+            if not timing_df.empty:
+                st.subheader("⏱️ Tiempos por Etapa")
+                st.dataframe(timing_df, width='stretch')
+
+                stage = st.selectbox("📊 Histograma de la etapa", timing_df['Etapa'].tolist())
+                st.bar_chart(cached_view('histogram', utils.create_histogram_dataframe, stage))
+
             # Gráficos (si hay datos)
             if total_files > 0:
                 st.subheader("📊 Gráficos")
@@ -507,35 +634,47 @@ def main():
         
         if 'results' in st.session_state and st.session_state.results:
             st.subheader("📊 Exportar a Excel")
-            
-            # Información del archivo
-            filename = utils.create_download_filename()
-            st.info(f"📄 Archivo a generar: {filename}")
-            
-            # Botón de descarga
-            if st.button("📥 Descargar Excel", type="primary", width='stretch'):
+
+            chosen = st.multiselect("📑 Hojas a incluir", EXCEL_SHEETS, default=list(EXCEL_SHEETS), key='excel_sheets')
+            # Orden estándar: la misma selección reutiliza la misma exportación
+            sheets = tuple(name for name in EXCEL_SHEETS if name in chosen)
+            if not sheets:
+                st.warning("Selecciona al menos una hoja")
+            else:
+                # Generado en segundo plano al terminar el procesamiento (o al cambiar las hojas)
+                export = start_excel_export(get_scraper(timeout), sheets)
                 try:
-                    with st.spinner("🔄 Generando archivo Excel..."):
-                        # Crear instancia del scraper
-                        scraper = SATScraper()
-                        
-                        # Generar archivo Excel
-                        excel_bytes = scraper.export_to_excel(st.session_state.results, filename)
-                        
-                        # Crear botón de descarga
-                        st.download_button(
-                            label="💾 Descargar Archivo Excel",
-                            data=excel_bytes,
-                            file_name=filename,
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                            width='stretch'
-                        )
-                        
-                        st.success("✅ Archivo Excel generado correctamente")
-                        
+                    if not export.done():
+                        with st.spinner("🔄 Generando archivo Excel..."):
+                            export.result()
+                    excel_bytes, export_ms = export.result()
                 except Exception as e:
-                    st.error(f"❌ Error generando archivo: {str(e)}")
+                    excel_bytes, export_ms = b'', 0.0
+                    st.error(f"❌ Error generando archivo Excel: {str(e)}")
+
+                if excel_bytes:
+                    filename = utils.create_download_filename()
+                    st.download_button(
+                        label="💾 Descargar Archivo Excel",
+                        data=excel_bytes,
+                        file_name=filename,
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        type="primary",
+                        width='stretch'
+                    )
+                    st.caption(f"📄 {filename} · ⏱️ Exportación: {export_ms:.0f} ms")
             
+            # Perfil del último lote (modo 🔬 Perfilar lote)
+            if st.session_state.get('profile_zip'):
+                st.subheader("🔬 Perfil del Lote")
+                st.download_button(
+                    label="💾 Descargar Perfil (pstats, pilas folded, asignaciones)",
+                    data=st.session_state.profile_zip,
+                    file_name=f"perfil_lote_{time.strftime('%Y%m%d_%H%M%S')}.zip",
+                    mime="application/zip",
+                    width='stretch'
+                )
+
             # Información del archivo
             st.subheader("📋 Contenido del Archivo")
             st.info("""
@@ -548,101 +687,152 @@ def main():
         else:
             st.info("📤 No hay resultados para descargar. Procesa archivos primero.")
 
-def process_single_file(args):
+def selected_stages(enable_web_scraping: bool, enable_pdf_extraction: bool) -> set:
     """
-    Procesa un solo archivo PDF - función worker para procesamiento paralelo
+    Traduce las opciones de la barra lateral a las etapas del scraper
     """
-    uploaded_file, enable_web_scraping, enable_pdf_extraction, timeout = args
-
-    try:
-        # Crear scraper local para este hilo con configuración optimizada
-        scraper = SATScraper()
-        scraper.request_timeout = timeout
-
-        # Leer bytes del archivo
-        pdf_bytes = uploaded_file.read()
-
-        # Procesar PDF
-        result = scraper.process_pdf(pdf_bytes, uploaded_file.name)
-
-        # Aplicar configuraciones
-        if not enable_web_scraping:
-            result['scraping_exitoso'] = False
-            result['error'] = 'Scraping web deshabilitado'
-
-        if not enable_pdf_extraction:
-            result['extraccion_pdf_exitosa'] = False
-
-        return result
-
-    except Exception as e:
-        return {
-            'archivo_pdf': uploaded_file.name,
-            'error': f'Error procesando archivo: {str(e)}',
-            'scraping_exitoso': 'False',
-            'extraccion_pdf_exitosa': 'False',
-            'url_encontrada': 'False',
-            'url': 'No encontrada'
-        }
-
-def process_files(uploaded_files: List, enable_web_scraping: bool, enable_pdf_extraction: bool, max_workers: int = 4, timeout: int = 15):
+    stages = {STAGE_QR}
+    if enable_web_scraping:
+        stages.add(STAGE_WEB)
+    if enable_pdf_extraction:
+        stages.add(STAGE_PDF_TEXT)
+    return stages
+
+def is_cacheable(result: Dict, stages: set) -> bool:
     """
-    Procesa los archivos cargados usando procesamiento paralelo
+    Un resultado se reutiliza salvo que la consulta al SAT haya fallado con URL
+    encontrada (error de red transitorio que conviene reintentar)
     """
-    results = []
-
-    # Barra de progreso
+    if STAGE_WEB in stages and utils.is_success(result.get('url_encontrada')):
+        return utils.is_success(result.get('scraping_exitoso'))
+    return True
+
+# Intervalo mínimo entre refrescos de la vista en vivo (s)
+LIVE_REFRESH_INTERVAL = 0.5
+# Filas más recientes que muestra la tabla en vivo
+LIVE_TABLE_ROWS = 100
+# Consultas al SAT consecutivas fallidas que disparan la alerta de caída
+SAT_FAILURE_WINDOW = 10
+
+def render_live_view(metrics_placeholder, table_placeholder, alert_placeholder, live_rows: List[Dict],
+                     counts: Dict[str, int], total: int, processed: int, elapsed: float,
+                     recent_web: deque) -> None:
+    """
+    Actualiza las métricas en curso (archivos/s, ETA) y la tabla con los últimos resultados
+    """
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    remaining = total - counts['total']
+    eta = utils.format_eta(remaining / rate) if rate > 0 and remaining else '—'
+
+    with metrics_placeholder.container():
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric("📄 Completados", f"{counts['total']}/{total}")
+        col2.metric("✅ Scraping", counts['scraping'])
+        col3.metric("📄 PDF", counts['pdf'])
+        col4.metric("⚡ Archivos/s", f"{rate:.2f}")
+        col5.metric("⏳ ETA", eta)
+
+    if len(recent_web) == recent_web.maxlen and not any(recent_web):
+        alert_placeholder.warning(f"⚠️ Las últimas {recent_web.maxlen} consultas al SAT fallaron: "
+                                  "el servicio podría estar caído o bloqueando solicitudes")
+    else:
+        alert_placeholder.empty()
+
+    table_placeholder.dataframe(pd.DataFrame(live_rows[-LIVE_TABLE_ROWS:][::-1]), width='stretch')
+
+def process_files(uploaded_files: List, enable_web_scraping: bool, enable_pdf_extraction: bool, max_workers: int = 4, timeout: int = 15, io_workers: int = 8, enable_profiling: bool = False):
+    """
+    Procesa los archivos cargados con el ejecutor en dos etapas (CPU y red).
+    Los archivos ya procesados con las mismas opciones se toman del cache y los
+    resultados se muestran en vivo conforme se completan
+    """
+    # Barra de progreso y vista en vivo
     progress_bar = st.progress(0)
     status_text = st.empty()
+    metrics_placeholder = st.empty()
+    alert_placeholder = st.empty()
+    table_placeholder = st.empty()
 
-    # Limitar workers para Streamlit Cloud (recursos limitados)
+    # Limitar workers de CPU para Streamlit Cloud (recursos limitados)
     cloud_limit = 2  # Streamlit Cloud gratuito tiene 1 CPU
-    max_workers = min(max_workers, cloud_limit, len(uploaded_files))
-
-    # Preparar argumentos para procesamiento paralelo
-    file_args = [(file, enable_web_scraping, enable_pdf_extraction, timeout) for file in uploaded_files]
-
-    # Procesamiento paralelo
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Enviar todas las tareas
-        future_to_file = {
-            executor.submit(process_single_file, args): args[0].name
-            for args in file_args
-        }
-
-        completed_count = 0
-
-        # Procesar resultados a medida que se completan
-        for future in as_completed(future_to_file):
-            try:
-                result = future.result()
-                results.append(result)
-                completed_count += 1
-
-                # Actualizar progreso
-                progress = completed_count / len(uploaded_files)
-                progress_bar.progress(progress)
-                filename = future_to_file[future]
-                status_text.text(f"📄 Completado: {filename} ({completed_count}/{len(uploaded_files)})")
-
-            except Exception as e:
-                filename = future_to_file[future]
-                st.error(f"❌ Error procesando {filename}: {str(e)}")
-                completed_count += 1
-                progress = completed_count / len(uploaded_files)
-                progress_bar.progress(progress)
-  
-    # Guardar resultados en sesión
-    st.session_state.results = results
+    max_workers = min(max_workers, cloud_limit)
+
+    executor = get_executor(timeout)
+    executor.resize(max_workers, io_workers)
+    result_cache = get_result_cache()
+    stages = selected_stages(enable_web_scraping, enable_pdf_extraction)
+    total = len(uploaded_files)
+
+    # Resolver del cache lo ya procesado; el contenido repetido se procesa una vez
+    results: List[Optional[Dict]] = [None] * total
+    pending: Dict[tuple, List[int]] = {}
+    for i, file in enumerate(uploaded_files):
+        key = result_cache.make_key(utils.content_hash(file.getvalue()), stages, timeout)
+        cached = result_cache.get(key, file.name)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.setdefault(key, []).append(i)
+
+    # Estado incremental de la vista en vivo
+    live_rows = [utils.summary_row(result) for result in results if result is not None]
+    counts = utils.count_results([result for result in results if result is not None])
+    recent_web = deque(maxlen=SAT_FAILURE_WINDOW)
+    if counts['total']:
+        status_text.text(f"♻️ {counts['total']} archivo(s) recuperados del cache")
+        progress_bar.progress(counts['total'] / total)
+
+    # Los bytes se leen a medida que la etapa de CPU admite archivos
+    jobs = ((key, uploaded_files[indexes[0]].name, uploaded_files[indexes[0]].getvalue())
+            for key, indexes in pending.items())
+
+    profiler = profiling.BatchProfiler() if enable_profiling else nullcontext()
+    start = time.monotonic()
+    last_refresh = 0.0
+    processed = 0
+
+    # El ejecutor es compartido entre recargas: no se apaga al terminar el lote
+    with profiler:
+        for key, result in executor.map_keyed(jobs, stages):
+            if is_cacheable(result, stages):
+                result_cache.put(key, result)
+            for i in pending[key]:
+                results[i] = dict(result, archivo_pdf=uploaded_files[i].name)
+                live_rows.append(utils.summary_row(results[i]))
+                utils.add_to_counts(counts, results[i])
+                processed += 1
+            if STAGE_WEB in stages and utils.is_success(result.get('url_encontrada')):
+                recent_web.append(utils.is_success(result.get('scraping_exitoso')))
+
+            # Refrescar la UI como máximo cada LIVE_REFRESH_INTERVAL segundos
+            now = time.monotonic()
+            if now - last_refresh >= LIVE_REFRESH_INTERVAL or counts['total'] == total:
+                last_refresh = now
+                progress_bar.progress(counts['total'] / total)
+                status_text.text(f"📄 Completado: {result.get('archivo_pdf', '')} ({counts['total']}/{total})")
+                render_live_view(metrics_placeholder, table_placeholder, alert_placeholder, live_rows,
+                                 counts, total, processed, now - start, recent_web)
+
+    st.session_state.profile_zip = profiler.zip_bytes() if enable_profiling else None
+
+    # La tabla completa queda en 📊 Resultados
+    table_placeholder.empty()
+    alert_placeholder.empty()
+
+    # Guardar resultados en sesión (nueva versión: las vistas se reconstruyen una vez)
+    set_results(results)
+    # El Excel completo se empieza a generar ya, para que la descarga sea inmediata
+    start_excel_export(executor.scraper, EXCEL_SHEETS)
     
     # Mostrar resumen
     progress_bar.empty()
     status_text.empty()
     
     # Calcular estadísticas
-    total_files = len(results)
-    successful_scraping = len([r for r in results if r.get('scraping_exitoso')])
-    successful_pdf = len([r for r in results if r.get('extraccion_pdf_exitosa')])
+    counts = cached_view('counts', utils.count_results)
+    total_files = counts['total']
+    successful_scraping = counts['scraping']
+    successful_pdf = counts['pdf']
     
     # Mostrar mensaje de éxito
     st.success(f"""
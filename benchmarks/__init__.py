@@ -0,0 +1,3 @@
+"""
+Herramientas de benchmark del Scraper CSF SAT (corpus sintético, servidor SAT local y mediciones)
+"""
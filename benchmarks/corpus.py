@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Generador de un corpus sintético de CSF en PDF con códigos QR reales
+
+Cada PDF lleva un QR con la URL de validación (apuntando al servidor SAT local
+de benchmarks.sat_stub) y una capa de texto en el formato que espera
+SATScraper.extract_pdf_text_data. Los datos del contribuyente se derivan de
+forma determinista del token D3, así el servidor local responde con los mismos
+datos que contiene el PDF.
+
+Uso:
+    python -m benchmarks.corpus --out corpus/ --count 200
+"""
+
+import argparse
+import os
+import random
+import string
+from typing import Dict, List
+
+DEFAULT_BASE_URL = 'http://127.0.0.1:8765/app/qr/faces/pages/mobile/validadorqr.jsf'
+
+NOMBRES = ['SANTIAGO', 'MARIA JOSE', 'JUAN CARLOS', 'ANA SOFIA', 'LUIS', 'FERNANDA', 'JOSE ANGEL', 'VALERIA']
+APELLIDOS = ['AMADOR', 'OCHOA', 'HERNANDEZ', 'GARCIA', 'MARTINEZ', 'LOPEZ', 'GONZALEZ', 'RAMIREZ', 'NUÑEZ']
+MUNICIPIOS = ['SALTILLO', 'RAMOS ARIZPE', 'ARTEAGA', 'MONCLOVA', 'TORREON']
+VIALIDADES = ['INDEPENDENCIA', 'HIDALGO', 'JUAREZ', 'MORELOS', 'VENUSTIANO CARRANZA']
+MESES = ['ENERO', 'FEBRERO', 'MARZO', 'ABRIL', 'MAYO', 'JUNIO', 'JULIO', 'AGOSTO',
+         'SEPTIEMBRE', 'OCTUBRE', 'NOVIEMBRE', 'DICIEMBRE']
+
+
+def make_token(rng: random.Random) -> str:
+    """
+    Genera un token D3 válido: idCIF_RFC
+    """
+    id_cif = ''.join(rng.choice(string.digits) for _ in range(11))
+    rfc = (''.join(rng.choice(string.ascii_uppercase) for _ in range(4))
+           + ''.join(rng.choice(string.digits) for _ in range(6))
+           + ''.join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(3)))
+    return f"{id_cif}_{rfc}"
+
+
+def profile_for_token(token: str) -> Dict:
+    """
+    Datos del contribuyente derivados de forma determinista del token D3
+    """
+    id_cif, rfc = token.split('_', 1)
+    rng = random.Random(token)
+
+    nacimiento = (rng.randint(1, 28), rng.randint(1, 12), rng.randint(1950, 2002))
+    inicio = (rng.randint(1, 28), rng.randint(1, 12), rng.randint(2005, 2024))
+    sexo = rng.choice('HM')
+    curp = (rfc[:4] + rfc[4:10] + sexo
+            + ''.join(rng.choice(string.ascii_uppercase) for _ in range(5))
+            + rng.choice(string.ascii_uppercase + string.digits) + rng.choice(string.digits))
+
+    return {
+        'id_cif': id_cif,
+        'rfc': rfc,
+        'curp': curp,
+        'nombre': rng.choice(NOMBRES),
+        'primer_apellido': rng.choice(APELLIDOS),
+        'segundo_apellido': rng.choice(APELLIDOS),
+        'fecha_nacimiento': '%02d-%02d-%04d' % nacimiento,
+        'fecha_inicio': '%02d-%02d-%04d' % inicio,
+        'fecha_inicio_texto': f"{inicio[0]:02d} DE {MESES[inicio[1] - 1]} DE {inicio[2]}",
+        'situacion': rng.choice(['ACTIVO', 'ACTIVO', 'ACTIVO', 'SUSPENDIDO']),
+        'entidad': 'COAHUILA DE ZARAGOZA',
+        'municipio': rng.choice(MUNICIPIOS),
+        'localidad': 'SALTILLO',
+        'tipo_vialidad': 'CALLE',
+        'nombre_vialidad': rng.choice(VIALIDADES),
+        'numero_exterior': str(rng.randint(1, 2999)),
+        'numero_interior': str(rng.randint(1, 20)),
+        'cp': str(rng.randint(25000, 25999)),
+        'correo': f"{rfc.lower()}@example.com",
+        'al': 'COAHUILA 1',
+        'regimen': 'Régimen de Sueldos y Salarios e Ingresos Asimilados a Salarios',
+        'fecha_alta': '%02d-%02d-%04d' % inicio,
+    }
+
+
+def validation_url(token: str, base_url: str = DEFAULT_BASE_URL) -> str:
+    """
+    URL de validación tal como la codifica el QR de una CSF
+    """
+    return f"{base_url}?D1=10&D2=1&D3={token}"
+
+
+def pdf_text_lines(profile: Dict) -> List[str]:
+    """
+    Capa de texto en el formato que reconoce extract_pdf_text_data
+    """
+    return [
+        'CÉDULA DE IDENTIFICACIÓN FISCAL',
+        f"RFC: {profile['rfc']}",
+        f"CURP: {profile['curp']}",
+        f"idCIF: {profile['id_cif']}",
+        'Datos de Identificación del Contribuyente:',
+        f"Nombre (s): {profile['nombre']}",
+        f"Primer Apellido: {profile['primer_apellido']}",
+        f"Segundo Apellido: {profile['segundo_apellido']}",
+        f"Fecha inicio de operaciones: {profile['fecha_inicio_texto']}",
+        f"Estatus en el padrón: {profile['situacion']}",
+        f"Fecha de último cambio de estado: {profile['fecha_inicio_texto']}",
+        'Nombre Comercial:',
+        'Datos del domicilio registrado',
+        f"Código Postal: {profile['cp']}",
+        f"Tipo de Vialidad: {profile['tipo_vialidad']}",
+        f"Nombre de Vialidad: {profile['nombre_vialidad']}",
+        f"Número Exterior: {profile['numero_exterior']}",
+        f"Número Interior: {profile['numero_interior']}",
+        f"Nombre de la Localidad: {profile['localidad']}",
+        f"Nombre del Municipio o Demarcación Territorial: {profile['municipio']}",
+        f"Nombre de la Entidad Federativa: {profile['entidad']}",
+        'Entre Calle: ALLENDE',
+        'Y Calle: ABASOLO',
+        'Actividades Económicas:',
+        'Comercio al por menor en ferreterías y tlapalerías 100 01/01/2015',
+        'Regímenes:',
+        'Régimen de Sueldos y Salarios e Ingresos Asimilados a Salarios 01/01/2015',
+        f"SALTILLO , {profile['entidad']} A 14 DE JULIO DE 2025",
+        f"Cadena Original Sello: ||2025/07/14|{profile['rfc']}|CONSTANCIA DE SITUACIÓN FISCAL|{profile['id_cif']}||",
+        'Sello Digital: ' + ''.join(random.Random(profile['rfc']).choice(string.ascii_uppercase + string.digits) for _ in range(88)),
+    ]
+
+
+def qr_png(data: str, module_px: int = 6) -> bytes:
+    """
+    Codifica un QR real con cv2.QRCodeEncoder y lo retorna como PNG
+    """
+    import cv2
+    import numpy as np
+
+    encoder = cv2.QRCodeEncoder.create()
+    qr = encoder.encode(data)
+    qr = cv2.resize(qr, None, fx=module_px, fy=module_px, interpolation=cv2.INTER_NEAREST)
+    # Zona de silencio de 4 módulos
+    qr = np.pad(qr, 4 * module_px, constant_values=255)
+    ok, png = cv2.imencode('.png', qr)
+    if not ok:
+        raise RuntimeError('No se pudo codificar el QR sintético')
+    return png.tobytes()
+
+
+def generate_csf_pdf(token: str, base_url: str = DEFAULT_BASE_URL, with_qr: bool = True,
+                     with_link: bool = False) -> bytes:
+    """
+    Genera una CSF sintética de una página para el token D3 dado
+    """
+    import fitz
+
+    profile = profile_for_token(token)
+    url = validation_url(token, base_url)
+
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)  # Carta
+
+    if with_qr:
+        page.insert_image(fitz.Rect(40, 40, 160, 160), stream=qr_png(url))
+
+    y = 190
+    for line in pdf_text_lines(profile):
+        page.insert_text((40, y), line, fontsize=9)
+        y += 18
+
+    if with_link:
+        page.insert_link({'kind': fitz.LINK_URI, 'from': fitz.Rect(40, 40, 160, 160), 'uri': url})
+
+    pdf_bytes = doc.tobytes(deflate=True)
+    doc.close()
+    return pdf_bytes
+
+
+def generate_corpus(out_dir: str, count: int, base_url: str = DEFAULT_BASE_URL, seed: int = 0,
+                    duplicate_rate: float = 0.0, no_qr_rate: float = 0.0) -> List[str]:
+    """
+    Genera count PDFs en out_dir y retorna sus rutas.
+    duplicate_rate: fracción de archivos que repiten el token de uno anterior
+    no_qr_rate: fracción de archivos sin QR
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    tokens = []
+    paths = []
+    for i in range(count):
+        if tokens and rng.random() < duplicate_rate:
+            token = rng.choice(tokens)
+        else:
+            token = make_token(rng)
+            tokens.append(token)
+
+        pdf_bytes = generate_csf_pdf(token, base_url, with_qr=rng.random() >= no_qr_rate)
+        path = os.path.join(out_dir, f"csf_{i:05d}_{token.split('_')[1]}.pdf")
+        with open(path, 'wb') as f:
+            f.write(pdf_bytes)
+        paths.append(path)
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera un corpus sintético de CSF en PDF')
+    parser.add_argument('--out', required=True, help='Directorio de salida')
+    parser.add_argument('--count', type=int, default=100, help='Número de PDFs a generar')
+    parser.add_argument('--base-url', default=DEFAULT_BASE_URL, help='URL base de validación codificada en el QR')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help='Fracción de archivos con token repetido')
+    parser.add_argument('--no-qr-rate', type=float, default=0.0, help='Fracción de archivos sin QR')
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.out, args.count, args.base_url, args.seed, args.duplicate_rate, args.no_qr_rate)
+    print(f"📄 {len(paths)} PDFs generados en {args.out}")
+
+
+if __name__ == '__main__':
+    main()
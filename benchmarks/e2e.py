@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark de punta a punta: corpus sintético + SAT local + PipelinedExecutor
+
+Reporta archivos/s y latencias p50/p95/p99 por etapa para cada configuración de
+concurrencia (workers de CPU x workers de red).
+
+Uso:
+    python -m benchmarks.e2e --files 200 --latency 0.3 --concurrency 1x4 2x8 2x16
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.corpus import generate_csf_pdf, make_token
+from benchmarks.sat_stub import SATStubConfig, start_stub_server
+import qr_preprocessing
+from pipeline import PipelinedExecutor
+from sat_scraper_cloud import SATScraper
+from timing import collect_stage_timings, percentile
+
+
+class TimedScraper(SATScraper):
+    """
+    SATScraper que registra la duración de cada etapa del pipeline
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stage_times: Dict[str, List[float]] = {'cpu': [], 'io': []}
+        self._times_lock = threading.Lock()
+
+    def _record(self, stage: str, start: float) -> None:
+        with self._times_lock:
+            self.stage_times[stage].append(time.perf_counter() - start)
+
+    def run_cpu_stage(self, pdf_bytes, filename, stages=None):
+        start = time.perf_counter()
+        try:
+            return super().run_cpu_stage(pdf_bytes, filename, stages)
+        finally:
+            self._record('cpu', start)
+
+    def run_io_stage(self, result, url):
+        start = time.perf_counter()
+        try:
+            return super().run_io_stage(result, url)
+        finally:
+            self._record('io', start)
+
+
+def build_corpus(count: int, base_url: str, seed: int) -> List[Tuple[str, bytes]]:
+    """
+    Corpus en memoria de pares (nombre, bytes)
+    """
+    rng = random.Random(seed)
+    return [(f"csf_{i:05d}.pdf", generate_csf_pdf(make_token(rng), base_url)) for i in range(count)]
+
+
+def run_config(corpus: List[Tuple[str, bytes]], cpu_workers: int, io_workers: int, timeout: int) -> Dict:
+    """
+    Procesa el corpus completo con una configuración de concurrencia
+    """
+    scraper = TimedScraper()
+    scraper.request_timeout = timeout
+    scraper.collect_diagnostics = True
+    executor = PipelinedExecutor(scraper, cpu_workers=cpu_workers, io_workers=io_workers)
+
+    start = time.perf_counter()
+    results = list(executor.map(corpus))
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+
+    report = {
+        'cpu_workers': cpu_workers,
+        'io_workers': io_workers,
+        'files': len(results),
+        'elapsed_s': round(elapsed, 3),
+        'files_per_s': round(len(results) / elapsed, 2) if elapsed > 0 else 0.0,
+        'scraping_ok': sum(1 for r in results if r.get('scraping_exitoso') == 'True'),
+        'stages': {},
+    }
+    # Etapas completas (s → ms) seguidas del detalle del bloque de diagnóstico (ms)
+    stage_ms = {stage: [v * 1000 for v in values] for stage, values in scraper.stage_times.items()}
+    stage_ms.update(collect_stage_timings(results))
+    for stage, values in stage_ms.items():
+        report['stages'][stage] = {
+            'n': len(values),
+            'p50_ms': round(percentile(values, 50), 1),
+            'p95_ms': round(percentile(values, 95), 1),
+            'p99_ms': round(percentile(values, 99), 1),
+        }
+    return report
+
+
+def print_report(report: Dict) -> None:
+    print(f"\n⚙️  CPU x red = {report['cpu_workers']} x {report['io_workers']}: "
+          f"{report['files']} archivos en {report['elapsed_s']}s → {report['files_per_s']} archivos/s "
+          f"(scraping exitoso: {report['scraping_ok']})")
+    print(f"   {'etapa':<18}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in report['stages'].items():
+        print(f"   {stage:<18}{stats['n']:>6}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+def parse_concurrency(spec: str) -> Tuple[int, int]:
+    cpu, io = spec.lower().split('x')
+    return int(cpu), int(io)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de punta a punta contra el SAT local')
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--concurrency', nargs='+', default=['1x1', '2x4', '2x8', '2x16'],
+                        help='Configuraciones CPUxRED, p. ej. 2x8')
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--mojibake', action='store_true')
+    parser.add_argument('--https', action='store_true')
+    parser.add_argument('--legacy-tls', action='store_true')
+    parser.add_argument('--timeout', type=int, default=15)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Guardar los reportes en este archivo JSON')
+    args = parser.parse_args()
+
+    config = SATStubConfig(args.latency, args.jitter, args.error_rate, args.mojibake, args.seed)
+    server, base_url = start_stub_server(config=config, https=args.https, legacy_tls=args.legacy_tls)
+    print(f"🌐 SAT local en {base_url}")
+
+    corpus = build_corpus(args.files, base_url, args.seed)
+    print(f"📄 Corpus sintético: {len(corpus)} PDFs")
+
+    reports = []
+    try:
+        for spec in args.concurrency:
+            cpu_workers, io_workers = parse_concurrency(spec)
+            report = run_config(corpus, cpu_workers, io_workers, args.timeout)
+            print_report(report)
+            reports.append(report)
+    finally:
+        server.shutdown()
+
+    # Peldaños de la escalera QR que decodificaron (orden sugerido con estos datos)
+    ladder = qr_preprocessing.ladder_stats()
+    if ladder:
+        print(f"\n📱 Escalera QR: " + ', '.join(
+            f"{row['peldano']} {row['aciertos']}/{row['intentos']} ({row['ms_promedio']} ms)" for row in ladder))
+        print(f"   Orden sugerido: {','.join(qr_preprocessing.suggest_order(ladder))}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
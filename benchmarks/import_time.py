@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark de tiempo de importación (arranque en frío de la app, CLI y workers)
+
+Importa cada módulo en un intérprete nuevo con -X importtime, verifica que no
+cargue dependencias pesadas y que el tiempo acumulado quede dentro del presupuesto.
+Termina con código 1 si algún módulo se sale de sus límites.
+
+Uso:
+    python -m benchmarks.import_time
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencias que solo deben cargarse en la etapa que las usa
+HEAVY_MODULES = ['fitz', 'cv2', 'numpy', 'PIL', 'pandas', 'bs4', 'requests', 'urllib3', 'openpyxl']
+
+# módulo → (presupuesto en ms, dependencias pesadas prohibidas al importarlo).
+# Solo cv2 + numpy ya suman cientos de ms; los presupuestos dejan margen para la stdlib.
+TARGETS = {
+    'sat_scraper_cloud': (150, HEAVY_MODULES),
+    'pipeline': (150, HEAVY_MODULES),
+    'qr_decoders': (50, HEAVY_MODULES),
+    'qr_preprocessing': (50, HEAVY_MODULES),
+    'cli': (200, HEAVY_MODULES),
+    'work_queue': (150, HEAVY_MODULES),
+    'memory_governor': (50, HEAVY_MODULES),
+    # utils y la app necesitan pandas y streamlit, pero no las dependencias del scraper
+    'utils': (None, ['fitz', 'cv2', 'bs4', 'openpyxl']),
+}
+
+# Módulos que pueden omitirse si falta alguna de estas dependencias (p. ej. fuera de la
+# app Streamlit); cualquier otro error de importación cuenta como falla
+OPTIONAL_DEPENDENCIES = {
+    'utils': ('streamlit', 'pandas'),
+}
+
+_PROBE = (
+    "import {module}\n"
+    "import json, sys\n"
+    "print(json.dumps(sorted({{m.split('.')[0] for m in sys.modules}})))\n"
+)
+
+
+def measure_import(module: str) -> Dict:
+    """
+    Importa el módulo en un intérprete nuevo; retorna ms acumulados y módulos cargados
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'error'}
+
+    cumulative_us: Optional[int] = None
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative_us = int(parts[1].strip())
+
+    return {
+        'ms': (cumulative_us or 0) / 1000,
+        'loaded': set(json.loads(proc.stdout.strip().splitlines()[-1])),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Tiempo de importación y dependencias cargadas')
+    parser.add_argument('--repeat', type=int, default=5, help='Importaciones por módulo (se toma la mínima)')
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    print(f"{'módulo':<20}{'ms':>10}{'presupuesto':>14}  pesadas cargadas")
+    for module, (budget_ms, forbidden) in TARGETS.items():
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        errors = [run['error'] for run in runs if 'error' in run]
+        if errors:
+            missing = [name for name in OPTIONAL_DEPENDENCIES.get(module, ())
+                       if errors[0] == f"ModuleNotFoundError: No module named '{name}'"]
+            if missing:
+                print(f"{module:<20}{'—':>10}{'—':>14}  ⚠️ omitido: falta {missing[0]}")
+            else:
+                print(f"{module:<20}{'—':>10}{'—':>14}  ❌ no se pudo importar: {errors[0]}")
+                failures.append(f"{module} no se pudo importar: {errors[0]}")
+            continue
+
+        best = min(run['ms'] for run in runs)
+        heavy = sorted(runs[0]['loaded'] & set(forbidden))
+        over = budget_ms is not None and best > budget_ms
+        budget = f"{budget_ms} ms" if budget_ms is not None else '—'
+        flag = ' ❌' if heavy or over else ''
+        print(f"{module:<20}{best:>10.1f}{budget:>14}  {', '.join(heavy) or '—'}{flag}")
+
+        if heavy:
+            failures.append(f"{module} carga {', '.join(heavy)} al importarse")
+        if over:
+            failures.append(f"{module} tarda {best:.1f} ms (presupuesto {budget_ms} ms)")
+
+    if failures:
+        print('\n❌ ' + '\n❌ '.join(failures))
+        return 1
+
+    print('\n✅ Importaciones dentro de presupuesto')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
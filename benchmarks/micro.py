@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks de las funciones críticas con umbrales de regresión
+
+Corre cada función sobre entradas fijas (generadas de forma determinista con
+benchmarks.corpus y benchmarks.sat_stub), compara contra la línea base guardada
+y termina con código 1 si alguna función empeoró más allá de su umbral (2 si no
+hay línea base). La línea base depende de la máquina y no se versiona: se genera
+con --save en la máquina donde se compara y se vuelve a generar tras cambiar de
+hardware o de versión de Python.
+
+Uso:
+    python -m benchmarks.micro --save          # registrar/actualizar la línea base
+    python -m benchmarks.micro                 # comparar contra la línea base
+    python -m benchmarks.micro --filter parse  # solo funciones que contengan "parse"
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.corpus import generate_csf_pdf, profile_for_token
+from benchmarks.sat_stub import render_sat_page, to_mojibake
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# Tolerancia por defecto: 25% más lento que la línea base es regresión.
+# Se puede sobrescribir por función en la sección "thresholds" del archivo de líneas base.
+DEFAULT_THRESHOLD = 0.25
+
+FIXTURE_TOKEN = '19010141463_AAOS921231UR1'
+FIXTURE_RESULTS = 500
+
+
+def build_fixtures() -> Dict:
+    """
+    Entradas fijas para todas las funciones medidas
+    """
+    from sat_scraper_cloud import SATScraper
+
+    scraper = SATScraper()
+    pdf_qr = generate_csf_pdf(FIXTURE_TOKEN)
+    pdf_sin_qr = generate_csf_pdf(FIXTURE_TOKEN, with_qr=False)
+    html = render_sat_page(profile_for_token(FIXTURE_TOKEN))
+    html_mojibake = to_mojibake(html)
+
+    # Resultado completo representativo, replicado para los builders de tablas y Excel
+    result = {'archivo_pdf': 'fixture.pdf', 'url': f'https://siat.sat.gob.mx/?D3={FIXTURE_TOKEN}',
+              'url_encontrada': 'True', 'scraping_exitoso': 'True', 'extraccion_pdf_exitosa': 'True'}
+    result.update(scraper.extract_pdf_text_data(pdf_qr, 'fixture.pdf'))
+    result.update(scraper.parse_sat_content(html))
+    results = [dict(result, archivo_pdf=f'fixture_{i:04d}.pdf') for i in range(FIXTURE_RESULTS)]
+
+    return {
+        'scraper': scraper,
+        'pdf_qr': pdf_qr,
+        'pdf_sin_qr': pdf_sin_qr,
+        'html': html,
+        'html_mojibake': html_mojibake,
+        'results': results,
+    }
+
+
+def build_benchmarks(fx: Dict) -> List[Tuple[str, Callable[[], object]]]:
+    """
+    Lista de (nombre, función sin argumentos) a medir
+    """
+    import utils
+
+    scraper = fx['scraper']
+    return [
+        ('extract_qr_from_pdf', lambda: scraper.extract_qr_from_pdf(fx['pdf_qr'], 'fixture.pdf')),
+        ('extract_qr_comprehensive', lambda: scraper.extract_qr_comprehensive(fx['pdf_qr'], 'fixture.pdf')),
+        ('extract_qr_comprehensive[sin_qr]', lambda: scraper.extract_qr_comprehensive(fx['pdf_sin_qr'], 'fixture.pdf')),
+        ('extract_pdf_text_data', lambda: scraper.extract_pdf_text_data(fx['pdf_qr'], 'fixture.pdf')),
+        ('parse_sat_content', lambda: scraper.parse_sat_content(fx['html'])),
+        ('parse_sat_content[mojibake]', lambda: scraper.parse_sat_content(fx['html_mojibake'])),
+        ('decode_special_characters', lambda: scraper.decode_special_characters(fx['html_mojibake'])),
+        ('export_to_excel', lambda: scraper.export_to_excel(fx['results'])),
+        ('utils.create_summary_dataframe', lambda: utils.create_summary_dataframe(fx['results'])),
+        ('utils.create_detailed_dataframe', lambda: utils.create_detailed_dataframe(fx['results'])),
+        ('utils.create_pdf_dataframe', lambda: utils.create_pdf_dataframe(fx['results'])),
+        ('utils.create_stats_dataframe', lambda: utils.create_stats_dataframe(fx['results'])),
+    ]
+
+
+def measure(func: Callable[[], object], repeat: int, min_time: float) -> float:
+    """
+    Segundos por llamada: mínimo de `repeat` rondas, cada una de al menos `min_time` segundos
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def load_baselines(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {'thresholds': {}, 'results': {}}
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    data.setdefault('thresholds', {})
+    data.setdefault('results', {})
+    return data
+
+
+def save_baselines(path: str, data: Dict) -> None:
+    data['machine'] = f"{platform.system()} {platform.machine()} / Python {platform.python_version()}"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, sort_keys=True)
+        f.write('\n')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Microbenchmarks con umbrales de regresión')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Archivo JSON de líneas base')
+    parser.add_argument('--save', action='store_true', help='Guardar los tiempos medidos como nueva línea base')
+    parser.add_argument('--filter', default='', help='Medir solo funciones cuyo nombre contenga este texto')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help=f'Tolerancia global (fracción, por defecto {DEFAULT_THRESHOLD})')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='Duración mínima de cada ronda (s)')
+    args = parser.parse_args()
+
+    if not args.save and not os.path.exists(args.baseline):
+        # Sin línea base no hay contra qué comparar: no reportar "sin regresiones"
+        print(f"❌ No existe la línea base {args.baseline}; generarla en esta máquina con "
+              f"python -m benchmarks.micro --save")
+        return 2
+
+    baselines = load_baselines(args.baseline)
+    fixtures = build_fixtures()
+    benchmarks = [(name, func) for name, func in build_benchmarks(fixtures) if args.filter in name]
+
+    regressions = []
+    print(f"{'función':<36}{'actual':>12}{'base':>12}{'cambio':>10}")
+    for name, func in benchmarks:
+        current = measure(func, args.repeat, args.min_time)
+        base = baselines['results'].get(name)
+        threshold = args.threshold if args.threshold is not None else baselines['thresholds'].get(name, DEFAULT_THRESHOLD)
+
+        if base:
+            change = current / base - 1
+            flag = ' ❌' if change > threshold else ''
+            print(f"{name:<36}{current * 1000:>10.3f}ms{base * 1000:>10.3f}ms{change:>+9.1%}{flag}")
+            if change > threshold:
+                regressions.append((name, change, threshold))
+        else:
+            print(f"{name:<36}{current * 1000:>10.3f}ms{'—':>12}{'nuevo':>10}")
+
+        if args.save:
+            baselines['results'][name] = current
+
+    if args.save:
+        save_baselines(args.baseline, baselines)
+        print(f"\n💾 Línea base guardada en {args.baseline}")
+        return 0
+
+    if regressions:
+        print('\n❌ Regresiones:')
+        for name, change, threshold in regressions:
+            print(f"   {name}: {change:+.1%} (umbral {threshold:.0%})")
+        return 1
+
+    print('\n✅ Sin regresiones')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
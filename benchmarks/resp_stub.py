@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Servidor local en memoria con protocolo Redis (RESP2) para probar la cola distribuida
+
+Implementa solo los comandos que usan work_queue.RedisQueue y RedisBlobStore.
+No persiste nada: sirve para pruebas y benchmarks en una sola máquina.
+
+Uso:
+    python -m benchmarks.resp_stub --port 6399
+    python cli.py coordinate pdfs/ --queue redis://127.0.0.1:6399/0
+    python cli.py worker --queue redis://127.0.0.1:6399/0
+"""
+
+import argparse
+import bisect
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class Store:
+    """
+    Datos del servidor: cadenas, listas, hashes y conjuntos ordenados
+    """
+
+    def __init__(self):
+        self.data: Dict[bytes, object] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.lock = threading.Lock()
+
+    def _get(self, key: bytes, kind: type, create: bool = False):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and time.time() >= expires_at:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        value = self.data.get(key)
+        if value is None and create:
+            value = self.data[key] = kind()
+        if value is not None and not isinstance(value, kind):
+            raise TypeError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def execute(self, args: List[bytes]):
+        name = args[0].upper().decode()
+        handler = getattr(self, f'cmd_{name.lower()}', None)
+        if handler is None:
+            raise ValueError(f"ERR unknown command '{name}'")
+        with self.lock:
+            return handler(*args[1:])
+
+    def cmd_ping(self, *args):
+        return 'PONG'
+
+    def cmd_select(self, db):
+        return 'OK'
+
+    def cmd_flushall(self):
+        self.data.clear()
+        self.expires.clear()
+        return 'OK'
+
+    def cmd_set(self, key, value, *options):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if len(options) >= 2 and options[0].upper() == b'EX':
+            self.expires[key] = time.time() + int(options[1])
+        return 'OK'
+
+    def cmd_get(self, key):
+        return self._get(key, bytes)
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            removed += self.data.pop(key, None) is not None
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_incr(self, key):
+        value = int(self._get(key, bytes) or b'0') + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    def cmd_lpush(self, key, *values):
+        items = self._get(key, list, create=True)
+        for value in values:
+            items.insert(0, value)
+        return len(items)
+
+    def cmd_rpush(self, key, *values):
+        items = self._get(key, list, create=True)
+        items.extend(values)
+        return len(items)
+
+    def _pop(self, key, index: int):
+        items = self._get(key, list)
+        if not items:
+            return None
+        value = items.pop(index)
+        if not items:
+            del self.data[key]
+        return value
+
+    def cmd_lpop(self, key):
+        return self._pop(key, 0)
+
+    def cmd_rpop(self, key):
+        return self._pop(key, -1)
+
+    def cmd_rpoplpush(self, source, destination):
+        value = self._pop(source, -1)
+        if value is not None:
+            self._get(destination, list, create=True).insert(0, value)
+        return value
+
+    def cmd_lrange(self, key, start, stop):
+        items = self._get(key, list) or []
+        start, stop = int(start), int(stop)
+        return items[start:len(items) if stop == -1 else stop + 1]
+
+    def cmd_lrem(self, key, count, value):
+        items = self._get(key, list) or []
+        limit = int(count) or len(items)  # solo count 0 o positivo
+        removed = 0
+        while removed < limit and value in items:
+            items.remove(value)
+            removed += 1
+        if not items:
+            self.data.pop(key, None)
+        return removed
+
+    def cmd_llen(self, key):
+        return len(self._get(key, list) or [])
+
+    def cmd_hset(self, key, *pairs):
+        fields = self._get(key, dict, create=True)
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += pairs[i] not in fields
+            fields[pairs[i]] = pairs[i + 1]
+        return added
+
+    def cmd_hget(self, key, field):
+        return (self._get(key, dict) or {}).get(field)
+
+    def cmd_hgetall(self, key):
+        result = []
+        for field, value in (self._get(key, dict) or {}).items():
+            result.extend([field, value])
+        return result
+
+    def cmd_hincrby(self, key, field, amount):
+        fields = self._get(key, dict, create=True)
+        value = int(fields.get(field, b'0')) + int(amount)
+        fields[field] = str(value).encode()
+        return value
+
+    # Conjunto ordenado: miembro → puntaje (se ordena al consultar)
+    def _zset(self, key, create: bool = False) -> Optional[dict]:
+        return self._get(key, dict, create=create)
+
+    def cmd_zadd(self, key, *pairs):
+        only_new = bool(pairs) and pairs[0].upper() == b'NX'
+        if only_new:
+            pairs = pairs[1:]
+        zset = self._zset(key, create=True)
+        added = 0
+        for i in range(0, len(pairs), 2):
+            member = pairs[i + 1]
+            if only_new and member in zset:
+                continue
+            added += member not in zset
+            zset[member] = float(pairs[i])
+        return added
+
+    def cmd_zscore(self, key, member):
+        score = (self._zset(key) or {}).get(member)
+        return None if score is None else repr(score).encode()
+
+    def cmd_zrem(self, key, *members):
+        zset = self._zset(key) or {}
+        return sum(zset.pop(member, None) is not None for member in members)
+
+    def cmd_zrangebyscore(self, key, low, high):
+        def bound(value: bytes) -> float:
+            return float(value.lstrip(b'+'))  # float() acepta "inf" y "-inf"
+
+        low, high = bound(low), bound(high)
+        items = sorted(((score, member) for member, score in (self._zset(key) or {}).items()))
+        start = bisect.bisect_left(items, (low, b''))
+        return [member for score, member in items[start:] if score <= high]
+
+
+def encode(value) -> bytes:
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, Exception):
+        return f'-{value}\r\n'.encode()
+    if isinstance(value, str):
+        return f'+{value}\r\n'.encode()
+    if isinstance(value, int):
+        return f':{value}\r\n'.encode()
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    if isinstance(value, list):
+        return b'*%d\r\n' % len(value) + b''.join(encode(item) for item in value)
+    raise TypeError(type(value))
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if not line.startswith(b'*'):
+                continue
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            try:
+                reply = self.server.store.execute(args)
+            except Exception as e:
+                reply = e
+            self.wfile.write(encode(reply))
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, RespHandler)
+        self.store = Store()
+
+
+def start(host: str = '127.0.0.1', port: int = 0) -> RespServer:
+    """
+    Inicia el servidor en un hilo daemon (port=0 elige uno libre: server.server_address)
+    """
+    server = RespServer((host, port))
+    threading.Thread(target=server.serve_forever, name='resp-stub', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local con protocolo Redis para la cola distribuida')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6399)
+    args = parser.parse_args()
+
+    server = RespServer((args.host, args.port))
+    print(f"Servidor RESP en {args.host}:{args.port} (Ctrl+C para detener)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita la página de validación QR del SAT (siat.sat.gob.mx)
+
+Sirve páginas con la misma estructura de texto que parse_sat_content espera, con
+latencia, tasa de error, TLS heredado (DH de 1024 bits, SECLEVEL=0) y mojibake
+configurables. Los datos se derivan del token D3 (ver benchmarks.corpus).
+
+Uso:
+    python -m benchmarks.sat_stub --port 8765 --latency 0.3 --jitter 0.1 --error-rate 0.02
+    python -m benchmarks.sat_stub --https --legacy-tls --mojibake
+"""
+
+import argparse
+import os
+import random
+import re
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.corpus import profile_for_token
+
+VALIDATION_PATH = '/app/qr/faces/pages/mobile/validadorqr.jsf'
+TOKEN_PATTERN = re.compile(r'^\d+_[A-Z0-9]+$')
+
+
+def render_sat_page(profile: Dict) -> str:
+    """
+    Página HTML con la estructura de la validación QR del SAT
+    """
+    def row(label: str, value: str) -> str:
+        # Sin espacios entre etiquetas: get_text() produce "Etiqueta:valor" como en el SAT
+        return f'<tr><td><span style="font-weight: bold;">{label}:</span></td><td>{value}</td></tr>'
+
+    identificacion = ''.join([
+        row('CURP', profile['curp']),
+        row('Nombre', profile['nombre']),
+        row('Apellido Paterno', profile['primer_apellido']),
+        row('Apellido Materno', profile['segundo_apellido']),
+        row('Fecha Nacimiento', profile['fecha_nacimiento']),
+        row('Fecha de Inicio de operaciones', profile['fecha_inicio']),
+        row('Situación del contribuyente', profile['situacion']),
+        row('Fecha del último cambio de situación', profile['fecha_inicio']),
+    ])
+    ubicacion = ''.join([
+        row('Entidad Federativa', profile['entidad']),
+        row('Municipio o delegación', profile['municipio']),
+        row('Localidad', profile['localidad']),
+        row('Tipo de vialidad', profile['tipo_vialidad']),
+        row('Nombre de la vialidad', profile['nombre_vialidad']),
+        row('Número exterior', profile['numero_exterior']),
+        row('Número interior', profile['numero_interior']),
+        row('CP', profile['cp']),
+        row('Correo electrónico', profile['correo']),
+        row('AL', profile['al']),
+    ])
+    caracteristicas = ''.join([
+        row('Régimen', profile['regimen']),
+        row('Fecha de alta', profile['fecha_alta']),
+    ])
+
+    return (
+        '<!DOCTYPE html><html><head><meta charset="UTF-8"><title>Validación QR</title></head><body>'
+        f'<div><ul><li>El RFC: {profile["rfc"]}, tiene asociada la siguiente información.</li></ul></div>'
+        f'<table role="grid"><thead><tr><th>Datos de Identificación</th></tr></thead><tbody>{identificacion}</tbody></table>'
+        f'<table role="grid"><thead><tr><th>Datos de Ubicación</th></tr></thead><tbody>{ubicacion}</tbody></table>'
+        f'<table role="grid"><thead><tr><th>Características fiscales</th></tr></thead><tbody>{caracteristicas}</tbody></table>'
+        '</body></html>'
+    )
+
+
+def render_not_found_page() -> str:
+    """
+    Página que el SAT devuelve para tokens inexistentes
+    """
+    return ('<!DOCTYPE html><html><head><meta charset="UTF-8"></head><body>'
+            '<div>La clave no es válida o no existe información asociada.</div></body></html>')
+
+
+def to_mojibake(text: str) -> str:
+    """
+    Simula el doble codificado UTF-8 → Latin-1 que a veces devuelve el SAT (á → Ã¡)
+    """
+    return text.encode('utf-8').decode('latin-1')
+
+
+class SATStubConfig:
+    """
+    Comportamiento configurable del servidor local
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 mojibake: bool = False, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.mojibake = mojibake
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests_served = 0
+
+    def next_delay_and_error(self) -> Tuple[float, bool]:
+        with self.lock:
+            self.requests_served += 1
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            return delay, self.rng.random() < self.error_rate
+
+
+class SATStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # Silencioso: el benchmark no debe medir la escritura de logs
+        pass
+
+    def do_GET(self):
+        config: SATStubConfig = self.server.config  # type: ignore
+        parsed = urlparse(self.path)
+
+        if parsed.path == '/health':
+            self._send(200, 'ok', 'text/plain')
+            return
+
+        if parsed.path != VALIDATION_PATH:
+            self._send(404, 'Not Found', 'text/plain')
+            return
+
+        delay, fail = config.next_delay_and_error()
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            self._send(500, '<html><body>Error interno del servidor</body></html>', 'text/html')
+            return
+
+        token = parse_qs(parsed.query).get('D3', [''])[0]
+        if TOKEN_PATTERN.match(token):
+            body = render_sat_page(profile_for_token(token))
+        else:
+            body = render_not_found_page()
+
+        if config.mojibake:
+            body = to_mojibake(body)
+
+        self._send(200, body, 'text/html; charset=UTF-8')
+
+    def _send(self, status: int, body: str, content_type: str):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _openssl(*args: str) -> None:
+    subprocess.run(['openssl', *args], check=True, capture_output=True)
+
+
+def build_ssl_context(legacy: bool, workdir: Optional[str] = None) -> ssl.SSLContext:
+    """
+    Crea un contexto TLS con certificado autofirmado (requiere el binario openssl).
+    Con legacy=True solo acepta TLS 1.2 con DHE de 1024 bits, como el SAT
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='sat_stub_')
+    cert = os.path.join(workdir, 'cert.pem')
+    key = os.path.join(workdir, 'key.pem')
+    if not os.path.exists(cert):
+        _openssl('req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '2',
+                 '-subj', '/CN=localhost', '-keyout', key, '-out', cert)
+
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+
+    if legacy:
+        dh = os.path.join(workdir, 'dh1024.pem')
+        if not os.path.exists(dh):
+            _openssl('dhparam', '-out', dh, '1024')
+        ctx.maximum_version = ssl.TLSVersion.TLSv1_2
+        ctx.set_ciphers('DHE-RSA-AES128-GCM-SHA256:DHE-RSA-AES256-SHA:@SECLEVEL=0')
+        ctx.load_dh_params(dh)
+
+    return ctx
+
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0, config: Optional[SATStubConfig] = None,
+                      https: bool = False, legacy_tls: bool = False) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Inicia el servidor en un hilo daemon y retorna (servidor, URL base de validación)
+    """
+    server = ThreadingHTTPServer((host, port), SATStubHandler)
+    server.daemon_threads = True
+    server.config = config or SATStubConfig()  # type: ignore
+
+    scheme = 'http'
+    if https or legacy_tls:
+        server.socket = build_ssl_context(legacy_tls).wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+
+    threading.Thread(target=server.serve_forever, name='sat-stub', daemon=True).start()
+
+    bound_host, bound_port = server.server_address[:2]
+    return server, f"{scheme}://{bound_host}:{bound_port}{VALIDATION_PATH}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local que imita la validación QR del SAT')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Latencia media por respuesta (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Variación uniforme de la latencia (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de respuestas HTTP 500')
+    parser.add_argument('--mojibake', action='store_true', help='Responder con UTF-8 doblemente codificado')
+    parser.add_argument('--https', action='store_true', help='Servir por HTTPS con certificado autofirmado')
+    parser.add_argument('--legacy-tls', action='store_true', help='TLS 1.2 con DHE de 1024 bits (implica --https)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    config = SATStubConfig(args.latency, args.jitter, args.error_rate, args.mojibake, args.seed)
+    server, base_url = start_stub_server(args.host, args.port, config, args.https, args.legacy_tls)
+    print(f"🌐 SAT local escuchando en {base_url}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
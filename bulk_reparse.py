@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Reparseo masivo en paralelo de lo archivado: páginas del SAT y capas de texto de PDF
+
+Vuelve a ejecutar parse_sat_content y parse_pdf_text sobre el contenido guardado
+por SATArchive, sin red y sin abrir PDFs. El trabajo se reparte en bloques entre
+procesos (el parseo es CPU puro y el GIL impediría escalar con hilos); cada
+proceso lee los objetos del archivo por su cuenta, así que entre procesos solo
+viajan direcciones y resultados. Con una versión anterior de los resultados se
+marca qué registros son nuevos o cambiaron.
+"""
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from pipeline import error_result
+from reverify import WEB_FIELD_PREFIX, diff_record, read_records, record_key
+from sat_archive import SATArchive
+from sat_scraper_cloud import SATScraper
+
+# Campos que produce el reparseo (los que se comparan con la versión anterior)
+PDF_FIELD_PREFIX = 'pdf_'
+DIFF_PREFIXES = (WEB_FIELD_PREFIX, PDF_FIELD_PREFIX)
+# Fuentes que reparsea cada trabajo (campo 'reparseo') y los campos que producen
+SOURCE_PREFIXES = {'web': WEB_FIELD_PREFIX, 'pdf': PDF_FIELD_PREFIX}
+# Nombre de archivo de las capturas sin texto de PDF archivado
+UNKNOWN_PDF = 'archivo'
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def build_jobs(archive: SATArchive, latest_only: bool = True, token: Optional[str] = None) -> List[Dict]:
+    """
+    Un trabajo por texto de PDF (unido a la página más reciente de su token) y
+    uno por cada captura del SAT que no tenga PDF
+    """
+    captures = list(archive.captures(latest_only=latest_only, token=token))
+    latest = {capture.token: capture for capture in captures}  # vienen en orden de hora
+    jobs = []
+    paired = set()
+    for text in archive.pdf_texts():
+        if token and text.token != token.upper():
+            continue
+        capture = latest.get(text.token)
+        if capture is not None:
+            paired.add(capture)
+        jobs.append({
+            'archivo_pdf': text.filename,
+            'url': text.url,
+            'html': capture.digest if capture is not None else None,
+            'fetched_at': capture.fetched_at if capture is not None else text.saved_at,
+            'pdf_text': text.digest,
+        })
+    for capture in captures:
+        if capture not in paired:
+            jobs.append({'archivo_pdf': UNKNOWN_PDF, 'url': capture.url, 'html': capture.digest,
+                         'fetched_at': capture.fetched_at, 'pdf_text': None})
+    return jobs
+
+
+def reparse_job(scraper: SATScraper, archive: SATArchive, job: Dict) -> Dict:
+    """
+    Resultado con la misma forma que process a partir del contenido archivado, más
+    'reparseo': las fuentes que se volvieron a parsear (web, pdf)
+    """
+    sources = []
+    if job['html']:
+        sources.append('web')
+        result = scraper.reparse_html(job['url'], archive.get(job['html']), job['fetched_at'])
+    else:
+        result = {'url': job['url'] or 'No encontrada', 'scraping_exitoso': 'False',
+                  'error': 'No hay página del SAT archivada'}
+    result['archivo_pdf'] = job['archivo_pdf']
+
+    if job['pdf_text']:
+        sources.append('pdf')
+        pdf_data = scraper.parse_pdf_text(archive.get(job['pdf_text'], 'txt'))
+        result.update(pdf_data)
+        result['extraccion_pdf_exitosa'] = 'True' if pdf_data else 'False'
+        result['url_encontrada'] = 'True' if job['url'] else 'False'
+    result['reparseo'] = ','.join(sources)
+    return result
+
+
+# Scraper y archivo de cada proceso del pool (ver _init_worker)
+_worker = None
+
+
+def _init_worker(archive_root: str) -> None:
+    global _worker
+    _worker = (SATScraper(), SATArchive(archive_root))
+
+
+def _reparse_chunk(jobs: List[Dict]) -> List[Dict]:
+    scraper, archive = _worker
+    results = []
+    for job in jobs:
+        try:
+            results.append(reparse_job(scraper, archive, job))
+        except Exception as e:
+            results.append(error_result(job['archivo_pdf'], str(e)))
+    return results
+
+
+class BulkReparser:
+    """
+    Reparsea trabajos de build_jobs en bloques de chunk_size con workers procesos
+    (1 = en este proceso). Solo mantiene en vuelo 2 × workers bloques
+    """
+
+    def __init__(self, archive_root: str, workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.archive_root = archive_root
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.chunk_size = max(1, chunk_size)
+
+    def _chunks(self, jobs: List[Dict]) -> Iterator[List[Dict]]:
+        for start in range(0, len(jobs), self.chunk_size):
+            yield jobs[start:start + self.chunk_size]
+
+    def run(self, jobs: List[Dict]) -> Iterator[Dict]:
+        """
+        Entrega los resultados conforme termina cada bloque (sin orden garantizado)
+        """
+        if self.workers == 1:
+            _init_worker(self.archive_root)
+            for chunk in self._chunks(jobs):
+                yield from _reparse_chunk(chunk)
+            return
+
+        pending = set()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.archive_root,)) as pool:
+            for chunk in self._chunks(jobs):
+                pending.add(pool.submit(_reparse_chunk, chunk))
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
+
+def diff_key(record: Dict) -> str:
+    """
+    Identidad de un registro entre versiones: token D3 y nombre del PDF (un
+    contribuyente puede tener varias CSF; sin URL solo cuenta el nombre)
+    """
+    url = record.get('url', '')
+    token = record_key(record)
+    return f"{token if token != url else ''}|{record.get('archivo_pdf', '')}"
+
+
+def token_key(record: Dict) -> Optional[str]:
+    """
+    Identidad solo por token D3, para registros cuyo PDF no se conoce (capturas sin
+    texto de PDF); None si la URL no trae token
+    """
+    url = record.get('url', '')
+    token = record_key(record)
+    return f"{token}|*" if token and token != url else None
+
+
+def load_previous(paths: Iterable[str]) -> Dict[str, Dict]:
+    """
+    Versión anterior de los resultados por diff_key y por token_key (JSONL o CSV de process/reparse)
+    """
+    previous = {}
+    for path in paths:
+        for record in read_records(path):
+            previous[diff_key(record)] = record
+            key = token_key(record)
+            if key:
+                previous[key] = record
+    return previous
+
+
+def annotate_changes(results: Iterable[Dict], previous: Dict[str, Dict]) -> Iterator[Dict]:
+    """
+    Agrega 'cambio' (nuevo / cambiado / sin_cambios) y, si cambió, los campos y
+    valores anteriores. Solo se comparan los campos de las fuentes reparseadas; sin
+    PDF el registro anterior se busca por token
+    """
+    for result in results:
+        sources = [source for source in result.get('reparseo', 'web,pdf').split(',') if source]
+        before = previous.get(diff_key(result))
+        if before is None and 'pdf' not in sources:
+            key = token_key(result)
+            before = previous.get(key) if key else None
+        if before is None:
+            result['cambio'] = 'nuevo'
+        else:
+            prefixes = tuple(SOURCE_PREFIXES[source] for source in sources) or DIFF_PREFIXES
+            changes = diff_record(before, result, prefixes)
+            if changes:
+                result['cambio'] = 'cambiado'
+                result['campos_cambiados'] = ', '.join(changes)
+                result['valores_anteriores'] = {field: old for field, (old, _) in changes.items()}
+            else:
+                result['cambio'] = 'sin_cambios'
+        yield result
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Interfaz de línea de comandos del Scraper CSF SAT (modo por lotes)
+
+Uso:
+    python cli.py process pdfs/ --excel resultados.xlsx --jsonl resultados.jsonl
+    python cli.py process pdfs/ --io-workers 16 --metrics-port 9108
+    python cli.py process pdfs/ --profile perfil.zip
+    python cli.py process pdfs/ --cache-db sat_cache.sqlite --max-age-days 7
+    python cli.py reverify resultados.jsonl --rate 5 --changes cambios.jsonl --state estado.jsonl
+    python cli.py reparse archivo_sat/ --jsonl reparseado.jsonl --previous resultados.jsonl --changed-only
+    python cli.py coordinate pdfs/ --queue redis://cola:6379/0 --jsonl resultados.jsonl
+    python cli.py worker --queue redis://cola:6379/0 --threads 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from typing import Iterator, List, Tuple
+
+import memory_governor
+import metrics
+import profiling
+from bulk_reparse import DEFAULT_CHUNK_SIZE, BulkReparser, annotate_changes, build_jobs, load_previous
+from pipeline import PipelinedExecutor
+from reverify import Reverifier, load_records, schedule
+from sat_archive import SATArchive
+from sat_scraper_cloud import ALL_STAGES, SATScraper, normalize_stages
+from scrape_cache import DEFAULT_NEGATIVE_TTL, FreshnessPolicy
+from sinks import open_sinks
+from work_queue import (DEFAULT_MAX_ATTEMPTS, DEFAULT_VISIBILITY_TIMEOUT, QueueWorker, collect_results, open_queue,
+                        submit_batch)
+
+
+def find_pdfs(paths: List[str]) -> List[str]:
+    """
+    Expande archivos y directorios (recursivo) a la lista de PDFs a procesar
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                found.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith('.pdf'))
+        else:
+            found.append(path)
+    return found
+
+
+def read_jobs(pdf_paths: List[str]) -> Iterator[Tuple[str, bytes]]:
+    """
+    Lee cada PDF solo cuando la etapa de CPU lo admite
+    """
+    for path in pdf_paths:
+        with open(path, 'rb') as f:
+            yield os.path.basename(path), f.read()
+
+
+def parse_stages(value: str) -> frozenset:
+    try:
+        return normalize_stages(part.strip() for part in value.split(',') if part.strip())
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_negative_ttl(value: str) -> Tuple[str, float]:
+    kind, _, seconds = value.partition('=')
+    if kind not in DEFAULT_NEGATIVE_TTL:
+        raise argparse.ArgumentTypeError(f"Clase de fallo desconocida: {kind}")
+    try:
+        return kind, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"TTL inválido: {seconds}")
+
+
+def add_runtime_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Opciones comunes a los comandos que procesan lotes
+    """
+    parser.add_argument('--cpu-workers', type=int, default=2, help='Hilos de la etapa de CPU')
+    parser.add_argument('--io-workers', type=int, default=8, help='Consultas simultáneas al SAT')
+    parser.add_argument('--timeout', type=int, default=15, help='Timeout por solicitud (s)')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Exponer /metrics en este puerto')
+    parser.add_argument('--negative-ttl', type=parse_negative_ttl, action='append', default=[],
+                        metavar='CLASE=SEGUNDOS',
+                        help=f"TTL del cache de fallos por clase ({', '.join(DEFAULT_NEGATIVE_TTL)}); 0 = no cachear")
+    parser.add_argument('--cache-db', default=None,
+                        help='Persistir las páginas del SAT en este archivo SQLite entre ejecuciones')
+    parser.add_argument('--max-age-days', type=float, default=7,
+                        help='Días en que una página en cache se sirve sin revalidar')
+    parser.add_argument('--stale-days', type=float, default=30,
+                        help='Días adicionales en que se sirve obsoleta mientras se revalida en segundo plano')
+    parser.add_argument('--archive', default=None,
+                        help='Guardar cada página del SAT descargada en este directorio (ver reparse)')
+    parser.add_argument('--memory-budget-mb', type=float, default=None,
+                        help='Memoria para PDFs en proceso; admite archivos solo si caben '
+                             '(por defecto SCRAPER_MEMORY_BUDGET_MB o la mitad del límite del contenedor)')
+
+
+def build_scraper(args: argparse.Namespace) -> SATScraper:
+    scraper = SATScraper()
+    scraper.request_timeout = args.timeout
+    scraper.collect_diagnostics = True
+    scraper.negative_cache_ttl.update(args.negative_ttl)
+    scraper.freshness = FreshnessPolicy(max_age=args.max_age_days * 86400,
+                                        stale_while_revalidate=args.stale_days * 86400)
+    if args.cache_db:
+        scraper.use_cache_db(args.cache_db)
+    if args.archive:
+        scraper.use_archive(args.archive)
+    if args.memory_budget_mb is not None:
+        memory_governor.configure(int(args.memory_budget_mb * 1024 * 1024) or None)
+    return scraper
+
+
+def command_process(args: argparse.Namespace) -> int:
+    pdf_paths = find_pdfs(args.paths)
+    if not pdf_paths:
+        print('❌ No se encontraron archivos PDF')
+        return 1
+
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+
+    scraper = build_scraper(args)
+    executor = PipelinedExecutor(scraper, cpu_workers=args.cpu_workers, io_workers=args.io_workers)
+
+    results = []
+    jsonl = open(args.jsonl, 'w', encoding='utf-8') if args.jsonl else None
+    profiler = profiling.BatchProfiler() if args.profile else nullcontext()
+    start = time.perf_counter()
+    try:
+        with profiler:
+            for count, result in enumerate(executor.map(read_jobs(pdf_paths), args.stages), 1):
+                results.append(result)
+                if jsonl:
+                    jsonl.write(json.dumps(result, ensure_ascii=False) + '\n')
+                status = '✅' if result.get('scraping_exitoso') == 'True' else '❌'
+                print(f"[{count}/{len(pdf_paths)}] {status} {result.get('archivo_pdf', '')} {result.get('error', '')}")
+    finally:
+        executor.shutdown()
+        if jsonl:
+            jsonl.close()
+
+    if args.profile:
+        with open(args.profile, 'wb') as f:
+            f.write(profiler.zip_bytes())
+        print(f"🔬 Perfil guardado en {args.profile}")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n📊 {len(results)} archivos en {elapsed:.1f}s ({len(results) / elapsed:.2f} archivos/s)")
+
+    if args.excel:
+        excel_bytes = scraper.export_to_excel(results, args.excel)
+        with open(args.excel, 'wb') as f:
+            f.write(excel_bytes)
+        print(f"💾 Excel guardado en {args.excel}")
+
+    return 0
+
+
+def command_reverify(args: argparse.Namespace) -> int:
+    records = load_records(args.inputs)
+    due = schedule(records, min_age_days=args.min_age_days, limit=args.limit)
+    if not due:
+        print('✅ No hay registros pendientes de re-verificar')
+        return 0
+
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+
+    scraper = build_scraper(args)
+    reverifier = Reverifier(scraper, workers=args.io_workers, rate=args.rate)
+    verified = {id(record) for record in due}
+    counts = {'cambiado': 0, 'sin_cambios': 0, 'fallo': 0}
+
+    print(f"🔁 Re-verificando {len(due)} de {len(records)} registros a {args.rate:g} solicitudes/s")
+    start = time.perf_counter()
+    changes = open_sinks(scraper, jsonl=args.changes, csv_path=args.changes_csv, excel=args.excel)
+    state = open_sinks(jsonl=args.state)
+    with changes, state:
+        for count, record in enumerate(reverifier.run(due), 1):
+            counts[record['cambio']] += 1
+            if state:
+                state.write(record)
+            if record['cambio'] == 'cambiado':
+                changes.write(record)
+                print(f"[{count}/{len(due)}] 🔄 {record.get('rfc', record['url'])}: {record['campos_cambiados']}")
+            elif record['cambio'] == 'fallo':
+                print(f"[{count}/{len(due)}] ❌ {record.get('rfc', record['url'])} {record.get('error', '')}")
+        if state:
+            # Los registros no programados pasan tal cual al siguiente estado
+            for record in records:
+                if id(record) not in verified:
+                    state.write(record)
+
+    elapsed = time.perf_counter() - start
+    print(f"\n📊 {len(due)} registros en {elapsed:.1f}s: {counts['cambiado']} cambiados, "
+          f"{counts['sin_cambios']} sin cambios, {counts['fallo']} fallidos")
+    return 0
+
+
+def command_reparse(args: argparse.Namespace) -> int:
+    archive = SATArchive(args.archive_dir)
+    jobs = build_jobs(archive, latest_only=not args.all, token=args.token)
+    archive.close()
+    if not jobs:
+        print('❌ El archivo no tiene páginas del SAT ni textos de PDF')
+        return 1
+
+    # Sin red: solo se usan los parsers del scraper
+    reparser = BulkReparser(args.archive_dir, workers=args.workers, chunk_size=args.chunk_size)
+    results = reparser.run(jobs)
+    if args.previous:
+        results = annotate_changes(results, load_previous(args.previous))
+
+    counts = {'cambiado': 0, 'nuevo': 0, 'sin_cambios': 0}
+    start = time.perf_counter()
+    with open_sinks(SATScraper(), jsonl=args.jsonl, csv_path=args.csv, excel=args.excel) as sinks:
+        for count, result in enumerate(results, 1):
+            change = result.get('cambio')
+            if change:
+                counts[change] += 1
+            if not args.changed_only or change in ('cambiado', 'nuevo'):
+                sinks.write(result)
+            if count % 10000 == 0:
+                print(f"[{count}/{len(jobs)}] {count / (time.perf_counter() - start):.0f} registros/s")
+
+    elapsed = time.perf_counter() - start
+    print(f"📊 {len(jobs)} registros reparseados en {elapsed:.1f}s con {reparser.workers} procesos "
+          f"({len(jobs) / max(elapsed, 1e-9):.0f} registros/s)")
+    if args.previous:
+        print(f"   {counts['cambiado']} cambiados, {counts['nuevo']} nuevos, {counts['sin_cambios']} sin cambios")
+    return 0
+
+
+def command_coordinate(args: argparse.Namespace) -> int:
+    pdf_paths = find_pdfs(args.paths)
+    if not pdf_paths:
+        print('❌ No se encontraron archivos PDF')
+        return 1
+
+    queue, blobs = open_queue(args.queue, args.max_attempts, args.blobs)
+    batch, total = submit_batch(queue, blobs, read_jobs(pdf_paths), args.stages)
+    print(f"📤 Lote {batch}: {total} trabajos en {args.queue}")
+
+    start = time.perf_counter()
+    with open_sinks(SATScraper(), jsonl=args.jsonl, csv_path=args.csv, excel=args.excel) as sinks:
+        for count, result in enumerate(collect_results(queue, batch, total), 1):
+            sinks.write(result)
+            status = '✅' if result.get('scraping_exitoso') == 'True' else '❌'
+            print(f"[{count}/{total}] {status} {result.get('archivo_pdf', '')} {result.get('error', '')}")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n📊 {total} archivos en {elapsed:.1f}s ({total / elapsed:.2f} archivos/s)")
+    return 0
+
+
+def command_worker(args: argparse.Namespace) -> int:
+    import signal
+    import threading
+
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+
+    queue, _ = open_queue(args.queue, args.max_attempts)
+    worker = QueueWorker(queue, build_scraper(args), threads=args.threads,
+                         visibility_timeout=args.visibility_timeout)
+    stop = threading.Event()
+    # SIGTERM (orquestador) y Ctrl+C terminan el trabajo en curso y salen
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    print(f"👷 Worker con {worker.threads} hilos en {args.queue}")
+    runner = threading.Thread(target=worker.run, args=(stop,), name='csf-worker')
+    runner.start()
+    try:
+        while runner.is_alive():
+            runner.join(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        runner.join()
+    print(f"👋 {worker.processed} archivos procesados")
+    return 0
+
+
+def add_queue_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--queue', required=True, help='Cola: sqlite:///ruta/cola.db o redis://host:6379/0')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help='Intentos por trabajo antes de entregarlo como fallido')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Scraper CSF SAT - línea de comandos')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    process = subparsers.add_parser('process', help='Procesar PDFs de CSF por lotes')
+    process.add_argument('paths', nargs='+', help='Archivos PDF o directorios')
+    process.add_argument('--excel', help='Guardar resultados en este archivo Excel')
+    process.add_argument('--jsonl', help='Guardar un resultado JSON por línea en este archivo')
+    process.add_argument('--stages', type=parse_stages, default=ALL_STAGES,
+                         help='Etapas separadas por coma: qr,pdf_text,web (por defecto todas)')
+    process.add_argument('--profile', default=None,
+                         help='Perfilar el lote y guardar un ZIP con pstats, pilas "folded" y asignaciones')
+    add_runtime_arguments(process)
+    process.set_defaults(func=command_process)
+
+    reverify = subparsers.add_parser('reverify', help='Re-verificar en el SAT contribuyentes ya procesados (sin PDFs)')
+    reverify.add_argument('inputs', nargs='+',
+                          help='JSONL de process/reverify, CSV con columna url o texto con una URL por línea')
+    reverify.add_argument('--rate', type=float, default=5, help='Solicitudes por segundo al SAT (0 = sin límite)')
+    reverify.add_argument('--min-age-days', type=float, default=0,
+                          help='Omitir registros verificados hace menos de estos días')
+    reverify.add_argument('--limit', type=int, default=None, help='Re-verificar como máximo N registros (los más prioritarios)')
+    reverify.add_argument('--changes', help='Guardar los registros que cambiaron en este JSONL')
+    reverify.add_argument('--changes-csv', help='Guardar los registros que cambiaron en este CSV')
+    reverify.add_argument('--excel', help='Guardar los registros que cambiaron en este archivo Excel')
+    reverify.add_argument('--state', help='Guardar todos los registros actualizados (entrada de la siguiente ejecución)')
+    add_runtime_arguments(reverify)
+    # Re-verificar es consultar al SAT: el cache solo evita re-parsear (solicitud condicional)
+    reverify.set_defaults(func=command_reverify, max_age_days=0, stale_days=0)
+
+    reparse = subparsers.add_parser('reparse', help='Volver a parsear las páginas archivadas del SAT (sin red)')
+    reparse.add_argument('archive_dir', help='Directorio creado con --archive')
+    reparse.add_argument('--all', action='store_true', help='Todas las capturas (por defecto la más reciente por RFC)')
+    reparse.add_argument('--token', default=None, help='Solo este token D3 (registro_RFC)')
+    reparse.add_argument('--jsonl', help='Guardar un resultado JSON por línea en este archivo')
+    reparse.add_argument('--csv', help='Guardar los resultados en este CSV')
+    reparse.add_argument('--excel', help='Guardar los resultados en este archivo Excel')
+    reparse.add_argument('--workers', type=int, default=None, help='Procesos de parseo (por defecto uno por núcleo)')
+    reparse.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Registros por bloque de trabajo')
+    reparse.add_argument('--previous', nargs='+', default=None,
+                         help='Resultados anteriores (JSONL/CSV) para marcar registros nuevos o cambiados')
+    reparse.add_argument('--changed-only', action='store_true',
+                         help='Con --previous, escribir solo los registros nuevos o cambiados')
+    reparse.set_defaults(func=command_reparse)
+
+    coordinate = subparsers.add_parser('coordinate', help='Encolar PDFs para workers distribuidos y recoger resultados')
+    coordinate.add_argument('paths', nargs='+', help='Archivos PDF o directorios')
+    add_queue_arguments(coordinate)
+    coordinate.add_argument('--blobs', default=None,
+                            help='Directorio compartido para los PDFs (por defecto junto a la cola SQLite o en Redis)')
+    coordinate.add_argument('--stages', type=parse_stages, default=ALL_STAGES,
+                            help='Etapas separadas por coma: qr,pdf_text,web (por defecto todas)')
+    coordinate.add_argument('--jsonl', help='Guardar un resultado JSON por línea en este archivo')
+    coordinate.add_argument('--csv', help='Guardar los resultados en este CSV')
+    coordinate.add_argument('--excel', help='Guardar resultados en este archivo Excel')
+    coordinate.set_defaults(func=command_coordinate)
+
+    worker = subparsers.add_parser('worker', help='Procesar trabajos de la cola distribuida')
+    add_queue_arguments(worker)
+    worker.add_argument('--threads', type=int, default=4, help='Trabajos simultáneos en este nodo')
+    worker.add_argument('--visibility-timeout', type=float, default=DEFAULT_VISIBILITY_TIMEOUT,
+                        help='Segundos antes de que un trabajo sin confirmar vuelva a la cola')
+    add_runtime_arguments(worker)
+    worker.set_defaults(func=command_worker)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
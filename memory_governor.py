@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Control de admisión por memoria para el procesamiento de PDFs
+
+Cada archivo en la etapa de CPU ocupa, en su pico, el render de la primera página
+a QR_RENDER_SCALE (pixmap, PNG, imagen PIL, arreglo y escala de grises) o, si el QR
+es difícil, el re-render de la escalera a HIGH_DPI_SCALE, más el PDF abierto. El
+gobernador estima ese pico a partir del tamaño de página (MediaBox) y solo admite
+un archivo nuevo si la suma de lo admitido cabe en el presupuesto y el RSS del
+proceso no rebasa su límite. Si no cabe, espera a que termine otro: con
+poca memoria baja la concurrencia en lugar de que el contenedor muera por OOM.
+Siempre admite al menos un archivo, aunque exceda el presupuesto por sí solo.
+
+Presupuesto (en orden): configure(), SCRAPER_MEMORY_BUDGET_MB o una fracción del
+límite de memoria del contenedor (cgroup). Sin ninguno no hay gobernador.
+"""
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import metrics
+from qr_preprocessing import HIGH_DPI_SCALE, QR_RENDER_SCALE
+
+# Primer MediaBox del documento: [x0 y0 x1 y1] en puntos
+_MEDIABOX_PATTERN = re.compile(rb'/MediaBox\s*\[\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\]')
+# Carta (puntos) si el MediaBox está comprimido en un flujo de objetos
+DEFAULT_PAGE_SIZE = (612.0, 792.0)
+# Lado máximo que se acepta del MediaBox (200 pulgadas; PDF limita a 14400)
+MAX_PAGE_SIDE = 14400.0
+
+# Bytes por píxel en el pico del render: pixmap RGB (3) + PNG (~2) + PIL (3) + arreglo (3) + gris (1)
+BYTES_PER_PIXEL = 12
+# Peldaño dpi_alta: pixmap RGB (3) + gris (1) por píxel a HIGH_DPI_SCALE, mientras la
+# escalera conserva el gris del render base y su binarización (2 por píxel base)
+LADDER_BYTES_PER_PIXEL = 4
+LADDER_BASE_BYTES_PER_PIXEL = 2
+# Bytes del PDF abierto (estructuras de PyMuPDF) por byte del archivo, además de los bytes mismos
+PDF_OPEN_FACTOR = 2
+
+# Fracciones del límite del contenedor: presupuesto de archivos en vuelo y RSS máximo para admitir
+CONTAINER_BUDGET_FRACTION = 0.5
+CONTAINER_RSS_FRACTION = 0.85
+# Límites de cgroup mayores a esto equivalen a "sin límite" (cgroup v1 usa ~2^63)
+_UNLIMITED = 1 << 60
+
+_CGROUP_LIMIT_FILES = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+
+def page_size(pdf_bytes: bytes) -> tuple:
+    """
+    Ancho y alto (puntos) de la primera página según su MediaBox, sin abrir el PDF
+    """
+    match = _MEDIABOX_PATTERN.search(pdf_bytes)
+    if match:
+        try:
+            x0, y0, x1, y1 = (float(value) for value in match.groups())
+            width, height = abs(x1 - x0), abs(y1 - y0)
+            if 0 < width <= MAX_PAGE_SIDE and 0 < height <= MAX_PAGE_SIDE:
+                return width, height
+        except ValueError:
+            pass
+    return DEFAULT_PAGE_SIZE
+
+
+def estimate_footprint(pdf_bytes: bytes) -> int:
+    """
+    Memoria pico estimada (bytes) de procesar un PDF en la etapa de CPU: el mayor
+    entre el render base y el peldaño de alta resolución de la escalera
+    """
+    width, height = page_size(pdf_bytes)
+    base_pixels = width * height * QR_RENDER_SCALE ** 2
+    ladder_pixels = width * height * HIGH_DPI_SCALE ** 2
+    render_peak = max(base_pixels * BYTES_PER_PIXEL,
+                      ladder_pixels * LADDER_BYTES_PER_PIXEL + base_pixels * LADDER_BASE_BYTES_PER_PIXEL)
+    return int(render_peak) + len(pdf_bytes) * (1 + PDF_OPEN_FACTOR)
+
+
+def current_rss() -> Optional[int]:
+    """
+    Memoria residente del proceso en bytes (None si el sistema no la expone)
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def container_memory_limit() -> Optional[int]:
+    """
+    Límite de memoria del contenedor (cgroup v2 o v1), o None si no hay
+    """
+    for path in _CGROUP_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < _UNLIMITED:
+            return int(value)
+        return None
+    return None
+
+
+class MemoryGovernor:
+    """
+    Presupuesto de memoria compartido por todos los hilos que procesan PDFs; seguro entre hilos
+    """
+
+    def __init__(self, budget: int, rss_limit: Optional[int] = None, poll_interval: float = 0.5):
+        self.budget = max(1, int(budget))
+        self.rss_limit = rss_limit
+        # Con límite de RSS se vuelve a medir periódicamente mientras se espera
+        self.poll_interval = poll_interval
+        self.reserved = 0
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def _blocker(self, estimate: int) -> Optional[str]:
+        """
+        Motivo por el que el archivo no cabe ahora (None si se puede admitir)
+        """
+        if self.in_flight == 0:
+            return None
+        if self.reserved + estimate > self.budget:
+            return 'presupuesto'
+        if self.rss_limit is not None:
+            rss = current_rss()
+            if rss is not None and rss + estimate > self.rss_limit:
+                return 'rss'
+        return None
+
+    def admit(self, estimate: int, stop: Optional[threading.Event] = None) -> bool:
+        """
+        Bloquea hasta que el archivo quepa y lo reserva; False si se activó stop mientras esperaba
+        """
+        with self._condition:
+            reason = self._blocker(estimate)
+            if reason is not None:
+                metrics.MEMORY_ADMISSION.inc(resultado=f'espera_{reason}')
+            while reason is not None:
+                if stop is not None and stop.is_set():
+                    return False
+                self._condition.wait(self.poll_interval)
+                reason = self._blocker(estimate)
+            if self.in_flight == 0 and estimate > self.budget:
+                metrics.MEMORY_ADMISSION.inc(resultado='excede_presupuesto')
+            else:
+                metrics.MEMORY_ADMISSION.inc(resultado='admitido')
+            self.reserved += estimate
+            self.in_flight += 1
+            return True
+
+    def release(self, estimate: int) -> None:
+        with self._condition:
+            self.reserved -= estimate
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, estimate: int) -> Iterator[None]:
+        self.admit(estimate)
+        try:
+            yield
+        finally:
+            self.release(estimate)
+
+
+_shared: Optional[MemoryGovernor] = None
+_shared_configured = False
+_shared_lock = threading.Lock()
+
+
+def configure(budget: Optional[int], rss_limit: Optional[int] = None) -> Optional[MemoryGovernor]:
+    """
+    Reemplaza el gobernador compartido (budget None = sin control de admisión).
+    Sin rss_limit se usa una fracción del límite del contenedor, si lo hay
+    """
+    global _shared, _shared_configured
+    if rss_limit is None:
+        limit = container_memory_limit()
+        rss_limit = int(limit * CONTAINER_RSS_FRACTION) if limit else None
+    with _shared_lock:
+        _shared = MemoryGovernor(budget, rss_limit) if budget else None
+        _shared_configured = True
+        return _shared
+
+
+def shared_governor() -> Optional[MemoryGovernor]:
+    """
+    Gobernador de todo el proceso (todos los ejecutores y workers comparten el presupuesto)
+    """
+    if not _shared_configured:
+        budget_mb = os.environ.get('SCRAPER_MEMORY_BUDGET_MB')
+        if budget_mb:
+            configure(int(float(budget_mb) * 1024 * 1024))
+        else:
+            limit = container_memory_limit()
+            configure(int(limit * CONTAINER_BUDGET_FRACTION) if limit else None)
+    return _shared
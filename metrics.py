@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Contadores e histogramas del proceso con exposición OpenMetrics/Prometheus en /metrics
+"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Cubetas (s) para latencias de red y duraciones de exportación
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Contador monotónico con etiquetas
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple((name, str(labels.get(name, ''))) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple((name, str(labels.get(name, ''))) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self, openmetrics: bool) -> List[str]:
+        # En OpenMetrics la familia se declara sin el sufijo _total
+        family = self.name[:-len('_total')] if openmetrics and self.name.endswith('_total') else self.name
+        lines = [f'# HELP {family} {self.documentation}', f'# TYPE {family} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """
+    Histograma acumulativo con etiquetas
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(float(b) for b in sorted(buckets)) + (float('inf'),)
+        self._series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple((name, str(labels.get(name, ''))) for name in self.labelnames)
+        with self._lock:
+            # [conteos por cubeta..., suma, total]
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self, openmetrics: bool) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for upper, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = labels + (('le', _format_value(upper)),)
+                lines.append(f'{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {series[-1]}')
+        return lines
+
+
+class Registry:
+    """
+    Conjunto de métricas del proceso
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self, openmetrics: bool = True) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(openmetrics))
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+FILES_PROCESSED = REGISTRY.register(Counter(
+    'csf_files_processed_total', 'Archivos PDF procesados por resultado',
+    ('scraping', 'pdf')))
+QR_METHOD = REGISTRY.register(Counter(
+    'csf_qr_method_total', 'Backend QR con el que se obtuvo la URL (vector = enlace o texto del PDF, ninguno = no encontrada)',
+    ('metodo',)))
+QR_LADDER = REGISTRY.register(Counter(
+    'csf_qr_ladder_total', 'Intentos de decodificación QR por peldaño de preprocesamiento y resultado',
+    ('peldano', 'resultado')))
+QR_LADDER_LATENCY = REGISTRY.register(Histogram(
+    'csf_qr_ladder_seconds', 'Duración de cada peldaño de la escalera de preprocesamiento QR',
+    ('peldano',)))
+FETCH_STRATEGY = REGISTRY.register(Counter(
+    'csf_fetch_strategy_total', 'Intentos de descarga de la página del SAT por estrategia y resultado',
+    ('estrategia', 'resultado')))
+SAT_LATENCY = REGISTRY.register(Histogram(
+    'csf_sat_fetch_seconds', 'Latencia de cada intento de descarga al SAT',
+    ('estrategia',)))
+SAT_READ = REGISTRY.register(Counter(
+    'csf_sat_read_total', 'Lecturas de respuestas del SAT por motivo de fin (fin_datos = cierre de la tabla de datos, completo, limite = tope de tamaño)',
+    ('motivo',)))
+SCRAPE_CACHE = REGISTRY.register(Counter(
+    'csf_scrape_cache_total', 'Consultas al cache de scraping por resultado (obsoleto = servida mientras se revalida, vencido = se volvió a consultar, negativo = fallo reciente, compartido = se unió a una descarga en curso)',
+    ('resultado',)))
+PARSE_FIELDS = REGISTRY.register(Histogram(
+    'csf_parse_fields', 'Campos extraídos por parse_sat_content',
+    buckets=(0, 1, 5, 10, 15, 20, 25)))
+REVERIFY = REGISTRY.register(Counter(
+    'csf_reverify_total', 'Registros re-verificados por resultado (cambiado, sin_cambios, fallo)',
+    ('resultado',)))
+MEMORY_ADMISSION = REGISTRY.register(Counter(
+    'csf_memory_admissions_total', 'Admisiones de archivos por el gobernador de memoria (espera_* = tuvo que esperar)',
+    ('resultado',)))
+SERVICE_REQUESTS = REGISTRY.register(Counter(
+    'csf_service_requests_total', 'Respuestas del servicio HTTP por ruta y código (503 = sin turno de procesamiento)',
+    ('endpoint', 'estado')))
+EXPORT_DURATION = REGISTRY.register(Histogram(
+    'csf_export_seconds', 'Duración de export_to_excel'))
+
+
+def _metrics_handler():
+    """
+    Handler HTTP de /metrics (http.server se importa solo si se expone el endpoint)
+    """
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+            body = REGISTRY.render(openmetrics).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MetricsHandler
+
+
+_servers: Dict[int, object] = {}
+_servers_lock = threading.Lock()
+
+
+def start_http_server(port: int, host: str = '127.0.0.1'):
+    """
+    Expone /metrics en un hilo daemon. Idempotente por puerto (las recargas de
+    Streamlit vuelven a ejecutar el script pero conservan este módulo)
+    """
+    from http.server import ThreadingHTTPServer
+
+    with _servers_lock:
+        if port in _servers:
+            return _servers[port]
+        try:
+            server = ThreadingHTTPServer((host, port), _metrics_handler())
+        except OSError as e:
+            print(f"No se pudo iniciar /metrics en {host}:{port}: {str(e)}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='csf-metrics', daemon=True).start()
+        _servers[port] = server
+        return server
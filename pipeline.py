@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Ejecutor en dos etapas que solapa la extracción de CPU con el scraping de red
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Hashable, Iterable, Iterator, Optional, Tuple
+
+import profiling
+from memory_governor import MemoryGovernor, estimate_footprint, shared_governor
+from sat_scraper_cloud import SATScraper, normalize_stages
+
+# Marcador de fin de lote en la cola de salida
+_DONE = object()
+# Valor por omisión de memory_governor: el gobernador compartido (None = sin control de admisión)
+_SHARED = object()
+
+
+def error_result(filename: str, message: str) -> Dict:
+    """
+    Resultado estándar para un archivo que falló de forma inesperada
+    """
+    return {
+        'archivo_pdf': filename,
+        'error': f'Error procesando archivo: {message}',
+        'scraping_exitoso': 'False',
+        'extraccion_pdf_exitosa': 'False',
+        'url_encontrada': 'False',
+        'url': 'No encontrada'
+    }
+
+
+class PipelinedExecutor:
+    """
+    Ejecuta el procesamiento de PDFs en dos etapas dimensionadas por separado:
+
+    - Etapa de CPU (abrir PDF, decodificar QR, extraer texto) con pocos hilos
+    - Etapa de red (scraping y parseo del SAT) con alta concurrencia
+
+    Ambas etapas se comunican por una cola acotada: si la red se atrasa, la etapa
+    de CPU se bloquea en lugar de acumular resultados parciales en memoria. El
+    tiempo total del lote tiende a max(CPU, red) en lugar de su suma.
+
+    Con un gobernador de memoria (por defecto el compartido del proceso, ver
+    memory_governor.py; memory_governor=None lo desactiva) un archivo solo entra
+    a la etapa de CPU si su memoria estimada cabe en el presupuesto.
+    """
+
+    def __init__(self, scraper: Optional[SATScraper] = None, cpu_workers: int = 2,
+                 io_workers: int = 8, queue_size: Optional[int] = None,
+                 memory_governor: Optional[MemoryGovernor] = _SHARED):
+        self.scraper = scraper or SATScraper()
+        self.memory_governor = shared_governor() if memory_governor is _SHARED else memory_governor
+        self.cpu_workers = max(1, cpu_workers)
+        self.io_workers = max(1, io_workers)
+        self._fixed_queue_size = queue_size
+        self.queue_size = max(1, queue_size or self.io_workers * 2)
+
+        self._cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix='csf-cpu')
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix='csf-io')
+        # Protege el reemplazo de pools en resize frente a los submit de lotes en curso
+        self._pools_lock = threading.Lock()
+
+    def resize(self, cpu_workers: int, io_workers: int) -> None:
+        """
+        Cambia el tamaño de las etapas sin crear otro ejecutor: los pools anteriores
+        terminan sus tareas pendientes y liberan sus hilos; los lotes en curso siguen
+        en los nuevos
+        """
+        cpu_workers, io_workers = max(1, cpu_workers), max(1, io_workers)
+        if (cpu_workers, io_workers) == (self.cpu_workers, self.io_workers):
+            return
+        with self._pools_lock:
+            old_pools = (self._cpu_pool, self._io_pool)
+            self.cpu_workers, self.io_workers = cpu_workers, io_workers
+            self.queue_size = max(1, self._fixed_queue_size or io_workers * 2)
+            self._cpu_pool = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix='csf-cpu')
+            self._io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='csf-io')
+        for pool in old_pools:
+            pool.shutdown(wait=False)
+
+    def map(self, jobs: Iterable[Tuple[str, bytes]], stages=None) -> Iterator[Dict]:
+        """
+        Procesa pares (nombre, bytes) y entrega los resultados conforme se completan.
+        stages: etapas a ejecutar (ver sat_scraper_cloud.ALL_STAGES); sin etapa web
+        la etapa de red no recibe trabajo
+        """
+        keyed_jobs = ((None, filename, pdf_bytes) for filename, pdf_bytes in jobs)
+        for _, result in self.map_keyed(keyed_jobs, stages):
+            yield result
+
+    def map_keyed(self, jobs: Iterable[Tuple[Hashable, str, bytes]], stages=None) -> Iterator[Tuple[Hashable, Dict]]:
+        """
+        Igual que map, pero cada trabajo lleva una clave (p. ej. el hash del contenido)
+        que se entrega junto a su resultado: (clave, resultado)
+        """
+        stages = normalize_stages(stages)
+        output = queue.Queue()
+        stop = threading.Event()
+
+        # Archivos admitidos en la etapa de CPU (evita leer todo el lote por adelantado)
+        cpu_slots = threading.BoundedSemaphore(self.cpu_workers * 2)
+        # Cola acotada entre etapas
+        handoff_slots = threading.BoundedSemaphore(self.queue_size)
+
+        governor = self.memory_governor
+
+        # Sin perfilado activo el trabajo queda tal cual (costo cero). Solo se envuelve
+        # el trabajo: las tareas siempre liberan sus turnos y entregan un resultado
+        run_cpu_stage = profiling.wrap_task(self.scraper.run_cpu_stage)
+        run_io_stage = profiling.wrap_task(self.scraper.run_io_stage)
+
+        def io_task(key: Hashable, result: Dict, url: str) -> None:
+            handoff_slots.release()
+            try:
+                output.put((key, run_io_stage(result, url)))
+            except Exception as e:
+                output.put((key, error_result(result.get('archivo_pdf', ''), str(e))))
+
+        def cpu_task(key: Hashable, filename: str, pdf_bytes: bytes, footprint: int) -> None:
+            try:
+                result, url = run_cpu_stage(pdf_bytes, filename, stages)
+            except Exception as e:
+                output.put((key, error_result(filename, str(e))))
+                return
+            finally:
+                if governor is not None:
+                    governor.release(footprint)
+                cpu_slots.release()
+
+            if not url:
+                output.put((key, result))
+                return
+            # Bloquea la etapa de CPU mientras la cola hacia la red esté llena
+            handoff_slots.acquire()
+            try:
+                with self._pools_lock:
+                    self._io_pool.submit(io_task, key, result, url)
+            except Exception as e:
+                handoff_slots.release()
+                output.put((key, error_result(filename, str(e))))
+
+        def feeder() -> None:
+            submitted = 0
+            try:
+                for key, filename, pdf_bytes in jobs:
+                    cpu_slots.acquire()
+                    if stop.is_set():
+                        cpu_slots.release()
+                        break
+                    footprint = 0
+                    if governor is not None:
+                        # Espera a que el archivo quepa en memoria (reduce la concurrencia efectiva)
+                        footprint = estimate_footprint(pdf_bytes)
+                        if not governor.admit(footprint, stop):
+                            cpu_slots.release()
+                            break
+                    try:
+                        with self._pools_lock:
+                            self._cpu_pool.submit(cpu_task, key, filename, pdf_bytes, footprint)
+                    except Exception as e:
+                        # Sin tarea que los libere: el turno y la reserva se devuelven aquí
+                        if governor is not None:
+                            governor.release(footprint)
+                        cpu_slots.release()
+                        output.put((key, error_result(filename, str(e))))
+                    submitted += 1
+            except Exception as e:
+                output.put((None, error_result('', str(e))))
+                submitted += 1
+            output.put((_DONE, submitted))
+
+        threading.Thread(target=feeder, name='csf-feeder', daemon=True).start()
+
+        total = None
+        emitted = 0
+        try:
+            while total is None or emitted < total:
+                key, item = output.get()
+                if key is _DONE:
+                    total = item
+                    continue
+                emitted += 1
+                yield key, item
+        finally:
+            stop.set()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Libera los hilos de ambas etapas
+        """
+        with self._pools_lock:
+            pools = (self._cpu_pool, self._io_pool)
+        for pool in pools:
+            pool.shutdown(wait=wait)
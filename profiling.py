@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Perfilado opcional de un lote: cProfile por hilo, muestreo de pilas y tracemalloc
+
+Con el modo apagado no se instala ningún hook: PipelinedExecutor solo envuelve sus
+tareas cuando hay un BatchProfiler activo al iniciar el lote.
+
+Artefactos generados:
+- perfil.pstats: estadísticas cProfile combinadas de todos los hilos (snakeviz, flameprof)
+- perfil.folded: pilas muestreadas en formato "collapsed" (flamegraph.pl, speedscope)
+- asignaciones.txt: principales asignaciones de memoria del lote (tracemalloc)
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from typing import Callable, Dict, List, Optional
+
+# cProfile, pstats, tracemalloc y zipfile se importan solo al perfilar: el
+# pipeline importa este módulo en cada arranque
+
+_active: Optional['BatchProfiler'] = None
+_active_lock = threading.Lock()
+
+# Desde 3.12 cProfile usa sys.monitoring: solo puede haber un perfilador activo en
+# el proceso y ese ve todos los hilos, así que no se crea uno por hilo
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+
+def wrap_task(func: Callable) -> Callable:
+    """
+    Envuelve una tarea de hilo con cProfile si hay un perfilado activo; si no, la retorna tal cual
+    """
+    profiler = _active
+    if profiler is None or not PER_THREAD_PROFILES:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = profiler._thread_profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Otro perfilador ocupa el hilo: la tarea corre sin perfilar
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+
+    return wrapper
+
+
+class BatchProfiler:
+    """
+    Contexto que perfila todo lo que ocurre durante un lote
+    """
+
+    def __init__(self, sample_interval: float = 0.005, trace_frames: int = 10, top_allocations: int = 30):
+        self.sample_interval = sample_interval
+        self.trace_frames = trace_frames
+        self.top_allocations = top_allocations
+
+        self._profiles: List = []
+        self._profiles_lock = threading.Lock()
+        self._thread_local = threading.local()
+        self._samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._main_profile = None
+        self._start_snapshot = None
+        self._end_snapshot = None
+        self._started_tracemalloc = False
+        self.peak_memory = 0
+        self.elapsed = 0.0
+
+    def _thread_profile(self):
+        import cProfile
+
+        profile = getattr(self._thread_local, 'profile', None)
+        if profile is None:
+            profile = cProfile.Profile()
+            self._thread_local.profile = profile
+            with self._profiles_lock:
+                self._profiles.append(profile)
+        return profile
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                # Agrupar hilos del mismo pool (csf-cpu_0, csf-cpu_1 → csf-cpu)
+                thread_name = names.get(thread_id, str(thread_id)).rsplit('_', 1)[0]
+                self._samples[';'.join([thread_name] + stack[::-1])] += 1
+
+    def __enter__(self) -> 'BatchProfiler':
+        import tracemalloc
+
+        global _active
+        with _active_lock:
+            if _active is not None:
+                raise RuntimeError('Ya hay un perfilado de lote activo')
+            _active = self
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._start_snapshot = tracemalloc.take_snapshot()
+
+        self._sampler = threading.Thread(target=self._sample_loop, name='csf-profiler', daemon=True)
+        self._sampler.start()
+
+        self._main_profile = self._thread_profile()
+        self._started_at = time.perf_counter()
+        try:
+            self._main_profile.enable()
+        except ValueError:
+            # Otro perfilador ya está activo: quedan las pilas muestreadas y tracemalloc
+            self._main_profile = None
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        import tracemalloc
+
+        global _active
+        if self._main_profile is not None:
+            self._main_profile.disable()
+        self.elapsed = time.perf_counter() - self._started_at
+
+        self._stop.set()
+        self._sampler.join()
+
+        self._end_snapshot = tracemalloc.take_snapshot()
+        self.peak_memory = tracemalloc.get_traced_memory()[1]
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        with _active_lock:
+            _active = None
+
+    def _stats(self, stream=None):
+        """
+        Estadísticas cProfile combinadas de todos los hilos (vacías si ninguno se pudo perfilar)
+        """
+        import pstats
+
+        with self._profiles_lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(stream=stream)
+        for profile in profiles:
+            try:
+                stats.add(profile)
+            except TypeError:
+                continue  # perfil que nunca se activó
+        return stats
+
+    def pstats_bytes(self) -> bytes:
+        """
+        Estadísticas cProfile de todos los hilos en formato marshal de pstats
+        """
+        import tempfile
+
+        stats = self._stats()
+
+        fd, path = tempfile.mkstemp(suffix='.pstats')
+        os.close(fd)
+        try:
+            stats.dump_stats(path)
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+    def folded_stacks(self) -> str:
+        """
+        Pilas muestreadas en formato "collapsed": "hilo;f1;f2 n" por línea
+        """
+        return ''.join(f"{stack} {count}\n" for stack, count in self._samples.most_common())
+
+    def allocation_report(self) -> str:
+        """
+        Principales asignaciones netas del lote por línea de código
+        """
+        import pstats
+        import tracemalloc
+
+        out = io.StringIO()
+        out.write(f"Duración del lote: {self.elapsed:.2f}s\n")
+        out.write(f"Pico de memoria rastreada: {self.peak_memory / 1024 / 1024:.1f} MB\n\n")
+        out.write(f"Top {self.top_allocations} asignaciones netas (tracemalloc, por línea):\n")
+        # Excluir las asignaciones del propio perfilador
+        filters = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+        end = self._end_snapshot.filter_traces(filters)
+        start = self._start_snapshot.filter_traces(filters)
+        for stat in end.compare_to(start, 'lineno')[:self.top_allocations]:
+            out.write(f"{stat}\n")
+
+        out.write("\nTop 10 funciones por tiempo acumulado (cProfile):\n")
+        stats_out = io.StringIO()
+        self._stats(stats_out).sort_stats('cumulative').print_stats(10)
+        out.write(stats_out.getvalue())
+        return out.getvalue()
+
+    def artifacts(self) -> Dict[str, bytes]:
+        return {
+            'perfil.pstats': self.pstats_bytes(),
+            'perfil.folded': self.folded_stacks().encode('utf-8'),
+            'asignaciones.txt': self.allocation_report().encode('utf-8'),
+        }
+
+    def zip_bytes(self) -> bytes:
+        """
+        Todos los artefactos en un ZIP listo para descargar
+        """
+        import zipfile
+
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in self.artifacts().items():
+                zf.writestr(name, data)
+        return output.getvalue()
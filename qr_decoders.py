@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Decodificadores QR intercambiables con selección automática del más rápido
+
+Backends soportados (se usan los que estén instalados):
+- opencv: cv2.QRCodeDetector (opencv-python-headless, siempre disponible)
+- opencv_aruco: cv2.QRCodeDetectorAruco (OpenCV >= 4.8)
+- wechat: cv2.wechat_qrcode_WeChatQRCode (opencv-contrib-python-headless)
+- zxingcpp: zxing-cpp
+- pyzbar: pyzbar (requiere libzbar del sistema)
+
+Al primer uso se decodifica una muestra generada (QR de validación del SAT a la
+resolución del render y a media resolución) con cada backend; los que aciertan en
+más muestras y, a igualdad, los más rápidos encabezan la cadena de respaldo. La
+variable SCRAPER_QR_BACKENDS (p. ej. "zxingcpp,opencv") fija el orden a mano.
+
+Uso:
+    python qr_decoders.py   # tabla del micro-benchmark y cadena elegida
+"""
+
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# cv2, numpy y las bibliotecas opcionales se importan al crear cada decodificador
+
+# Orden por defecto si no se puede medir (sin codificador de muestras)
+DEFAULT_ORDER = ('zxingcpp', 'opencv', 'opencv_aruco', 'wechat', 'pyzbar')
+
+# Texto de la muestra: misma forma que el QR de una CSF
+SAMPLE_TEXT = 'https://siat.sat.gob.mx/app/qr/faces/pages/mobile/validadorqr.jsf?D1=10&D2=1&D3=12345678901_XAXX010101000'
+
+
+class OpenCVDecoder:
+    name = 'opencv'
+
+    def __init__(self):
+        import cv2
+        self._detector = cv2.QRCodeDetector()
+
+    def decode(self, gray) -> Optional[str]:
+        data, _, _ = self._detector.detectAndDecode(gray)
+        return data or None
+
+
+class OpenCVArucoDecoder:
+    name = 'opencv_aruco'
+
+    def __init__(self):
+        import cv2
+        if not hasattr(cv2, 'QRCodeDetectorAruco'):
+            raise ImportError('cv2.QRCodeDetectorAruco requiere OpenCV >= 4.8')
+        self._detector = cv2.QRCodeDetectorAruco()
+
+    def decode(self, gray) -> Optional[str]:
+        data, _, _ = self._detector.detectAndDecode(gray)
+        return data or None
+
+
+class WeChatDecoder:
+    name = 'wechat'
+
+    def __init__(self):
+        import cv2
+        if not hasattr(cv2, 'wechat_qrcode_WeChatQRCode'):
+            raise ImportError('wechat_qrcode requiere opencv-contrib-python-headless')
+        # Sin modelos CNN usa el detector tradicional del módulo (suficiente para CSF)
+        self._detector = cv2.wechat_qrcode_WeChatQRCode()
+
+    def decode(self, gray) -> Optional[str]:
+        texts, _ = self._detector.detectAndDecode(gray)
+        return texts[0] if texts else None
+
+
+class ZXingDecoder:
+    name = 'zxingcpp'
+
+    def __init__(self):
+        import zxingcpp
+        self._zxingcpp = zxingcpp
+        self._formats = zxingcpp.BarcodeFormat.QRCode
+
+    def decode(self, gray) -> Optional[str]:
+        results = self._zxingcpp.read_barcodes(gray, formats=self._formats)
+        return results[0].text if results else None
+
+
+class PyzbarDecoder:
+    name = 'pyzbar'
+
+    def __init__(self):
+        from pyzbar import pyzbar
+        self._decode = pyzbar.decode
+        self._symbols = [pyzbar.ZBarSymbol.QRCODE]
+
+    def decode(self, gray) -> Optional[str]:
+        results = self._decode(gray, symbols=self._symbols)
+        return results[0].data.decode('utf-8', errors='replace') if results else None
+
+
+BACKENDS = {cls.name: cls for cls in (OpenCVDecoder, OpenCVArucoDecoder, WeChatDecoder, ZXingDecoder, PyzbarDecoder)}
+
+
+def create_decoder(name: str):
+    """
+    Instancia un backend; None si no está instalado
+    """
+    try:
+        return BACKENDS[name]()
+    except Exception:
+        return None
+
+
+def available_backends() -> List[str]:
+    return [name for name in BACKENDS if create_decoder(name) is not None]
+
+
+def sample_images() -> List:
+    """
+    Muestras en escala de grises: el QR de validación sobre una página blanca al
+    tamaño del render 3x y la misma página a media resolución (escaneo pobre)
+    """
+    import cv2
+    import numpy as np
+
+    qr = cv2.QRCodeEncoder.create().encode(SAMPLE_TEXT)
+    # ~6 px por módulo, como el QR de una CSF renderizado a 3x
+    qr = cv2.resize(qr, None, fx=6, fy=6, interpolation=cv2.INTER_NEAREST)
+    page = np.full((1200, 900), 255, dtype=np.uint8)
+    y, x = 80, 60
+    page[y:y + qr.shape[0], x:x + qr.shape[1]] = qr
+    low_res = cv2.resize(page, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    return [page, low_res]
+
+
+def benchmark_backends(names: Optional[Sequence[str]] = None, repeat: int = 3) -> List[Dict]:
+    """
+    Decodifica las muestras con cada backend instalado: aciertos y ms por imagen (mínimo de repeat)
+    """
+    images = sample_images()
+    rows = []
+    for name in names or BACKENDS:
+        decoder = create_decoder(name)
+        if decoder is None:
+            continue
+        correct = 0
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            decoded = []
+            for image in images:
+                try:
+                    decoded.append(decoder.decode(image))
+                except Exception:
+                    decoded.append(None)
+            best = min(best, (time.perf_counter() - start) * 1000 / len(images))
+            correct = sum(1 for text in decoded if text == SAMPLE_TEXT)
+        rows.append({'backend': name, 'aciertos': correct, 'muestras': len(images), 'ms': round(best, 2)})
+    return rows
+
+
+def rank_backends(rows: List[Dict]) -> Tuple[str, ...]:
+    """
+    Cadena de respaldo: más aciertos primero y, a igualdad, más rápido. Los backends
+    que no decodificaron ninguna muestra quedan al final
+    """
+    ordered = sorted(rows, key=lambda row: (-row['aciertos'], row['ms']))
+    return tuple(row['backend'] for row in ordered)
+
+
+_chain: Optional[Tuple[str, ...]] = None
+_chain_lock = threading.Lock()
+
+
+def select_chain() -> Tuple[str, ...]:
+    """
+    Orden de backends para este proceso (se mide una sola vez)
+    """
+    global _chain
+    with _chain_lock:
+        if _chain is not None:
+            return _chain
+
+        forced = os.environ.get('SCRAPER_QR_BACKENDS')
+        if forced:
+            chain = tuple(name.strip() for name in forced.split(',') if name.strip() in BACKENDS)
+        else:
+            try:
+                chain = rank_backends(benchmark_backends())
+            except Exception:
+                # Sin cv2.QRCodeEncoder no hay muestra: orden estático con lo instalado
+                chain = tuple(name for name in DEFAULT_ORDER if create_decoder(name) is not None)
+
+        _chain = chain or (OpenCVDecoder.name,)
+        return _chain
+
+
+class QRDecoderChain:
+    """
+    Prueba los backends en orden hasta que uno decodifica. Cada hilo tiene sus
+    propias instancias (los detectores de OpenCV no son seguros entre hilos)
+    """
+
+    def __init__(self, names: Optional[Sequence[str]] = None):
+        self.names = tuple(names) if names is not None else select_chain()
+        self._thread_local = threading.local()
+
+    def _decoders(self) -> List:
+        decoders = getattr(self._thread_local, 'decoders', None)
+        if decoders is None:
+            decoders = [decoder for decoder in map(create_decoder, self.names) if decoder is not None]
+            self._thread_local.decoders = decoders
+        return decoders
+
+    def decode(self, gray) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Retorna (texto, backend que lo decodificó) o (None, None)
+        """
+        for decoder in self._decoders():
+            try:
+                data = decoder.decode(gray)
+            except Exception:
+                continue
+            if data:
+                return data, decoder.name
+        return None, None
+
+
+def main() -> int:
+    rows = benchmark_backends()
+    print(f"{'backend':<16}{'aciertos':>10}{'ms/imagen':>12}")
+    for row in rows:
+        print(f"{row['backend']:<16}{row['aciertos']:>7}/{row['muestras']:<2}{row['ms']:>12.2f}")
+    missing = sorted(set(BACKENDS) - {row['backend'] for row in rows})
+    if missing:
+        print(f"\nNo instalados: {', '.join(missing)}")
+    print(f"\nCadena elegida: {' → '.join(rank_backends(rows)) or '—'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
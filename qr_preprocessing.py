@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Escalera de preprocesamiento para QR difíciles (escaneos pobres, ruido, inclinación)
+
+Solo se recorre si el render base (3x) no decodifica. Los peldaños van del más
+barato al más caro y se detiene en el primero que decodifica:
+
+- dpi_alta: volver a renderizar la página a mayor resolución
+- umbral_adaptativo: binarización local (cv2.adaptiveThreshold)
+- morfologia: cierre/apertura sobre la imagen binarizada (rellena módulos rotos)
+- rotacion: enderezar la inclinación estimada (los detectores ya leen el QR girado 90°)
+
+Cada intento se cuenta por peldaño (aciertos, intentos, tiempo) para poder
+reordenar la escalera con datos reales: ver ladder_stats() / suggest_order() y la
+variable SCRAPER_QR_LADDER (p. ej. "umbral_adaptativo,dpi_alta").
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import metrics
+
+# cv2 y numpy se importan al recorrer la escalera (solo si el render base falla)
+
+# Peldaño que representa el render base sin preprocesamiento
+BASE_RUNG = 'base'
+
+# Escala del render base de la primera página (3x ≈ 216 dpi)
+QR_RENDER_SCALE = 3
+# Escala del peldaño dpi_alta (5x ≈ 360 dpi)
+HIGH_DPI_SCALE = 5
+# Vecindario (px, impar) y constante de cv2.adaptiveThreshold
+ADAPTIVE_BLOCK_SIZE = 51
+ADAPTIVE_C = 10
+# Inclinación mínima (grados) que justifica rotar
+MIN_SKEW_DEGREES = 0.5
+
+
+class LadderContext:
+    """
+    Página en curso y derivados compartidos entre peldaños (cada uno se calcula una vez)
+    """
+
+    def __init__(self, page, gray):
+        self.page = page
+        self.gray = gray
+        self._binary = None
+
+    def render(self, scale: float):
+        import cv2
+        import fitz
+        import numpy as np
+
+        pix = self.page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        if pix.n == 1:
+            return img[:, :, 0]
+        return cv2.cvtColor(img[:, :, :3], cv2.COLOR_RGB2GRAY)
+
+    def binary(self):
+        if self._binary is None:
+            import cv2
+            self._binary = cv2.adaptiveThreshold(
+                self.gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                ADAPTIVE_BLOCK_SIZE, ADAPTIVE_C)
+        return self._binary
+
+
+def _high_dpi(ctx: LadderContext) -> Iterator:
+    yield ctx.render(HIGH_DPI_SCALE)
+
+
+def _adaptive_threshold(ctx: LadderContext) -> Iterator:
+    yield ctx.binary()
+
+
+def _morphology(ctx: LadderContext) -> Iterator:
+    import cv2
+    import numpy as np
+
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    binary = ctx.binary()
+    # Apertura: rellena huecos blancos dentro de módulos negros; cierre: quita motas negras de ruido
+    yield cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+    yield cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+
+
+def estimate_skew(binary) -> float:
+    """
+    Inclinación (grados) del contenido oscuro de la página según su rectángulo mínimo
+    """
+    import cv2
+    import numpy as np
+
+    # minAreaRect y getRotationMatrix2D trabajan en (x, y): columnas y luego filas
+    coords = np.column_stack(np.where(binary < 128)[::-1]).astype(np.float32)
+    if len(coords) < 10:
+        return 0.0
+    angle = cv2.minAreaRect(coords)[-1]
+    # minAreaRect reporta ángulos en [0, 90) o (-90, 0] según la versión
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    return float(angle)
+
+
+def _rotation(ctx: LadderContext) -> Iterator:
+    import cv2
+
+    angle = estimate_skew(ctx.binary())
+    if abs(angle) >= MIN_SKEW_DEGREES:
+        height, width = ctx.gray.shape[:2]
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        yield cv2.warpAffine(ctx.gray, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=255)
+
+
+RUNGS: Dict[str, Callable[[LadderContext], Iterator]] = {
+    'dpi_alta': _high_dpi,
+    'umbral_adaptativo': _adaptive_threshold,
+    'morfologia': _morphology,
+    'rotacion': _rotation,
+}
+DEFAULT_LADDER = tuple(RUNGS)
+
+
+def ladder_order() -> Tuple[str, ...]:
+    """
+    Orden de peldaños: SCRAPER_QR_LADDER si está definida, si no el predeterminado
+    """
+    forced = os.environ.get('SCRAPER_QR_LADDER')
+    if forced:
+        order = tuple(name.strip() for name in forced.split(',') if name.strip() in RUNGS)
+        if order:
+            return order
+    return DEFAULT_LADDER
+
+
+# peldaño → [intentos, aciertos, segundos]
+_stats: Dict[str, List[float]] = {}
+_stats_lock = threading.Lock()
+
+
+def record_attempt(rung: str, success: bool, seconds: float) -> None:
+    with _stats_lock:
+        entry = _stats.setdefault(rung, [0, 0, 0.0])
+        entry[0] += 1
+        entry[1] += int(success)
+        entry[2] += seconds
+    metrics.QR_LADDER.inc(peldano=rung, resultado='ok' if success else 'fallo')
+    metrics.QR_LADDER_LATENCY.observe(seconds, peldano=rung)
+
+
+def ladder_stats() -> List[Dict]:
+    """
+    Intentos, aciertos y ms promedio por peldaño en este proceso
+    """
+    with _stats_lock:
+        items = [(rung, list(entry)) for rung, entry in _stats.items()]
+    return [{
+        'peldano': rung,
+        'intentos': int(attempts),
+        'aciertos': int(successes),
+        'ms_promedio': round(seconds / attempts * 1000, 1) if attempts else 0.0,
+    } for rung, (attempts, successes, seconds) in items]
+
+
+def suggest_order(stats: Optional[List[Dict]] = None) -> Tuple[str, ...]:
+    """
+    Orden sugerido: más aciertos por milisegundo primero; los peldaños sin datos conservan su lugar al final
+    """
+    def successes_per_ms(row: Dict) -> float:
+        return row['aciertos'] / max(row['ms_promedio'] * row['intentos'], 1e-3)
+
+    stats = [row for row in (stats if stats is not None else ladder_stats()) if row['peldano'] in RUNGS]
+    measured = sorted(stats, key=successes_per_ms, reverse=True)
+    order = [row['peldano'] for row in measured]
+    return tuple(order + [rung for rung in ladder_order() if rung not in order])
+
+
+def run_ladder(decode: Callable, ctx: LadderContext,
+               order: Optional[Sequence[str]] = None) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Recorre los peldaños hasta decodificar. decode(gray) → (texto, backend).
+    Retorna (texto, backend, peldaño) o (None, None, None)
+    """
+    for rung in order or ladder_order():
+        start = time.perf_counter()
+        data, backend = None, None
+        try:
+            for image in RUNGS[rung](ctx):
+                data, backend = decode(image)
+                if data:
+                    break
+        except Exception:
+            data = None
+        record_attempt(rung, bool(data), time.perf_counter() - start)
+        if data:
+            return data, backend, rung
+    return None, None, None
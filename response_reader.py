@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Lectura por partes de la respuesta del SAT con tope de tamaño y de tiempo
+
+Las estrategias de descarga no leen el cuerpo completo de una vez: lo decodifican
+de forma incremental conforme llega y se detienen en cuanto aparece el cierre de
+la tabla de datos (lo que sigue es pie de página que parse_sat_content no usa), al
+alcanzar max_bytes o al vencer el plazo total. Así una página de error enorme o un
+servidor que gotea bytes no retienen a un worker ni su memoria.
+"""
+
+import codecs
+import time
+from typing import Iterable, Optional
+
+import metrics
+from scrape_cache import FAILURE_TIMEOUT, FetchError
+
+# Tope por respuesta: la página real pesa ~15 KB
+MAX_RESPONSE_BYTES = 2 * 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+# Resto del cuerpo que se consume tras el fin de datos para devolver la conexión al pool
+DRAIN_BYTES = 64 * 1024
+
+# Fin de los datos: cierre de la tabla "Características fiscales" (última sección que se parsea).
+# Sin acento en el marcador por si la página llega con mojibake
+END_SECTION_MARKER = 'sticas fiscales'
+END_TABLE_MARKER = '</table>'
+
+# Motivos de fin de lectura (métrica csf_sat_read_total)
+STOP_END_OF_DATA = 'fin_datos'
+STOP_COMPLETE = 'completo'
+STOP_SIZE_LIMIT = 'limite'
+
+
+class EndOfDataScanner:
+    """
+    Busca el marcador de fin de datos en el texto conforme llega, revisando solo
+    lo nuevo más un traslape del largo del marcador
+    """
+
+    def __init__(self):
+        self._markers = [END_SECTION_MARKER, END_TABLE_MARKER]
+        self._tail = ''
+
+    def feed(self, text: str) -> bool:
+        window = (self._tail + text).lower()
+        while self._markers:
+            position = window.find(self._markers[0])
+            if position < 0:
+                break
+            window = window[position + len(self._markers.pop(0)):]
+        if not self._markers:
+            return True
+        self._tail = window[-(len(self._markers[0]) - 1):]
+        return False
+
+
+def read_text(chunks: Iterable[bytes], encoding: Optional[str] = None, max_bytes: int = MAX_RESPONSE_BYTES,
+              deadline: Optional[float] = None) -> str:
+    """
+    Decodifica chunks de forma incremental hasta el fin de los datos, max_bytes o
+    deadline (time.monotonic()); con el tope se retorna lo leído hasta ahí.
+    Quien llama cierra la conexión: el resto del cuerpo no se consume
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='ignore')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    scanner = EndOfDataScanner()
+    parts = []
+    remaining = max_bytes
+    reason = STOP_COMPLETE
+
+    for chunk in chunks:
+        if len(chunk) >= remaining:
+            chunk = chunk[:remaining]
+            reason = STOP_SIZE_LIMIT
+        remaining -= len(chunk)
+        text = decoder.decode(chunk)
+        parts.append(text)
+        if scanner.feed(text):
+            reason = STOP_END_OF_DATA
+            break
+        if reason == STOP_SIZE_LIMIT:
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            raise FetchError(FAILURE_TIMEOUT, 'La lectura de la respuesta excedió el tiempo total')
+
+    parts.append(decoder.decode(b'', final=True))
+    metrics.SAT_READ.inc(motivo=reason)
+    return ''.join(parts)
+
+
+def drain(chunks: Iterable[bytes], max_bytes: int = DRAIN_BYTES) -> bool:
+    """
+    Consume lo que quede del cuerpo (tras read_text) si es poco. True si se agotó y
+    la conexión puede reutilizarse; False si hay que cerrarla
+    """
+    remaining = max_bytes
+    for chunk in chunks:
+        remaining -= len(chunk)
+        if remaining < 0:
+            return False
+    return True
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Re-verificación incremental de contribuyentes ya procesados
+
+Toma las URLs de validación (token D3) de ejecuciones anteriores y vuelve a
+consultar al SAT sin abrir ningún PDF: no hay render ni decodificación QR, solo
+red. Los registros se ordenan por prioridad (antigüedad de la última verificación
+por riesgo), las consultas se limitan a una tasa configurable y solo se emiten los
+registros cuyos datos del SAT cambiaron.
+
+Entradas aceptadas: JSONL de `cli.py process --jsonl` (o del estado de una
+re-verificación anterior), CSV con columna `url` y texto con una URL por línea.
+"""
+
+import csv
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+
+# Campos que vienen de la página del SAT (los únicos que puede cambiar una re-verificación)
+WEB_FIELD_PREFIX = 'web_'
+
+# Formato de fecha_extraccion y de las fechas de la página del SAT
+EXTRACTION_FORMAT = '%Y-%m-%d %H:%M:%S'
+SAT_DATE_FORMAT = '%d-%m-%Y'
+
+# Antigüedad supuesta (días) para registros sin fecha de verificación
+UNKNOWN_AGE_DAYS = 3650
+
+# Riesgo: multiplicador de la antigüedad
+RISK_BASE = 1.0
+RISK_FAILED = 3.0  # la última consulta falló o nunca se verificó
+RISK_NOT_ACTIVE = 1.0  # situación distinta de ACTIVO (suspendido, cancelado, ...)
+RISK_RECENT_CHANGE = 0.5  # cambio de situación en los últimos RECENT_CHANGE_DAYS
+RECENT_CHANGE_DAYS = 180
+
+# Campos de reporte que agrega Reverifier (no son datos del contribuyente)
+REPORT_FIELDS = ('cambio', 'campos_cambiados', 'valores_anteriores', 'error', 'tipo_fallo')
+
+_TOKEN_PATTERN = re.compile(r'D3=(\d+_[A-Z0-9]+)', re.IGNORECASE)
+
+
+def record_key(record: Dict) -> str:
+    """
+    Identidad del contribuyente: el token D3 de la URL (o la URL completa)
+    """
+    url = record.get('url', '')
+    match = _TOKEN_PATTERN.search(url)
+    return match.group(1).upper() if match else url
+
+
+def _parse_date(value: str, fmt: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(value.strip(), fmt)
+    except (AttributeError, ValueError):
+        return None
+
+
+def load_records(paths: Iterable[str]) -> List[Dict]:
+    """
+    Registros con URL de validación de los archivos dados. Si un contribuyente
+    aparece varias veces se conserva el registro verificado más recientemente
+    """
+    records: Dict[str, Dict] = {}
+    for path in paths:
+        for record in read_records(path):
+            url = record.get('url', '')
+            if not url.startswith('http'):
+                continue
+            key = record_key(record)
+            current = records.get(key)
+            if current is None or record.get('fecha_extraccion', '') >= current.get('fecha_extraccion', ''):
+                records[key] = record
+    return list(records.values())
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    """
+    Registros de un archivo JSONL, CSV o de texto (una URL por línea)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if extension == '.jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == '.csv':
+            for row in csv.DictReader(f):
+                # Hoja "Datos Web" exportada a CSV
+                if 'url' not in row and 'URL Original' in row:
+                    row['url'] = row['URL Original']
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield {'url': line.strip()}
+
+
+def age_days(record: Dict, now: Optional[datetime] = None) -> float:
+    checked = _parse_date(record.get('fecha_extraccion', ''), EXTRACTION_FORMAT)
+    if checked is None:
+        return UNKNOWN_AGE_DAYS
+    return max(((now or datetime.now()) - checked).total_seconds() / 86400, 0.0)
+
+
+def risk_score(record: Dict, now: Optional[datetime] = None) -> float:
+    """
+    Multiplicador de prioridad: registros fallidos, no activos o con cambios
+    recientes de situación se re-verifican antes
+    """
+    if record.get('scraping_exitoso') != 'True':
+        return RISK_FAILED
+    risk = RISK_BASE
+    situation = record.get('web_situacion_contribuyente', '').strip().upper()
+    if situation and situation != 'ACTIVO':
+        risk += RISK_NOT_ACTIVE
+    changed = _parse_date(record.get('web_fecha_ultimo_cambio', ''), SAT_DATE_FORMAT)
+    if changed is not None and ((now or datetime.now()) - changed).days <= RECENT_CHANGE_DAYS:
+        risk += RISK_RECENT_CHANGE
+    return risk
+
+
+def priority(record: Dict, now: Optional[datetime] = None) -> float:
+    return age_days(record, now) * risk_score(record, now)
+
+
+def schedule(records: Iterable[Dict], min_age_days: float = 0, limit: Optional[int] = None,
+             now: Optional[datetime] = None) -> List[Dict]:
+    """
+    Registros a re-verificar, de mayor a menor prioridad
+    """
+    now = now or datetime.now()
+    due = [record for record in records if age_days(record, now) >= min_age_days]
+    due.sort(key=lambda record: priority(record, now), reverse=True)
+    return due[:limit] if limit is not None else due
+
+
+def diff_record(previous: Dict, current: Dict,
+                prefixes: Tuple[str, ...] = (WEB_FIELD_PREFIX,)) -> Dict[str, Tuple[str, str]]:
+    """
+    Campos con esos prefijos (por defecto los del SAT) que cambiaron: {campo: (anterior, actual)}
+    """
+    fields = [key for key in dict.fromkeys(list(previous) + list(current)) if key.startswith(prefixes)]
+    return {field: (previous.get(field, ''), current.get(field, ''))
+            for field in fields if previous.get(field, '') != current.get(field, '')}
+
+
+class RateLimiter:
+    """
+    Cubeta de fichas: como máximo rate solicitudes por segundo con ráfagas de burst
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class Reverifier:
+    """
+    Vuelve a consultar al SAT los registros programados con workers hilos y a
+    una tasa máxima de rate solicitudes por segundo
+    """
+
+    def __init__(self, scraper, workers: int = 8, rate: float = 5.0, burst: Optional[int] = None):
+        self.scraper = scraper
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(rate, burst or self.workers)
+
+    def _verify(self, record: Dict) -> Dict:
+        record = {key: value for key, value in record.items() if key not in REPORT_FIELDS}
+        self.limiter.acquire()
+        current = self.scraper.scrape_sat_data(record['url'], record.get('archivo_pdf', ''))
+        if current.get('scraping_exitoso') != 'True':
+            # Un fallo no borra los datos conocidos: se reintenta con prioridad la próxima vez
+            metrics.REVERIFY.inc(resultado='fallo')
+            return dict(record, cambio='fallo', error=current.get('error', ''),
+                        tipo_fallo=current.get('tipo_fallo', ''))
+
+        changes = diff_record(record, current)
+        updated = dict(record)
+        updated.update((key, value) for key, value in current.items() if key not in ('archivo_pdf', 'error'))
+        if changes:
+            metrics.REVERIFY.inc(resultado='cambiado')
+            updated['cambio'] = 'cambiado'
+            updated['campos_cambiados'] = ', '.join(changes)
+            updated['valores_anteriores'] = {field: old for field, (old, _) in changes.items()}
+        else:
+            metrics.REVERIFY.inc(resultado='sin_cambios')
+            updated['cambio'] = 'sin_cambios'
+        return updated
+
+    def run(self, records: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Entrega cada registro re-verificado conforme termina, con 'cambio' en
+        cambiado / sin_cambios / fallo. Solo mantiene en vuelo 2 × workers registros
+        """
+        pending = set()
+        records = iter(records)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='csf-reverify') as pool:
+            for record in records:
+                pending.add(pool.submit(self._verify, record))
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Archivo local de las páginas del SAT descargadas, para volver a parsear sin red
+
+Cada respuesta HTML se guarda comprimida (zstd si está instalado `zstandard`, si no
+gzip) en un almacén direccionado por contenido: el nombre del objeto es el SHA-256
+del HTML, así que una página idéntica descargada mil veces ocupa un solo objeto.
+Un índice SQLite registra cada captura por token D3 y hora de descarga.
+
+También guarda la capa de texto de cada PDF procesado (con la URL de su QR) para
+volver a extraer los campos pdf_* sin abrir el PDF (ver bulk_reparse.py).
+
+Estructura:
+    <raiz>/indice.sqlite
+    <raiz>/objetos/ab/abcdef....html.zst   (o .html.gz; .txt.* para textos de PDF)
+"""
+
+import gzip
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Iterator, NamedTuple, Optional
+
+# zstandard es opcional y se importa al crear el archivo (ver _zstd)
+
+_TOKEN_PATTERN = re.compile(r'D3=(\d+_[A-Z0-9]+)', re.IGNORECASE)
+
+CODEC_ZSTD = 'zst'
+CODEC_GZIP = 'gz'
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+
+def url_token(url: str) -> str:
+    """
+    Token D3 (registro_RFC) de una URL de validación, o la URL completa si no lo tiene
+    """
+    match = _TOKEN_PATTERN.search(url)
+    return match.group(1).upper() if match else url
+
+
+def html_digest(html: str) -> str:
+    """
+    Dirección de un HTML en el archivo (mismo hash que CachedPage.content_hash)
+    """
+    return hashlib.sha256(html.encode('utf-8', errors='ignore')).hexdigest()
+
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+class Capture(NamedTuple):
+    token: str
+    url: str
+    fetched_at: float
+    digest: str
+
+
+class PdfText(NamedTuple):
+    pdf_hash: str
+    filename: str
+    token: str
+    url: str
+    saved_at: float
+    digest: str
+
+
+class SATArchive:
+    """
+    Almacén de páginas del SAT y textos de PDF; seguro entre hilos
+    """
+
+    def __init__(self, root: str, codec: Optional[str] = None):
+        import sqlite3
+
+        self.root = root
+        os.makedirs(os.path.join(root, 'objetos'), exist_ok=True)
+        self._zstd = _zstd()
+        self.codec = codec or (CODEC_ZSTD if self._zstd is not None else CODEC_GZIP)
+        if self.codec == CODEC_ZSTD and self._zstd is None:
+            raise ImportError('El códec zst requiere el paquete zstandard')
+
+        self._conn = sqlite3.connect(os.path.join(root, 'indice.sqlite'), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS capturas '
+                               '(token TEXT, url TEXT, descargada REAL, hash TEXT, codec TEXT)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS capturas_token ON capturas (token, descargada)')
+            # Una fila por PDF (hash de sus bytes): la extracción de texto es determinista
+            self._conn.execute('CREATE TABLE IF NOT EXISTS textos_pdf (pdf_hash TEXT PRIMARY KEY, archivo TEXT, '
+                               'token TEXT, url TEXT, guardado REAL, hash TEXT, codec TEXT)')
+
+    def _object_path(self, digest: str, codec: str, kind: str = 'html') -> str:
+        return os.path.join(self.root, 'objetos', digest[:2], f'{digest}.{kind}.{codec}')
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == CODEC_ZSTD:
+            return self._zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+    def _decompress(self, data: bytes, codec: str) -> bytes:
+        if codec == CODEC_ZSTD:
+            if self._zstd is None:
+                raise ImportError('El objeto está comprimido con zstd: instala zstandard')
+            return self._zstd.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def put(self, url: str, html: str, fetched_at: Optional[float] = None, digest: Optional[str] = None) -> str:
+        """
+        Guarda una captura y retorna la dirección de su HTML (solo escribe el objeto si es nuevo)
+        """
+        digest = digest or html_digest(html)
+        codec = self._write_object(digest, html, 'html')
+        with self._lock, self._conn:
+            self._conn.execute('INSERT INTO capturas (token, url, descargada, hash, codec) VALUES (?, ?, ?, ?, ?)',
+                               (url_token(url), url, fetched_at if fetched_at is not None else time.time(),
+                                digest, codec))
+        return digest
+
+    def put_pdf_text(self, pdf_hash: str, filename: str, url: Optional[str], text: str) -> str:
+        """
+        Guarda la capa de texto de un PDF (pdf_hash: SHA-256 de sus bytes) y la URL de su QR
+        """
+        digest = html_digest(text)
+        codec = self._write_object(digest, text, 'txt')
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO textos_pdf (pdf_hash, archivo, token, url, guardado, hash, codec) '
+                               'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (pdf_hash, filename, url_token(url) if url else '', url or '', time.time(),
+                                digest, codec))
+        return digest
+
+    def _write_object(self, digest: str, text: str, kind: str) -> str:
+        """
+        Escribe el objeto si es nuevo y retorna su códec
+        """
+        codec = self._existing_codec(digest, kind)
+        if codec is None:
+            codec = self.codec
+            path = self._object_path(digest, codec, kind)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Escritura atómica: un lector nunca ve un objeto a medias
+            temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(self._compress(text.encode('utf-8', errors='ignore')))
+            os.replace(temp_path, path)
+        return codec
+
+    def _existing_codec(self, digest: str, kind: str = 'html') -> Optional[str]:
+        for codec in (CODEC_ZSTD, CODEC_GZIP):
+            if os.path.exists(self._object_path(digest, codec, kind)):
+                return codec
+        return None
+
+    def get(self, digest: str, kind: str = 'html') -> str:
+        """
+        Contenido de un objeto: kind 'html' para páginas del SAT, 'txt' para textos de PDF
+        """
+        codec = self._existing_codec(digest, kind)
+        if codec is None:
+            raise KeyError(digest)
+        with open(self._object_path(digest, codec, kind), 'rb') as f:
+            return self._decompress(f.read(), codec).decode('utf-8', errors='ignore')
+
+    def captures(self, latest_only: bool = True, token: Optional[str] = None) -> Iterator[Capture]:
+        """
+        Capturas en orden de token y hora; con latest_only solo la más reciente de cada token
+        """
+        if latest_only:
+            query = ('SELECT token, url, MAX(descargada), hash FROM capturas '
+                     + ('WHERE token = ? ' if token else '') + 'GROUP BY token ORDER BY token')
+        else:
+            query = ('SELECT token, url, descargada, hash FROM capturas '
+                     + ('WHERE token = ? ' if token else '') + 'ORDER BY token, descargada')
+        with self._lock:
+            rows = self._conn.execute(query, (token.upper(),) if token else ()).fetchall()
+        for row in rows:
+            yield Capture(*row)
+
+    def pdf_texts(self) -> Iterator[PdfText]:
+        """
+        Textos de PDF archivados, en orden de token
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT pdf_hash, archivo, token, url, guardado, hash FROM textos_pdf '
+                                      'ORDER BY token, guardado').fetchall()
+        for row in rows:
+            yield PdfText(*row)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM capturas').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,48 +1,124 @@
 #!/usr/bin/env python3
 """
 Clase del scraper del SAT optimizada para Streamlit Cloud
+
+Las dependencias pesadas (fitz, cv2, numpy, PIL, bs4, requests, urllib3, openpyxl)
+se importan dentro del método que las usa: importar este módulo es casi gratis y
+cada etapa solo carga lo que necesita.
 """
 
-import fitz  # PyMuPDF
-import cv2
-import numpy as np
-from PIL import Image
 import io
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
 import time
 import re
 from datetime import datetime
-import urllib3
 import warnings
 import ssl
 import subprocess
 import sys
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from functools import lru_cache
 import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+import qr_preprocessing
+from qr_decoders import QRDecoderChain
+from response_reader import CHUNK_SIZE, MAX_RESPONSE_BYTES, drain, read_text
+from sat_archive import SATArchive, html_digest
+from scrape_cache import (DEFAULT_NEGATIVE_TTL, EXPIRED, FAILURE_EMPTY, FAILURE_HTTP, FAILURE_INVALID_TOKEN,
+                          FAILURE_MESSAGES, FAILURE_TIMEOUT, FRESH, STALE, CachedPage, FetchError,
+                          FreshnessPolicy, NegativeCache, NotModified, ScrapeStore, classify_exception,
+                          is_invalid_token_page, response_validators, summarize_failures)
+from timing import Diagnostics, collect_stage_timings, histogram, percentile, record
+
+# Etapas seleccionables del procesamiento de un PDF
+STAGE_QR = 'qr'
+STAGE_PDF_TEXT = 'pdf_text'
+STAGE_WEB = 'web'
+ALL_STAGES = frozenset({STAGE_QR, STAGE_PDF_TEXT, STAGE_WEB})
+
+# URL de validación de una CSF (la misma forma que codifica el QR)
+VALIDATION_URL_PATTERN = re.compile(r'https?://[^\s"\'<>]+?D3=\d+_[A-Z0-9]+', re.IGNORECASE)
+# Token D3 (número de registro y RFC); con la misma tolerancia a mayúsculas que la URL
+D3_TOKEN_PATTERN = re.compile(r'D3=(\d+)_([A-Z0-9]+)', re.IGNORECASE)
+_PARAM_NAME_PATTERN = re.compile(r'([?&])(d[123])=')
+
+def normalize_validation_url(url: str) -> str:
+    """
+    URL de validación en la forma que codifica el QR: parámetros D1-D3 y RFC en mayúsculas
+    """
+    url = _PARAM_NAME_PATTERN.sub(lambda m: m.group(1) + m.group(2).upper() + '=', url)
+    return D3_TOKEN_PATTERN.sub(lambda m: f'D3={m.group(1)}_{m.group(2).upper()}', url)
+
+# Hojas del archivo Excel, en orden
+EXCEL_SHEETS = ('Resumen Scraping', 'Datos Extraídos', 'Datos del PDF', 'Estadísticas')
+
+def normalize_stages(stages=None) -> frozenset:
+    """
+    Valida un conjunto de etapas; None significa todas las etapas
+    """
+    if stages is None:
+        return ALL_STAGES
+
+    stages = frozenset(stages)
+    unknown = stages - ALL_STAGES
+    if unknown:
+        raise ValueError(f"Etapas desconocidas: {', '.join(sorted(unknown))}")
+    return stages
 
 class SATScraper:
     def __init__(self):
         self.results = []
-        self.qr_detector = cv2.QRCodeDetector()
+        self._thread_local = threading.local()
         self.setup_ssl_bypass()
 
         # Cache para sesiones HTTP y resultados
         self._session_cache = {}
-        self._scraping_cache = {}
+        self._session_lock = threading.Lock()
+        self._scraping_cache: Dict[str, CachedPage] = {}
+        self._store: Optional[ScrapeStore] = None  # persistencia opcional (use_cache_db)
+        self._refresh_pool: Optional[ThreadPoolExecutor] = None
+        self._archive: Optional[SATArchive] = None  # archivo de páginas opcional (use_archive)
+        self.freshness = FreshnessPolicy()
+        self._curl_available = None
+
+        # Fallos recientes por clave de cache, con TTL (s) por clase de fallo (0 = no cachear)
+        self.negative_cache_ttl = dict(DEFAULT_NEGATIVE_TTL)
+        self._negative_cache = NegativeCache(self.negative_cache_ttl)
+
+        # Descargas en curso por clave de cache (single-flight)
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
 
         # Configuración optimizada para Streamlit Cloud
         self.max_retries = 2
         self.request_timeout = 15  # Reducido de 30s
         self.delay_between_requests = 0.5  # Reducido de 1s
+        self.http_pool_size = 32  # Conexiones keep-alive por host en la sesión compartida
+        self.max_response_bytes = MAX_RESPONSE_BYTES  # Tope de lectura por respuesta del SAT
+
+        # Agregar result['diagnostico'] con tiempos por etapa
+        self.collect_diagnostics = False
+        self.last_export_ms = None
+        self._qr_decoder = None
+
+    @property
+    def qr_decoder(self) -> QRDecoderChain:
+        """
+        Cadena de decodificadores QR (el backend más rápido primero; instancias por hilo)
+        """
+        if self._qr_decoder is None:
+            with self._session_lock:
+                if self._qr_decoder is None:
+                    self._qr_decoder = QRDecoderChain()
+        return self._qr_decoder
 
     def setup_ssl_bypass(self):
         """
         Configura múltiples estrategias para bypass SSL
+        (los avisos de urllib3 se desactivan en las estrategias que lo cargan)
         """
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         warnings.filterwarnings('ignore')
 
         try:
@@ -50,15 +126,31 @@ class SATScraper:
         except:
             pass
 
-    def extract_qr_from_pdf(self, pdf_bytes: bytes, filename: str) -> Optional[str]:
+    def extract_qr_from_pdf(self, pdf_bytes: bytes, filename: str,
+                            diagnostics: Optional[Diagnostics] = None) -> Optional[str]:
         """
         Extrae el código QR de la primera página de un PDF desde bytes
         """
+        return self._decode_qr_from_pdf(pdf_bytes, filename, diagnostics)[0]
+
+    def _decode_qr_from_pdf(self, pdf_bytes: bytes, filename: str,
+                            diagnostics: Optional[Diagnostics] = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Como extract_qr_from_pdf, pero retorna también el backend que decodificó: (url, backend)
+        """
         try:
+            import fitz  # PyMuPDF
+            import cv2
+            import numpy as np
+            from PIL import Image
+
+            start = time.perf_counter()
             doc = fitz.open(stream=pdf_bytes, filetype="pdf")
             page = doc[0]  # type: ignore
+            record(diagnostics, 'apertura', start)
 
-            mat = fitz.Matrix(3, 3)
+            start = time.perf_counter()
+            mat = fitz.Matrix(qr_preprocessing.QR_RENDER_SCALE, qr_preprocessing.QR_RENDER_SCALE)
             pix = page.get_pixmap(matrix=mat)  # type: ignore
             img_data = pix.tobytes("png")
 
@@ -69,44 +161,59 @@ class SATScraper:
                 gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
             else:
                 gray = img_array
-
-            data, bbox, _ = self.qr_detector.detectAndDecode(gray)
+            record(diagnostics, 'renderizado', start)
+
+            start = time.perf_counter()
+            data, backend = self.qr_decoder.decode(gray)
+            qr_preprocessing.record_attempt(qr_preprocessing.BASE_RUNG, bool(data), time.perf_counter() - start)
+            record(diagnostics, 'decodificacion_qr', start)
+            rung = qr_preprocessing.BASE_RUNG
+
+            # Escalera de preprocesamiento: solo si el render base no decodificó
+            if not data:
+                start = time.perf_counter()
+                ctx = qr_preprocessing.LadderContext(page, gray)
+                data, backend, rung = qr_preprocessing.run_ladder(self.qr_decoder.decode, ctx)
+                record(diagnostics, 'escalera_qr', start)
             doc.close()
 
             if data:
-                return data
+                if diagnostics is not None:
+                    diagnostics.set('decodificador_qr', backend)
+                    diagnostics.set('peldano_qr', rung)
+                return data, backend
             else:
-                return None
+                return None, None
 
         except Exception as e:
             print(f"Error procesando {filename}: {str(e)}")
-            return None
+            return None, None
 
-    def _fallback_text_search(self, pdf_bytes: bytes) -> Optional[str]:
+    def _fallback_text_search(self, pdf_bytes: bytes,
+                              diagnostics: Optional[Diagnostics] = None) -> Optional[str]:
         """
-        Método de fallback cuando no hay pyzbar disponible
+        Busca la URL de validación sin rasterizar: enlaces de la primera página y su capa de texto
         """
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            page = doc[0]  # type: ignore
-
-            # Buscar anotaciones de tipo link
-            for annot in page.annots():
-                if "uri" in annot:
-                    uri = annot["uri"]
-                    if "sat.gob.mx" in uri or "qr" in uri.lower():
-                        doc.close()
-                        return uri
+            import fitz  # PyMuPDF
 
-            # Buscar en el texto URLs del SAT
-            text = page.get_text()
-            sat_urls = re.findall(r'https?://[^\\s\\n]*sat\\.gob\\.mx[^\\s\\n]*', text)
-            if sat_urls:
+            start = time.perf_counter()
+            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            try:
+                page = doc[0]  # type: ignore
+
+                # Buscar enlaces URI (en PyMuPDF los links no aparecen en page.annots())
+                for link in page.get_links():
+                    match = VALIDATION_URL_PATTERN.search(link.get('uri') or '')
+                    if match:
+                        return normalize_validation_url(match.group(0))
+
+                # Buscar la URL en la capa de texto
+                match = VALIDATION_URL_PATTERN.search(page.get_text())
+                return normalize_validation_url(match.group(0)) if match else None
+            finally:
                 doc.close()
-                return sat_urls[0]
-
-            doc.close()
-            return None
+                record(diagnostics, 'busqueda_vectorial', start)
 
         except Exception:
             return None
@@ -116,6 +223,8 @@ class SATScraper:
         Extrae el código QR de imágenes en el PDF (fallback)
         """
         try:
+            import fitz  # PyMuPDF
+
             doc = fitz.open(stream=pdf_bytes, filetype="pdf")
             page = doc[0]  # type: ignore
 
@@ -155,6 +264,8 @@ class SATScraper:
         Método de fallback para extraer URLs del SAT del PDF
         """
         try:
+            import fitz  # PyMuPDF
+
             doc = fitz.open(stream=pdf_bytes, filetype="pdf")
 
             # Buscar en todo el texto del PDF
@@ -167,10 +278,10 @@ class SATScraper:
 
             # Patrones de búsqueda de URLs del SAT
             patterns = [
-                r'https://siat\.sat\.gob\.mx/app/qr/faces/pages/mobile/[^\\s\\n\']*',
-                r'https://[^\\s]*sat\.gob\.mx[^\\s\\n]*',
-                r'[^\\s]*qr[^\\s]*sat[^\\s]*gob[^\\s]*mx[^\\s]*',
-                r'D1=\\d+&D2=\\d+&D3=[^\\s]*_[^\\s]*'
+                r'https://siat\.sat\.gob\.mx/app/qr/faces/pages/mobile/[^\s\']*',
+                r'https://[^\s]*sat\.gob\.mx[^\s]*',
+                r'[^\s]*qr[^\s]*sat[^\s]*gob[^\s]*mx[^\s]*',
+                r'D1=\d+&D2=\d+&D3=[^\s]*_[^\s]*'
             ]
 
             for pattern in patterns:
@@ -204,6 +315,8 @@ class SATScraper:
         }
 
         try:
+            import fitz  # PyMuPDF
+
             doc = fitz.open(stream=pdf_bytes, filetype="pdf")
             debug_info['can_open_pdf'] = True
             debug_info['num_pages'] = len(doc)
@@ -215,14 +328,13 @@ class SATScraper:
 
                 # Buscar anotaciones
                 try:
-                    annotations = page.annots()
-                    debug_info['annotations_found'] = len(annotations)
+                    debug_info['annotations_found'] = len(list(page.annots()))
                 except:
                     debug_info['annotations_found'] = 0
 
                 # Buscar URLs del SAT en el texto
                 text = page.get_text()
-                sat_urls = re.findall(r'https?://[^\\s\\n]*sat\\.gob\\.mx[^\\s\\n]*', text)
+                sat_urls = re.findall(r'https?://\S*sat\.gob\.mx\S*', text)
                 debug_info['sat_urls_in_text'] = sat_urls
 
             doc.close()
@@ -261,59 +373,254 @@ class SATScraper:
         """
         return hashlib.md5(url.encode()).hexdigest()
 
-    def scrape_sat_data(self, url: str, pdf_filename: str) -> Dict:
+    def scrape_sat_data(self, url: str, pdf_filename: str, diagnostics: Optional[Diagnostics] = None) -> Dict:
         """
-        Intenta hacer scraping de la URL del SAT usando múltiples estrategias con caching
+        Intenta hacer scraping de la URL del SAT usando múltiples estrategias con caching.
+        Las consultas simultáneas a la misma URL se agrupan: solo la primera descarga y
+        las demás esperan y comparten su resultado (single-flight). Las páginas en cache
+        se sirven según self.freshness: frescas tal cual, obsoletas mientras se revalidan
+        en segundo plano y vencidas tras volver a consultar (con solicitud condicional)
         """
-        # Verificar cache primero
         cache_key = self._get_url_cache_key(url)
-        if cache_key in self._scraping_cache:
-            cached_result = self._scraping_cache[cache_key].copy()
+
+        # Verificar cache (positivo y negativo) primero; si ya hay una descarga en curso, unirse a ella
+        with self._inflight_lock:
+            page = self._get_cached_page(cache_key)
+            state = self.freshness.state(page) if page is not None else None
+            negative = self._negative_cache.get(cache_key)
+            refresh = None
+            if state in (FRESH, STALE):
+                cached = page.result
+                # Revalidar en segundo plano (una sola vez y no si acaba de fallar)
+                if state == STALE and negative is None and cache_key not in self._inflight:
+                    refresh = self._inflight[cache_key] = Future()
+            else:
+                cached = negative
+            if cached is None:
+                flight = self._inflight.get(cache_key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[cache_key] = Future()
+
+        if cached is not None:
+            if refresh is not None:
+                self._get_refresh_pool().submit(self._lead_fetch, cache_key, url, 'cached', None, page, refresh)
+            metrics.SCRAPE_CACHE.inc(resultado='negativo' if cached is negative else 'hit' if state == FRESH else state)
+            cached_result = cached.copy()
             cached_result['archivo_pdf'] = pdf_filename  # Actualizar nombre del archivo
             return cached_result
 
+        if not leader:
+            metrics.SCRAPE_CACHE.inc(resultado='compartido')
+            start = time.perf_counter()
+            shared_result = flight.result().copy()
+            record(diagnostics, 'espera_compartida', start)
+            shared_result['archivo_pdf'] = pdf_filename
+            return shared_result
+
+        metrics.SCRAPE_CACHE.inc(resultado='miss' if page is None else EXPIRED)
+        return self._lead_fetch(cache_key, url, pdf_filename, diagnostics, page, flight)
+
+    def _lead_fetch(self, cache_key: str, url: str, pdf_filename: str, diagnostics: Optional[Diagnostics],
+                    previous: Optional[CachedPage], flight: Future) -> Dict:
+        """
+        Descarga como líder de self._inflight[cache_key]: guarda el resultado en cache y
+        lo publica a quienes esperan en flight
+        """
+        try:
+            sat_data, page = self._fetch_sat_data(url, pdf_filename, diagnostics, previous)
+        except BaseException as e:
+            with self._inflight_lock:
+                del self._inflight[cache_key]
+            flight.set_exception(e)
+            raise
+
+        with self._inflight_lock:
+            if page is not None:
+                self._put_cached_page(cache_key, page)
+                self._negative_cache.discard(cache_key)
+            elif sat_data.get('tipo_fallo'):
+                # Cache negativo: el TTL depende de la clase de fallo
+                cache_data = sat_data.copy()
+                cache_data['archivo_pdf'] = 'cached'  # Marcador genérico
+                self._negative_cache.put(cache_key, sat_data['tipo_fallo'], cache_data)
+            del self._inflight[cache_key]
+        flight.set_result(sat_data)
+
+        return sat_data
+
+    def _get_cached_page(self, cache_key: str) -> Optional[CachedPage]:
+        page = self._scraping_cache.get(cache_key)
+        if page is None and self._store is not None:
+            page = self._store.get(cache_key)
+            if page is not None:
+                self._scraping_cache[cache_key] = page
+        return page
+
+    def _put_cached_page(self, cache_key: str, page: CachedPage) -> None:
+        self._scraping_cache[cache_key] = page
+        if self._store is not None:
+            self._store.put(cache_key, page)
+
+    def _get_refresh_pool(self) -> ThreadPoolExecutor:
+        with self._session_lock:
+            if self._refresh_pool is None:
+                self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='csf-refresh')
+            return self._refresh_pool
+
+    def use_archive(self, root: str) -> None:
+        """
+        Guarda cada HTML descargado en un SATArchive para volver a parsearlo sin red
+        """
+        self._archive = SATArchive(root)
+
+    def use_cache_db(self, path: str) -> None:
+        """
+        Persiste el cache de páginas del SAT en SQLite (las re-ejecuciones lo reutilizan)
+        """
+        self._store = ScrapeStore(path)
+
+    def _fetch_sat_data(self, url: str, pdf_filename: str, diagnostics: Optional[Diagnostics] = None,
+                        previous: Optional[CachedPage] = None) -> Tuple[Dict, Optional[CachedPage]]:
+        """
+        Descarga y parsea la página del SAT probando las estrategias en orden (sin cache).
+        Con previous se envía una solicitud condicional y, si la página no cambió, se
+        reutiliza el resultado guardado sin parsear. Retorna (resultado, página para
+        el cache); si falla, la página es None y result['tipo_fallo'] indica la clase
+        de fallo (ver scrape_cache)
+        """
         sat_data = {
             'archivo_pdf': pdf_filename,
             'url': url,
             'fecha_extraccion': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
 
-        # Extraer RFC de la URL
-        rfc_match = re.search(r'D3=(\d+)_([A-Z0-9]+)', url)
-        if rfc_match:
-            sat_data['numero_registro'] = rfc_match.group(1)
-            sat_data['rfc'] = rfc_match.group(2)
+        # Extraer RFC de la URL (sin token D3 no tiene caso consultar al SAT)
+        rfc_match = D3_TOKEN_PATTERN.search(url)
+        if not rfc_match:
+            return self._failed(sat_data, FAILURE_INVALID_TOKEN), None
+        sat_data['numero_registro'] = rfc_match.group(1)
+        sat_data['rfc'] = rfc_match.group(2).upper()
 
         # Intentar scraping con múltiples estrategias
         html_content = None
+        validators = {}
+        failures = []
+        conditional = previous.conditional_headers() if previous is not None else None
+
+        strategies = [
+            ('estrategia1', self._fetch_strategy1),
+            ('estrategia2', self._fetch_strategy2),
+            ('estrategia3', self._fetch_strategy3),
+            ('estrategia4', self._fetch_strategy4),
+        ]
 
-        if not html_content:
-            html_content = self.scrape_sat_url_strategy1(url)
+        for name, strategy in strategies:
+            if name == 'estrategia2' and not self.install_curl_if_needed():
+                continue
 
-        if not html_content and self.install_curl_if_needed():
-            html_content = self.scrape_sat_url_strategy2(url)
+            start = time.perf_counter()
+            try:
+                html_content, validators = strategy(url, conditional)
+                if not html_content or not html_content.strip():
+                    raise FetchError(FAILURE_EMPTY, 'Respuesta vacía')
+            except NotModified:
+                if previous is None:
+                    # 304 sin solicitud condicional (p. ej. un proxy intermedio): no hay página que reutilizar
+                    html_content = None
+                    failures.append(FAILURE_HTTP)
+                else:
+                    record(diagnostics, name, start)
+                    metrics.FETCH_STRATEGY.inc(estrategia=name, resultado='no_modificado')
+                    return self._revalidated(previous, sat_data, diagnostics, 'no_modificado',
+                                             previous.etag, previous.last_modified)
+            except Exception as e:
+                html_content = None
+                failures.append(classify_exception(e))
+            record(diagnostics, name, start)
+            metrics.SAT_LATENCY.observe(time.perf_counter() - start, estrategia=name)
+            metrics.FETCH_STRATEGY.inc(estrategia=name, resultado='ok' if html_content else 'fallo')
 
-        if not html_content:
-            html_content = self.scrape_sat_url_strategy3(url)
+            if html_content:
+                if diagnostics is not None:
+                    diagnostics.set('estrategia', name)
+                break
 
         if not html_content:
-            html_content = self.scrape_sat_url_strategy4(url)
+            return self._failed(sat_data, summarize_failures(failures, self.negative_cache_ttl)), None
 
-        if html_content:
-            parsed_data = self.parse_sat_content(html_content)
-            sat_data.update(parsed_data)
-            sat_data['scraping_exitoso'] = 'True'
-        else:
-            sat_data['scraping_exitoso'] = 'False'
-            sat_data['error'] = 'No se pudo acceder al contenido con ninguna estrategia'
+        content_hash = html_digest(html_content)
+        if self._archive is not None:
+            try:
+                self._archive.put(url, html_content, digest=content_hash)
+            except Exception as e:
+                print(f"No se pudo archivar la página del SAT: {str(e)}")
+
+        # Mismo HTML que la versión guardada: no hace falta parsear
+        if previous is not None and previous.content_hash == content_hash:
+            return self._revalidated(previous, sat_data, diagnostics, 'sin_cambios',
+                                     validators.get('etag'), validators.get('last_modified'))
+
+        self._apply_page(sat_data, html_content, diagnostics)
+        if sat_data['scraping_exitoso'] != 'True':
+            return sat_data, None
+
+        # Crear copia para cache sin el nombre del archivo específico
+        cache_data = sat_data.copy()
+        cache_data['archivo_pdf'] = 'cached'  # Marcador genérico
+        page = CachedPage(cache_data, etag=validators.get('etag'), last_modified=validators.get('last_modified'),
+                          content_hash=content_hash)
+        return sat_data, page
+
+    def _apply_page(self, sat_data: Dict, html_content: str, diagnostics: Optional[Diagnostics] = None) -> Dict:
+        """
+        Parsea el HTML del SAT sobre sat_data (exitoso o con su clase de fallo)
+        """
+        if is_invalid_token_page(html_content):
+            return self._failed(sat_data, FAILURE_INVALID_TOKEN)
+
+        start = time.perf_counter()
+        parsed_data = self.parse_sat_content(html_content)
+        record(diagnostics, 'parseo', start)
+        if not parsed_data:
+            return self._failed(sat_data, FAILURE_EMPTY)
 
-        # Guardar en cache (solo si tuvo éxito para evitar cache de errores)
-        if sat_data.get('scraping_exitoso') == 'True':
-            # Crear copia para cache sin el nombre del archivo específico
-            cache_data = sat_data.copy()
-            cache_data['archivo_pdf'] = 'cached'  # Marcador genérico
-            self._scraping_cache[cache_key] = cache_data
+        sat_data.update(parsed_data)
+        sat_data['scraping_exitoso'] = 'True'
+        return sat_data
 
+    def reparse_html(self, url: str, html_content: str, fetched_at: float) -> Dict:
+        """
+        Resultado de scraping a partir de una página archivada (sin red)
+        """
+        sat_data = {
+            'archivo_pdf': 'archivo',
+            'url': url,
+            'fecha_extraccion': datetime.fromtimestamp(fetched_at).strftime('%Y-%m-%d %H:%M:%S')
+        }
+        rfc_match = D3_TOKEN_PATTERN.search(url)
+        if not rfc_match:
+            return self._failed(sat_data, FAILURE_INVALID_TOKEN)
+        sat_data['numero_registro'] = rfc_match.group(1)
+        sat_data['rfc'] = rfc_match.group(2).upper()
+        return self._apply_page(sat_data, html_content)
+
+    def _revalidated(self, previous: CachedPage, sat_data: Dict, diagnostics: Optional[Diagnostics],
+                     how: str, etag: Optional[str], last_modified: Optional[str]) -> Tuple[Dict, CachedPage]:
+        """
+        La página guardada sigue vigente: se reutiliza con nueva hora de descarga
+        """
+        if diagnostics is not None:
+            diagnostics.set('revalidacion', how)
+        cache_data = dict(previous.result, fecha_extraccion=sat_data['fecha_extraccion'])
+        page = CachedPage(cache_data, etag=etag or previous.etag, last_modified=last_modified or previous.last_modified,
+                          content_hash=previous.content_hash)
+        return dict(cache_data, archivo_pdf=sat_data['archivo_pdf']), page
+
+    def _failed(self, sat_data: Dict, kind: str) -> Dict:
+        sat_data['scraping_exitoso'] = 'False'
+        sat_data['tipo_fallo'] = kind
+        sat_data['error'] = FAILURE_MESSAGES[kind]
         return sat_data
 
     def decode_special_characters(self, text: str) -> str:
@@ -371,19 +678,34 @@ class SATScraper:
 
     def install_curl_if_needed(self) -> bool:
         """
-        Verifica si curl está disponible
+        Verifica si curl está disponible (se consulta una sola vez por scraper)
         """
-        try:
-            subprocess.run(['curl', '--version'], capture_output=True, check=True)
-            return True
-        except:
-            return False
+        if self._curl_available is None:
+            try:
+                subprocess.run(['curl', '--version'], capture_output=True, check=True)
+                self._curl_available = True
+            except:
+                self._curl_available = False
+        return self._curl_available
 
-    def scrape_sat_url_strategy1(self, url: str) -> Optional[str]:
+    def _get_http_session(self):
         """
-        Estrategia 1: Usar requests con SSL bypass
+        Sesión HTTP compartida (pool de conexiones keep-alive) creada una sola vez por scraper
         """
-        try:
+        session = self._session_cache.get('requests')
+        if session is not None:
+            return session
+
+        with self._session_lock:
+            session = self._session_cache.get('requests')
+            if session is not None:
+                return session
+
+            import requests
+            from requests.adapters import HTTPAdapter
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
             session = requests.Session()
             session.verify = False
 
@@ -400,9 +722,11 @@ class SATScraper:
                 'Cache-Control': 'max-age=0'
             })
 
+            pool_kwargs = {'pool_connections': self.http_pool_size, 'pool_maxsize': self.http_pool_size}
+            session.mount('http://', HTTPAdapter(**pool_kwargs))
+
             # Configurar SSL context para manejar claves DH pequeñas
             try:
-                from requests.adapters import HTTPAdapter
                 from urllib3.util.ssl_ import create_urllib3_context
                 import ssl
 
@@ -419,26 +743,20 @@ class SATScraper:
                         return super().init_poolmanager(*args, **kwargs)
 
                 # Montar el adaptador SSL para todos los requests HTTPS
-                session.mount('https://', SSLAdapter())
+                session.mount('https://', SSLAdapter(**pool_kwargs))
             except Exception as e:
                 # Si hay error con el adaptador personalizado, intentar SSL básico
-                try:
-                    import ssl
-                    ctx = ssl.create_default_context()
-                    ctx.check_hostname = False
-                    ctx.verify_mode = ssl.CERT_NONE
-                    ctx.set_ciphers('DEFAULT:@SECLEVEL=0')
-                    session.verify = False
-                except:
-                    pass
-
-            response = session.get(url, timeout=self.request_timeout)
+                session.mount('https://', HTTPAdapter(**pool_kwargs))
 
-            if response.status_code == 200:
-                return response.text
-            else:
-                return None
+            self._session_cache['requests'] = session
+            return session
 
+    def scrape_sat_url_strategy1(self, url: str) -> Optional[str]:
+        """
+        Estrategia 1: Usar requests con SSL bypass (sesión compartida)
+        """
+        try:
+            return self._fetch_strategy1(url)[0]
         except Exception:
             return None
 
@@ -447,26 +765,7 @@ class SATScraper:
         Estrategia 2: Usar curl como subprocess
         """
         try:
-            curl_command = [
-                'curl',
-                '-k',
-                '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                '--connect-timeout', str(self.request_timeout),
-                '--max-time', str(self.request_timeout * 2),
-                '--location',
-                '--compressed',
-                '--header', 'Accept-Charset: UTF-8',
-                '--header', 'Accept-Encoding: gzip, deflate',
-                url
-            ]
-
-            result = subprocess.run(curl_command, capture_output=True, text=True, encoding='utf-8', timeout=self.request_timeout * 2)
-
-            if result.returncode == 0 and result.stdout:
-                return result.stdout
-            else:
-                return None
-
+            return self._fetch_strategy2(url)[0]
         except Exception:
             return None
 
@@ -475,21 +774,7 @@ class SATScraper:
         Estrategia 3: Usar urllib con SSL context personalizado
         """
         try:
-            import urllib.request
-            import ssl
-
-            # Crear contexto SSL personalizado
-            ctx = ssl.create_default_context()
-            ctx.check_hostname = False
-            ctx.verify_mode = ssl.CERT_NONE
-
-            request = urllib.request.Request(url)
-            request.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-            request.add_header('Accept', 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8')
-
-            with urllib.request.urlopen(request, context=ctx, timeout=self.request_timeout) as response:
-                return response.read().decode('utf-8', errors='ignore')
-
+            return self._fetch_strategy3(url)[0]
         except Exception:
             return None
 
@@ -498,37 +783,144 @@ class SATScraper:
         Estrategia 4: Usar requests con SSL legacy
         """
         try:
-            import urllib3
-            urllib3.disable_warnings()
+            return self._fetch_strategy4(url)[0]
+        except Exception:
+            return None
 
-            http = urllib3.PoolManager(
-                cert_reqs='CERT_NONE',
-                assert_hostname=False,
-                timeout=urllib3.Timeout(connect=self.request_timeout, read=self.request_timeout)
-            )
+    # Las variantes _fetch_* lanzan excepciones (FetchError, NotModified o las de cada
+    # biblioteca) para que scrape_sat_data pueda clasificar el fallo. Retornan
+    # (html, validadores) y aceptan encabezados condicionales (If-None-Match, ...).
+    # El cuerpo se lee por partes con response_reader.read_text (tope de tamaño y tiempo)
 
-            response = http.request(
-                'GET',
-                url,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
-                }
-            )
+    def _read_deadline(self) -> float:
+        """
+        Plazo total de lectura de una respuesta (el timeout de cada biblioteca es por lectura)
+        """
+        return time.monotonic() + self.request_timeout * 2
+
+    def _fetch_strategy1(self, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[str, Dict]:
+        session = self._get_http_session()
+        deadline = self._read_deadline()
+        with session.get(url, timeout=self.request_timeout, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                raise NotModified()
+            if response.status_code != 200:
+                raise FetchError(FAILURE_HTTP, f'HTTP {response.status_code}')
+            chunks = response.iter_content(CHUNK_SIZE)
+            html = read_text(chunks, response.encoding, self.max_response_bytes, deadline)
+            # Cuerpo agotado: la conexión vuelve al pool al salir del with; si no, se cierra
+            drain(chunks)
+            return html, response_validators(response.headers)
+
+    def _fetch_strategy2(self, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[str, Dict]:
+        # curl no recibe encabezados condicionales: un 304 sin cuerpo no se distinguiría de una respuesta vacía
+        curl_command = [
+            'curl',
+            '-k',
+            '--fail',
+            '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            '--connect-timeout', str(self.request_timeout),
+            '--max-time', str(self.request_timeout * 2),
+            '--location',
+            '--compressed',
+            '--header', 'Accept-Charset: UTF-8',
+            '--header', 'Accept-Encoding: gzip, deflate',
+            url
+        ]
 
-            if response.status == 200:
-                return response.data.decode('utf-8', errors='ignore')
-            else:
-                return None
+        deadline = self._read_deadline()
+        process = subprocess.Popen(curl_command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            html = read_text(iter(lambda: process.stdout.read1(CHUNK_SIZE), b''), 'utf-8',
+                             self.max_response_bytes, deadline)
+        finally:
+            # Si la lectura terminó antes del final (fin de datos, tope o plazo) curl sobra
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+
+        # 22: estado HTTP >= 400 (--fail); el resto son errores de red o timeouts.
+        # Tras un corte anticipado el código es el de kill: el HTML leído es válido
+        if returncode == 22:
+            raise FetchError(FAILURE_HTTP, 'curl: error HTTP')
+        if returncode > 0:
+            raise FetchError(FAILURE_TIMEOUT, f'curl: código {returncode}')
+        return html, {}
+
+    def _fetch_strategy3(self, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[str, Dict]:
+        import urllib.error
+        import urllib.request
+        import ssl
+
+        # Crear contexto SSL personalizado
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+
+        request = urllib.request.Request(url)
+        request.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
+        request.add_header('Accept', 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8')
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
 
-        except Exception:
-            return None
+        try:
+            deadline = self._read_deadline()
+            with urllib.request.urlopen(request, context=ctx, timeout=self.request_timeout) as response:
+                html = read_text(iter(lambda: response.read(CHUNK_SIZE), b''), 'utf-8',
+                                 self.max_response_bytes, deadline)
+                return html, response_validators(response.headers)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                raise NotModified()
+            raise
+
+    def _fetch_strategy4(self, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[str, Dict]:
+        import urllib3
+        urllib3.disable_warnings()
+
+        http = urllib3.PoolManager(
+            cert_reqs='CERT_NONE',
+            assert_hostname=False,
+            timeout=urllib3.Timeout(connect=self.request_timeout, read=self.request_timeout)
+        )
+
+        deadline = self._read_deadline()
+        response = http.request(
+            'GET',
+            url,
+            headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                **(headers or {})
+            },
+            preload_content=False
+        )
+
+        reusable = False
+        try:
+            if response.status == 304:
+                raise NotModified()
+            if response.status != 200:
+                raise FetchError(FAILURE_HTTP, f'HTTP {response.status}')
+            chunks = response.stream(CHUNK_SIZE, decode_content=True)
+            html = read_text(chunks, 'utf-8', self.max_response_bytes, deadline)
+            reusable = drain(chunks)
+            return html, response_validators(response.headers)
+        finally:
+            # Solo una conexión sin bytes pendientes puede volver al pool
+            if reusable:
+                response.release_conn()
+            else:
+                response.close()
 
     def parse_sat_content(self, html_content: str) -> Dict:
         """
         Parsea el contenido HTML del SAT para extraer información
         """
         try:
+            from bs4 import BeautifulSoup
+
             # Decodificar caracteres especiales
             html_content = self.decode_special_characters(html_content)
 
@@ -589,191 +981,271 @@ class SATScraper:
                             value = match.group(1).strip()
                             data[key] = self.decode_special_characters(value)
 
+            metrics.PARSE_FIELDS.observe(len(data))
             return data
 
         except Exception as e:
             return {}
 
-    def extract_pdf_text_data(self, pdf_bytes: bytes, filename: str) -> Dict:
+    def extract_pdf_text_data(self, pdf_bytes: bytes, filename: str,
+                              diagnostics: Optional[Diagnostics] = None, url: Optional[str] = None) -> Dict:
         """
-        Extrae datos directamente del contenido del PDF
+        Extrae datos directamente del contenido del PDF. Con archivo activo la capa de
+        texto se guarda (junto con la URL del QR) para volver a parsearla sin el PDF
         """
         try:
+            import fitz  # PyMuPDF
+
+            start = time.perf_counter()
             doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            record(diagnostics, 'apertura', start)
 
-            pdf_data = {}
             full_text = ""
 
             # Extraer texto de las primeras páginas
+            start = time.perf_counter()
             for page_num in range(min(3, len(doc))):
                 page = doc[page_num]
                 full_text += page.get_text() + "\n"
+            record(diagnostics, 'extraccion_texto', start)
+            doc.close()
 
-            # Patrones de extracción exhaustivos del PDF (31 campos)
-            pdf_patterns = {
-                # Datos básicos del contribuyente
-                'pdf_rfc': r'RFC:\s*([A-Z&Ñ]{3,4}\d{6}[A-Z0-9]{3})',
-                'pdf_curp': r'CURP:\s*([A-Z]{4}\d{6}[HM][A-Z]{5}[0-9A-Z]\d)',
-                'pdf_id_cif': r'idCIF:\s*(\d+)',
-                'pdf_nombre': r'Nombre\s*\(s\):\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Primer|$)',
-                'pdf_primer_apellido': r'Primer Apellido:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Segundo|$)',
-                'pdf_segundo_apellido': r'Segundo Apellido:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=Fecha|$)',
-                'pdf_fecha_inicio_operaciones': r'Fecha inicio de operaciones:\s*([A-ZÁÉÍÓÚÑ\d\s]+)',
-                'pdf_nombre_comercial': r'Nombre Comercial:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Datos|$)',
-                'pdf_estatus_padron': r'Estatus en el padr[óo]n:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Fecha|$)',
-                'pdf_fecha_ultimo_cambio': r'[Úu]ltimo cambio de estado:\s*([A-ZÁÉÍÓÚÑ\s\d]+\s+DE\s+[A-ZÁÉÍÓÚÑ\s]+\d{4})',
-
-                # Domicilio completo
-                'pdf_codigo_postal': r'Código Postal:\s*(\d{5})',
-                'pdf_tipo_vialidad': r'Tipo de Vialidad:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Nombre|$)',
-                'pdf_nombre_vialidad': r'Nombre de Vialidad:\s*([A-ZÁÉÍÓÚÑ0-9\s]+?)(?=\s*N[úu]mero|$)',
-                'pdf_numero_exterior': r'N[úu]mero Exterior:\s*(\d+)',
-                'pdf_numero_interior': r'N[úu]mero Interior:\s*(\d+)',
-                'pdf_nombre_localidad': r'Nombre de la Localidad:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Nombre|$)',
-                'pdf_nombre_municipio': r'Nombre del Municipio o Demarcaci[óo]n Territorial:\s*([A-ZÁÉÍÓÚÑ\s\d]+?)(?=\s*Nombre|$)',
-                'pdf_nombre_entidad': r'Nombre de la Entidad Federativa:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Entre|$)',
-                'pdf_entre_calle': r'Entre Calle:\s*([A-ZÁÉÍÓÚÑ0-9\s]+?)(?=\s*Y|$)',
-                'pdf_y_calle': r'Y Calle:\s*([A-ZÁÉÍÓÚÑ0-9\s]+?)(?=\s*Actividades|$)',
-
-                # Actividades económicas
-                'pdf_actividad_economica': r'Comercio al por menor en ferreter[íi]as y tlapaler[íi]as',
-                'pdf_actividad_porcentaje': r'Comercio al por menor en ferreter[íi]as y tlapaler[íi]as\s+(\d+)',
-                'pdf_actividad_fecha_inicio': r'Comercio al por menor en ferreter[íi]as y tlapaler[íi]as\s+\d+\s+(\d{2}/\d{2}/\d{4})',
-
-                # Regímenes fiscales
-                'pdf_regimen_fiscal': r'Reg[íi]men de Sueldos y Salarios.*?\n',
-                'pdf_regimen_fecha_inicio': r'Reg[íi]men de Sueldos y Salarios.*\s+(\d{2}/\d{2}/\d{4})',
-
-                # Metadatos y ubicación
-                'pdf_lugar_emision': r'SALTILLO\s*,\s*([A-ZÁÉÍÓÚÑ\s]+)\s*A\s+\d+',
-                'pdf_fecha_emision': r'A\s+(\d+)\s+DE\s+([A-ZÁÉÍÓÚÑÑ]+)\s+DE\s+(\d{4})',
-                'pdf_cadena_original': r'Cadena Original Sello:\s*\|\|([^|]+)\|\|',
-                'pdf_sello_digital': r'Sello Digital:\s*([A-Z0-9+/=]{10,})',
-            }
-
-            for key, pattern in pdf_patterns.items():
-                match = re.search(pattern, full_text, re.IGNORECASE | re.MULTILINE)
-                if match:
-                    # Manejar campos con múltiples grupos
-                    if key == 'pdf_fecha_emision':
-                        # Formato: "14 DE JULIO DE 2025"
-                        pdf_data[key] = f"{match.group(1)} DE {match.group(2)} DE {match.group(3)}"
-                    elif key in ['pdf_actividad_economica', 'pdf_regimen_fiscal']:
-                        # Para campos que detectan presencia
-                        pdf_data[key] = 'ENCONTRADO'
-                    else:
-                        pdf_data[key] = self.decode_special_characters(match.group(1).strip())
-                else:
-                    pdf_data[key] = ''
-
-            # Patrones alternativos si no se encontraron los principales
-            if not pdf_data.get('pdf_nombre'):
-                # Buscar el nombre antes de los apellidos
-                # Buscar patrones donde aparece "Nombre" y luego los apellidos
-                name_section_pattern = r'Nombre\s*:?([^A-Z]*(?:[A-ZÁÉÍÓÚÑ]{2,}(?:\s+[A-ZÁÉÍÓÚÑ]{2,})*))\s*(?=Apellido Paterno|Primer Apellido)'
-                match = re.search(name_section_pattern, full_text, re.IGNORECASE | re.MULTILINE)
-                if match:
-                    name_text = match.group(1).strip()
-                    # Limpiar el texto para que solo queden nombres válidos
-                    name_text = re.sub(r'[^A-ZÁÉÍÓÚÑ\s]', '', name_text).strip()
-                    # Eliminar los apellidos que pudieron capturarse
-                    name_text = re.sub(r'\b(AMADOR|OCHOA|APELLIDO|PATERNO|MATERNO|SEGUNDO|PRIMERO)\b', '', name_text, flags=re.IGNORECASE).strip()
-
-                    if name_text and len(name_text) >= 2:
-                        pdf_data['pdf_nombre'] = self.decode_special_characters(name_text)
-                    else:
-                        # Si no se encuentra, buscar entre la CURP y los apellidos
-                        curp_match = re.search(r'CURP:\s*[A-Z]{4}\d{6}[HM][A-Z]{5}[0-9A-Z]\d', full_text)
-                        apellido_match = re.search(r'Apellido Paterno:\s*([A-ZÁÉÍÓÚÑ\s]+)', full_text)
-
-                        if curp_match and apellido_match:
-                            # Extraer texto entre CURP y Apellido Paterno
-                            start = curp_match.end()
-                            end = apellido_match.start()
-                            text_between = full_text[start:end]
-
-                            # Buscar nombres en ese texto
-                            potential_names = re.findall(r'\b[A-ZÁÉÍÓÚÑ]{3,}\b', text_between)
-                            # Filtrar palabras que no son nombres
-                            valid_names = [name for name in potential_names if name not in ['RFC', 'PDF', 'SAT', 'CURP', 'NOMBRE', 'SANTIAGO']]
-
-                            if valid_names:
-                                pdf_data['pdf_nombre'] = self.decode_special_characters(' '.join(valid_names))
-                            else:
-                                pdf_data['pdf_nombre'] = 'SANTIAGO'  # Nombre más común basado en el RFC
-                        else:
-                            pdf_data['pdf_nombre'] = 'SANTIAGO'  # Default basado en el RFC AAOS921231UR1
-                else:
-                    pdf_data['pdf_nombre'] = 'SANTIAGO'  # Default basado en el RFC
-
-            # Patrones alternativos para RFC y CURP
-            if not pdf_data.get('pdf_rfc'):
-                rfc_pattern = r'[A-Z&Ñ]{3,4}\d{6}[A-Z0-9]{3}'
-                matches = re.findall(rfc_pattern, full_text)
-                if matches:
-                    pdf_data['pdf_rfc'] = matches[0]
-                else:
-                    pdf_data['pdf_rfc'] = ''
-
-            if not pdf_data.get('pdf_curp'):
-                curp_pattern = r'[A-Z]{4}\d{6}[HM][A-Z]{5}[0-9A-Z]\d'
-                matches = re.findall(curp_pattern, full_text)
-                if matches:
-                    pdf_data['pdf_curp'] = matches[0]
-                else:
-                    pdf_data['pdf_curp'] = ''
+            if self._archive is not None:
+                try:
+                    self._archive.put_pdf_text(hashlib.sha256(pdf_bytes).hexdigest(), filename, url, full_text)
+                except Exception as e:
+                    print(f"No se pudo archivar el texto del PDF: {str(e)}")
 
-            doc.close()
+            start = time.perf_counter()
+            pdf_data = self.parse_pdf_text(full_text)
+            record(diagnostics, 'campos_pdf', start)
             return pdf_data
 
         except Exception as e:
             return {}
 
-    def process_pdf(self, pdf_bytes: bytes, filename: str) -> Dict:
+    def parse_pdf_text(self, full_text: str) -> Dict:
         """
-        Procesa un PDF individual y retorna los resultados
+        Campos pdf_* a partir de la capa de texto de una CSF (también sobre texto archivado)
         """
+        pdf_data = {}
+
+        # Patrones de extracción exhaustivos del PDF (31 campos)
+        pdf_patterns = {
+            # Datos básicos del contribuyente
+            'pdf_rfc': r'RFC:\s*([A-Z&Ñ]{3,4}\d{6}[A-Z0-9]{3})',
+            'pdf_curp': r'CURP:\s*([A-Z]{4}\d{6}[HM][A-Z]{5}[0-9A-Z]\d)',
+            'pdf_id_cif': r'idCIF:\s*(\d+)',
+            'pdf_nombre': r'Nombre\s*\(s\):\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Primer|$)',
+            'pdf_primer_apellido': r'Primer Apellido:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Segundo|$)',
+            'pdf_segundo_apellido': r'Segundo Apellido:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=Fecha|$)',
+            'pdf_fecha_inicio_operaciones': r'Fecha inicio de operaciones:\s*([A-ZÁÉÍÓÚÑ\d\s]+)',
+            'pdf_nombre_comercial': r'Nombre Comercial:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Datos|$)',
+            'pdf_estatus_padron': r'Estatus en el padr[óo]n:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Fecha|$)',
+            'pdf_fecha_ultimo_cambio': r'[Úu]ltimo cambio de estado:\s*([A-ZÁÉÍÓÚÑ\s\d]+\s+DE\s+[A-ZÁÉÍÓÚÑ\s]+\d{4})',
+
+            # Domicilio completo
+            'pdf_codigo_postal': r'Código Postal:\s*(\d{5})',
+            'pdf_tipo_vialidad': r'Tipo de Vialidad:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Nombre|$)',
+            'pdf_nombre_vialidad': r'Nombre de Vialidad:\s*([A-ZÁÉÍÓÚÑ0-9\s]+?)(?=\s*N[úu]mero|$)',
+            'pdf_numero_exterior': r'N[úu]mero Exterior:\s*(\d+)',
+            'pdf_numero_interior': r'N[úu]mero Interior:\s*(\d+)',
+            'pdf_nombre_localidad': r'Nombre de la Localidad:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Nombre|$)',
+            'pdf_nombre_municipio': r'Nombre del Municipio o Demarcaci[óo]n Territorial:\s*([A-ZÁÉÍÓÚÑ\s\d]+?)(?=\s*Nombre|$)',
+            'pdf_nombre_entidad': r'Nombre de la Entidad Federativa:\s*([A-ZÁÉÍÓÚÑ\s]+?)(?=\s*Entre|$)',
+            'pdf_entre_calle': r'Entre Calle:\s*([A-ZÁÉÍÓÚÑ0-9\s]+?)(?=\s*Y|$)',
+            'pdf_y_calle': r'Y Calle:\s*([A-ZÁÉÍÓÚÑ0-9\s]+?)(?=\s*Actividades|$)',
+
+            # Actividades económicas
+            'pdf_actividad_economica': r'Comercio al por menor en ferreter[íi]as y tlapaler[íi]as',
+            'pdf_actividad_porcentaje': r'Comercio al por menor en ferreter[íi]as y tlapaler[íi]as\s+(\d+)',
+            'pdf_actividad_fecha_inicio': r'Comercio al por menor en ferreter[íi]as y tlapaler[íi]as\s+\d+\s+(\d{2}/\d{2}/\d{4})',
+
+            # Regímenes fiscales
+            'pdf_regimen_fiscal': r'Reg[íi]men de Sueldos y Salarios.*?\n',
+            'pdf_regimen_fecha_inicio': r'Reg[íi]men de Sueldos y Salarios.*\s+(\d{2}/\d{2}/\d{4})',
+
+            # Metadatos y ubicación
+            'pdf_lugar_emision': r'SALTILLO\s*,\s*([A-ZÁÉÍÓÚÑ\s]+)\s*A\s+\d+',
+            'pdf_fecha_emision': r'A\s+(\d+)\s+DE\s+([A-ZÁÉÍÓÚÑÑ]+)\s+DE\s+(\d{4})',
+            'pdf_cadena_original': r'Cadena Original Sello:\s*\|\|([^|]+)\|\|',
+            'pdf_sello_digital': r'Sello Digital:\s*([A-Z0-9+/=]{10,})',
+        }
+
+        for key, pattern in pdf_patterns.items():
+            match = re.search(pattern, full_text, re.IGNORECASE | re.MULTILINE)
+            if match:
+                # Manejar campos con múltiples grupos
+                if key == 'pdf_fecha_emision':
+                    # Formato: "14 DE JULIO DE 2025"
+                    pdf_data[key] = f"{match.group(1)} DE {match.group(2)} DE {match.group(3)}"
+                elif key in ['pdf_actividad_economica', 'pdf_regimen_fiscal']:
+                    # Para campos que detectan presencia
+                    pdf_data[key] = 'ENCONTRADO'
+                else:
+                    pdf_data[key] = self.decode_special_characters(match.group(1).strip())
+            else:
+                pdf_data[key] = ''
+
+        # Patrones alternativos si no se encontraron los principales
+        if not pdf_data.get('pdf_nombre'):
+            # Buscar el nombre antes de los apellidos
+            # Buscar patrones donde aparece "Nombre" y luego los apellidos
+            name_section_pattern = r'Nombre\s*:?([^A-Z]*(?:[A-ZÁÉÍÓÚÑ]{2,}(?:\s+[A-ZÁÉÍÓÚÑ]{2,})*))\s*(?=Apellido Paterno|Primer Apellido)'
+            match = re.search(name_section_pattern, full_text, re.IGNORECASE | re.MULTILINE)
+            if match:
+                name_text = match.group(1).strip()
+                # Limpiar el texto para que solo queden nombres válidos
+                name_text = re.sub(r'[^A-ZÁÉÍÓÚÑ\s]', '', name_text).strip()
+                # Eliminar los apellidos que pudieron capturarse
+                name_text = re.sub(r'\b(AMADOR|OCHOA|APELLIDO|PATERNO|MATERNO|SEGUNDO|PRIMERO)\b', '', name_text, flags=re.IGNORECASE).strip()
+
+                if name_text and len(name_text) >= 2:
+                    pdf_data['pdf_nombre'] = self.decode_special_characters(name_text)
+                else:
+                    # Si no se encuentra, buscar entre la CURP y los apellidos
+                    curp_match = re.search(r'CURP:\s*[A-Z]{4}\d{6}[HM][A-Z]{5}[0-9A-Z]\d', full_text)
+                    apellido_match = re.search(r'Apellido Paterno:\s*([A-ZÁÉÍÓÚÑ\s]+)', full_text)
+
+                    if curp_match and apellido_match:
+                        # Extraer texto entre CURP y Apellido Paterno
+                        start = curp_match.end()
+                        end = apellido_match.start()
+                        text_between = full_text[start:end]
+
+                        # Buscar nombres en ese texto
+                        potential_names = re.findall(r'\b[A-ZÁÉÍÓÚÑ]{3,}\b', text_between)
+                        # Filtrar palabras que no son nombres
+                        valid_names = [name for name in potential_names if name not in ['RFC', 'PDF', 'SAT', 'CURP', 'NOMBRE', 'SANTIAGO']]
+
+                        if valid_names:
+                            pdf_data['pdf_nombre'] = self.decode_special_characters(' '.join(valid_names))
+                        else:
+                            pdf_data['pdf_nombre'] = 'SANTIAGO'  # Nombre más común basado en el RFC
+                    else:
+                        pdf_data['pdf_nombre'] = 'SANTIAGO'  # Default basado en el RFC AAOS921231UR1
+            else:
+                pdf_data['pdf_nombre'] = 'SANTIAGO'  # Default basado en el RFC
+
+        # Patrones alternativos para RFC y CURP
+        if not pdf_data.get('pdf_rfc'):
+            rfc_pattern = r'[A-Z&Ñ]{3,4}\d{6}[A-Z0-9]{3}'
+            matches = re.findall(rfc_pattern, full_text)
+            if matches:
+                pdf_data['pdf_rfc'] = matches[0]
+            else:
+                pdf_data['pdf_rfc'] = ''
+
+        if not pdf_data.get('pdf_curp'):
+            curp_pattern = r'[A-Z]{4}\d{6}[HM][A-Z]{5}[0-9A-Z]\d'
+            matches = re.findall(curp_pattern, full_text)
+            if matches:
+                pdf_data['pdf_curp'] = matches[0]
+            else:
+                pdf_data['pdf_curp'] = ''
+        return pdf_data
+
+    def run_cpu_stage(self, pdf_bytes: bytes, filename: str, stages=None) -> Tuple[Dict, Optional[str]]:
+        """
+        Etapa de CPU: abre el PDF, decodifica el QR y extrae los campos de texto.
+        Solo ejecuta las etapas seleccionadas; el QR se resuelve también si la
+        etapa web lo necesita. Retorna el resultado parcial y la URL a consultar
+        (None si no hay que consultar)
+        """
+        stages = normalize_stages(stages)
         result = {
             'archivo_pdf': filename,
             'fecha_extraccion': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
 
+        diagnostics = None
+        if self.collect_diagnostics:
+            diagnostics = Diagnostics()
+            result['diagnostico'] = diagnostics.block
+
         # Verificar que se esté recibiendo el PDF
         if not pdf_bytes or len(pdf_bytes) < 100:
             result['scraping_exitoso'] = 'False'
             result['extraccion_pdf_exitosa'] = 'False'
             result['error'] = 'PDF vacío o inválido'
-            return result
-
-        # Extraer QR
-        url = self.extract_qr_from_pdf(pdf_bytes, filename)
-        result['url_encontrada'] = 'True' if url is not None else 'False'
-        result['url'] = url if url else 'No encontrada'
+            self._count_processed(result)
+            return result, None
+
+        # Extraer QR (solo si lo pide la etapa QR o lo necesita la etapa web)
+        url = None
+        if STAGE_QR in stages or STAGE_WEB in stages:
+            # Camino rápido sin rasterizar: enlace o texto con la URL de validación
+            url, backend = self._fallback_text_search(pdf_bytes, diagnostics), 'vector'
+            if url:
+                if diagnostics is not None:
+                    diagnostics.set('decodificador_qr', backend)
+            else:
+                url, backend = self._decode_qr_from_pdf(pdf_bytes, filename, diagnostics)
+            metrics.QR_METHOD.inc(metodo=backend if url else 'ninguno')
+            result['url_encontrada'] = 'True' if url is not None else 'False'
+            result['url'] = url if url else 'No encontrada'
 
         # Extraer datos del PDF
-        pdf_data = self.extract_pdf_text_data(pdf_bytes, filename)
-        result.update(pdf_data)
-        result['extraccion_pdf_exitosa'] = 'True' if len(pdf_data) > 0 else 'False'
-
-        if url:
-            # Hacer scraping de la URL
-            sat_data = self.scrape_sat_data(url, filename)
-            result.update(sat_data)
+        if STAGE_PDF_TEXT in stages:
+            pdf_data = self.extract_pdf_text_data(pdf_bytes, filename, diagnostics, url)
+            result.update(pdf_data)
+            result['extraccion_pdf_exitosa'] = 'True' if len(pdf_data) > 0 else 'False'
         else:
+            result['extraccion_pdf_exitosa'] = 'False'
+
+        if STAGE_WEB not in stages:
+            result['scraping_exitoso'] = 'False'
+            result['error'] = 'Scraping web deshabilitado'
+            self._count_processed(result)
+            return result, None
+
+        if not url:
             result['scraping_exitoso'] = 'False'
             result['error'] = 'No se pudo extraer código QR'
+            self._count_processed(result)
+
+        return result, url
 
+    def run_io_stage(self, result: Dict, url: str) -> Dict:
+        """
+        Etapa de red: hace scraping de la URL del SAT y completa el resultado
+        """
+        sat_data = self.scrape_sat_data(url, result['archivo_pdf'], Diagnostics.from_result(result))
+        result.update(sat_data)
+        self._count_processed(result)
         return result
 
-    def export_to_excel(self, results: List[Dict], filename: str = 'resultados_scraping_sat.xlsx') -> bytes:
+    def _count_processed(self, result: Dict) -> None:
+        """
+        Registra un archivo terminado en las métricas del proceso
         """
-        Exporta los resultados a un archivo Excel con múltiples hojas
+        metrics.FILES_PROCESSED.inc(scraping=result.get('scraping_exitoso', 'False'),
+                                    pdf=result.get('extraccion_pdf_exitosa', 'False'))
+
+    def process_pdf(self, pdf_bytes: bytes, filename: str, stages=None) -> Dict:
         """
+        Procesa un PDF individual y retorna los resultados.
+        stages: subconjunto de ALL_STAGES a ejecutar (None = todas)
+        """
+        result, url = self.run_cpu_stage(pdf_bytes, filename, stages)
+
+        if url:
+            result = self.run_io_stage(result, url)
+
+        return result
+
+    def export_to_excel(self, results: List[Dict], filename: str = 'resultados_scraping_sat.xlsx',
+                        sheets: Optional[Iterable[str]] = None) -> bytes:
+        """
+        Exporta los resultados a un archivo Excel con múltiples hojas.
+        sheets: nombres de hojas a incluir (ver EXCEL_SHEETS); por defecto todas
+        """
+        export_start = time.perf_counter()
         try:
             import io
             from openpyxl import Workbook
             from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-            from openpyxl.utils.dataframe import dataframe_to_rows
+            from openpyxl.utils import get_column_letter
 
             output = io.BytesIO()
             wb = Workbook()
@@ -790,15 +1262,17 @@ class SATScraper:
             )
             alignment = Alignment(horizontal='center', vertical='center')
 
-            # Crear hojas de datos
-            sheets_data = {
-                'Resumen Scraping': self._create_summary_data(results),
-                'Datos Extraídos': self._create_detailed_data(results),
-                'Datos del PDF': self._create_pdf_data(results),
-                'Estadísticas': self._create_stats_data(results)
+            # Crear solo las hojas solicitadas (en el orden estándar)
+            builders = {
+                'Resumen Scraping': self._create_summary_data,
+                'Datos Extraídos': self._create_detailed_data,
+                'Datos del PDF': self._create_pdf_data,
+                'Estadísticas': self._create_stats_data
             }
+            selected = EXCEL_SHEETS if sheets is None else [name for name in EXCEL_SHEETS if name in set(sheets)]
 
-            for sheet_name, data in sheets_data.items():
+            for sheet_name in selected:
+                data = builders[sheet_name](results)
                 if data:
                     ws = wb.create_sheet(title=sheet_name)
 
@@ -812,24 +1286,29 @@ class SATScraper:
                             cell.border = border
                             cell.alignment = alignment
 
+                            # Ajustar ancho de columna (una vez por columna)
+                            ws.column_dimensions[get_column_letter(col_num)].width = 30 if col_num == 1 else 20
+
                         # Escribir datos
                         for row_num, row_data in enumerate(data, 2):
                             for col_num, (key, value) in enumerate(row_data.items(), 1):
                                 cell = ws.cell(row=row_num, column=col_num, value=value)
                                 cell.border = border
 
-                                # Ajustar ancho de columna
-                                if col_num == 1:
-                                    ws.column_dimensions[chr(64 + col_num)].width = 30
-                                else:
-                                    ws.column_dimensions[chr(64 + col_num)].width = 20
+            # Un libro necesita al menos una hoja aunque ninguna de las elegidas tenga datos
+            if not wb.worksheets:
+                ws = wb.create_sheet(title='Sin datos')
+                ws.cell(row=1, column=1, value='No hay datos para las hojas seleccionadas').font = Font(bold=True)
+                ws.column_dimensions['A'].width = 50
 
             wb.save(output)
             output.seek(0)
+            self.last_export_ms = round((time.perf_counter() - export_start) * 1000, 1)
+            metrics.EXPORT_DURATION.observe(self.last_export_ms / 1000)
             return output.getvalue()
 
         except Exception as e:
-            return b''
+            raise RuntimeError(f'No se pudo generar el archivo Excel: {str(e)}') from e
 
     def _create_summary_data(self, results: List[Dict]) -> List[Dict]:
         """Crea datos para la hoja de resumen"""
@@ -943,4 +1422,15 @@ class SATScraper:
             {'Métrica': 'Fecha de procesamiento', 'Valor': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         ]
 
+        # Tiempos por etapa (solo si los resultados traen bloque de diagnóstico)
+        for stage, values in collect_stage_timings(results).items():
+            stats.append({
+                'Métrica': f'Tiempo {stage} (ms) p50 / p95 / máx',
+                'Valor': f"{percentile(values, 50):.1f} / {percentile(values, 95):.1f} / {max(values):.1f}"
+            })
+            stats.append({
+                'Métrica': f'Histograma {stage}',
+                'Valor': ' | '.join(f"{label}: {count}" for label, count in histogram(values) if count)
+            })
+
         return stats
\ No newline at end of file
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Cache de consultas al SAT: frescura de las páginas guardadas y cache negativo de fallos
+
+Las páginas exitosas se guardan con su hora de descarga y validadores; una
+FreshnessPolicy decide si se sirven tal cual, si se sirven obsoletas mientras se
+revalidan en segundo plano o si se vuelven a consultar. ScrapeStore las persiste
+en SQLite para que las re-ejecuciones periódicas se resuelvan localmente.
+
+Un fallo se guarda con un TTL que depende de su clase: los transitorios (timeout,
+error de conexión) expiran pronto; los deterministas (token D3 inválido, página
+sin datos) duran más. Así una URL conocida como mala falla en microsegundos en
+lugar de agotar los timeouts de las cuatro estrategias otra vez.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# Clases de fallo
+FAILURE_TIMEOUT = 'timeout'  # timeout o error de conexión (transitorio)
+FAILURE_HTTP = 'error_http'  # el SAT respondió con un estado distinto de 200
+FAILURE_EMPTY = 'vacio'  # respuesta vacía o página sin datos reconocibles
+FAILURE_INVALID_TOKEN = 'token_invalido'  # D3 ausente o rechazado por el SAT
+
+# TTL (s) por clase de fallo
+DEFAULT_NEGATIVE_TTL = {
+    FAILURE_TIMEOUT: 60,
+    FAILURE_HTTP: 300,
+    FAILURE_EMPTY: 900,
+    FAILURE_INVALID_TOKEN: 24 * 3600,
+}
+
+# Mensaje de error por clase de fallo
+FAILURE_MESSAGES = {
+    FAILURE_TIMEOUT: 'No se pudo acceder al contenido con ninguna estrategia (timeout o error de conexión)',
+    FAILURE_HTTP: 'El SAT respondió con error HTTP en todas las estrategias',
+    FAILURE_EMPTY: 'La página del SAT no contiene datos reconocibles',
+    FAILURE_INVALID_TOKEN: 'La URL no contiene un token D3 válido o el SAT no lo reconoce',
+}
+
+# Textos de la página que el SAT devuelve para tokens inexistentes (sin acentos por si llega con mojibake)
+INVALID_TOKEN_MARKERS = ('no es v', 'no existe informaci')
+
+
+class FetchError(Exception):
+    """
+    Fallo de una estrategia de descarga con su clase (ver FAILURE_*)
+    """
+
+    def __init__(self, kind: str, message: str = ''):
+        super().__init__(message or kind)
+        self.kind = kind
+
+
+class NotModified(Exception):
+    """
+    El SAT respondió 304 a una solicitud condicional: la página guardada sigue vigente
+    """
+
+
+def response_validators(headers) -> Dict[str, Optional[str]]:
+    """
+    ETag y Last-Modified de los encabezados de una respuesta (requests, urllib o urllib3)
+    """
+    return {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+
+
+def classify_exception(exc: BaseException) -> str:
+    """
+    Clase de fallo para una excepción de requests, urllib, urllib3 o curl
+    """
+    if isinstance(exc, FetchError):
+        return exc.kind
+    # urllib.error.HTTPError (requests/urllib3 no lanzan por estado: lo revisan las estrategias)
+    if type(exc).__name__ == 'HTTPError' and hasattr(exc, 'code'):
+        return FAILURE_HTTP
+    return FAILURE_TIMEOUT
+
+
+def is_invalid_token_page(html_content: str) -> bool:
+    """
+    Indica si el HTML es la página de "clave no válida" del SAT
+    """
+    lowered = html_content.lower()
+    return all(marker in lowered for marker in INVALID_TOKEN_MARKERS)
+
+
+def summarize_failures(kinds: Iterable[str], ttl: Dict[str, float]) -> str:
+    """
+    Clase de un fallo compuesto por varios intentos: la de menor TTL (la más conservadora)
+    """
+    kinds = list(kinds)
+    if not kinds:
+        return FAILURE_TIMEOUT
+    return min(kinds, key=lambda kind: ttl.get(kind, 0))
+
+
+class NegativeCache:
+    """
+    Resultados fallidos por clave de URL con expiración según su clase de fallo.
+    Seguro entre hilos; desaloja los más antiguos al superar max_entries
+    """
+
+    def __init__(self, ttl: Optional[Dict[str, float]] = None, max_entries: int = 10000):
+        # Se conserva la referencia: cambiar el diccionario ajusta los TTL en caliente
+        self.ttl = ttl if ttl is not None else dict(DEFAULT_NEGATIVE_TTL)
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            return result
+
+    def put(self, key: str, kind: str, result: Dict) -> None:
+        ttl = self.ttl.get(kind, 0)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Estados de una página en cache según la política de frescura
+FRESH = 'fresco'  # se sirve del cache
+STALE = 'obsoleto'  # se sirve del cache y se revalida en segundo plano
+EXPIRED = 'vencido'  # se vuelve a consultar antes de responder
+
+
+class CachedPage:
+    """
+    Resultado de scraping en cache con su hora de descarga y validadores
+    (ETag, Last-Modified y hash del HTML) para revalidar sin volver a parsear
+    """
+
+    __slots__ = ('result', 'fetched_at', 'etag', 'last_modified', 'content_hash')
+
+    def __init__(self, result: Dict, fetched_at: Optional[float] = None, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None, content_hash: Optional[str] = None):
+        self.result = result
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """
+        Encabezados para una solicitud condicional (304 si no cambió)
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def to_json(self) -> str:
+        return json.dumps({slot: getattr(self, slot) for slot in self.__slots__}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data: str) -> 'CachedPage':
+        return cls(**json.loads(data))
+
+
+class FreshnessPolicy:
+    """
+    max_age: segundos en que una página se considera fresca.
+    stale_while_revalidate: segundos adicionales en que se sirve obsoleta mientras
+    se revalida en segundo plano; después se vuelve a consultar antes de responder
+    """
+
+    def __init__(self, max_age: float = 7 * 24 * 3600, stale_while_revalidate: float = 30 * 24 * 3600):
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+
+    def state(self, page: CachedPage, now: Optional[float] = None) -> str:
+        age = (now if now is not None else time.time()) - page.fetched_at
+        if age <= self.max_age:
+            return FRESH
+        if age <= self.max_age + self.stale_while_revalidate:
+            return STALE
+        return EXPIRED
+
+
+class ScrapeStore:
+    """
+    Persistencia opcional del cache de scraping en SQLite (sobrevive entre ejecuciones)
+    """
+
+    def __init__(self, path: str):
+        import sqlite3
+
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS paginas (clave TEXT PRIMARY KEY, descargada REAL, datos TEXT)')
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        with self._lock:
+            row = self._conn.execute('SELECT datos FROM paginas WHERE clave = ?', (key,)).fetchone()
+        return CachedPage.from_json(row[0]) if row else None
+
+    def put(self, key: str, page: CachedPage) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO paginas (clave, descargada, datos) VALUES (?, ?, ?)',
+                               (key, page.fetched_at, page.to_json()))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Servicio HTTP para extraer CSF desde otros sistemas (sin pasar por Streamlit)
+
+Endpoints:
+    POST /v1/csf        un PDF (multipart, campo "archivo") → resultado JSON
+    POST /v1/csf/lote   varios PDFs (campo "archivos") → NDJSON, una línea por archivo conforme termina
+    GET  /metrics       métricas OpenMetrics/Prometheus
+    GET  /salud         verificación para balanceadores
+
+Todas las solicitudes comparten un SATScraper (sesión HTTP keep-alive, caches) y un
+PipelinedExecutor. A lo más SERVICE_MAX_CONCURRENCY solicitudes se procesan a la
+vez; las demás esperan hasta SERVICE_QUEUE_TIMEOUT segundos y luego reciben 503
+con Retry-After. Los tamaños se validan antes de leer nada; los PDFs de un lote se
+copian a archivos temporales propios de la respuesta (FastAPI cierra las cargas al
+terminar el endpoint, antes de que termine el streaming) y se leen conforme el
+pipeline los admite, así que la memoria la acota el pipeline y no el tamaño del lote. No guarda estado local: se pueden
+correr varias réplicas detrás de un balanceador.
+
+Uso (dependencias en requirements-service.txt):
+    uvicorn service:app --host 0.0.0.0 --port 8000
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import aclosing, asynccontextmanager
+from typing import IO, AsyncIterator, Callable, Dict, Iterator, List, Tuple
+
+from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+
+import metrics
+from pipeline import PipelinedExecutor, error_result
+from sat_scraper_cloud import SATScraper, normalize_stages
+
+CPU_WORKERS = int(os.environ.get('SERVICE_CPU_WORKERS', 2))
+IO_WORKERS = int(os.environ.get('SERVICE_IO_WORKERS', 16))
+REQUEST_TIMEOUT = int(os.environ.get('SERVICE_TIMEOUT', 15))
+MAX_CONCURRENCY = int(os.environ.get('SERVICE_MAX_CONCURRENCY', 8))
+QUEUE_TIMEOUT = float(os.environ.get('SERVICE_QUEUE_TIMEOUT', 30))
+MAX_FILE_BYTES = int(os.environ.get('SERVICE_MAX_FILE_MB', 20)) * 1024 * 1024
+MAX_BATCH_FILES = int(os.environ.get('SERVICE_MAX_BATCH_FILES', 500))
+MAX_BATCH_BYTES = int(os.environ.get('SERVICE_MAX_BATCH_MB', 200)) * 1024 * 1024
+
+# Marcador de fin del lote en la cola entre el hilo productor y la respuesta
+_END = object()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scraper = SATScraper()
+    scraper.request_timeout = REQUEST_TIMEOUT
+    if os.environ.get('SCRAPER_CACHE_DB'):
+        scraper.use_cache_db(os.environ['SCRAPER_CACHE_DB'])
+    if os.environ.get('SCRAPER_ARCHIVE_DIR'):
+        scraper.use_archive(os.environ['SCRAPER_ARCHIVE_DIR'])
+    app.state.executor = PipelinedExecutor(scraper, cpu_workers=CPU_WORKERS, io_workers=IO_WORKERS)
+    app.state.slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    yield
+    app.state.executor.shutdown(wait=False)
+
+
+app = FastAPI(title='Scraper CSF SAT', lifespan=lifespan)
+
+
+@app.middleware('http')
+async def count_requests(request: Request, call_next):
+    """
+    Cuenta cada respuesta por ruta y código HTTP (incluye 4xx/5xx y errores no atrapados)
+    """
+    try:
+        response = await call_next(request)
+    except Exception:
+        metrics.SERVICE_REQUESTS.inc(endpoint=route_label(request), estado='500')
+        raise
+    metrics.SERVICE_REQUESTS.inc(endpoint=route_label(request), estado=str(response.status_code))
+    return response
+
+
+def route_label(request: Request) -> str:
+    # La plantilla de la ruta, no la URL: evita una serie por cada ruta inexistente
+    route = request.scope.get('route')
+    return getattr(route, 'path', 'otra')
+
+
+def parse_stages(etapas: str) -> frozenset:
+    try:
+        return normalize_stages(part.strip() for part in etapas.split(',') if part.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def acquire_slot(request: Request) -> asyncio.Semaphore:
+    """
+    Turno de procesamiento; 503 si no se libera uno a tiempo (el balanceador reintenta en otra réplica)
+    """
+    slots = request.app.state.slots
+    try:
+        await asyncio.wait_for(slots.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail='Servicio saturado, intenta más tarde',
+                            headers={'Retry-After': '5'})
+    return slots
+
+
+def upload_size(upload: UploadFile) -> int:
+    """
+    Tamaño de una carga sin leerla (ya está en su archivo temporal)
+    """
+    if upload.size is not None:
+        return upload.size
+    position = upload.file.tell()
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(position)
+    return size
+
+
+def check_sizes(uploads: List[UploadFile]) -> None:
+    total = 0
+    for upload in uploads:
+        size = upload_size(upload)
+        if size > MAX_FILE_BYTES:
+            raise HTTPException(status_code=413,
+                                detail=f'{upload.filename}: excede {MAX_FILE_BYTES // (1024 * 1024)} MB')
+        total += size
+    if total > MAX_BATCH_BYTES:
+        raise HTTPException(status_code=413, detail=f'El lote excede {MAX_BATCH_BYTES // (1024 * 1024)} MB')
+
+
+def spool_uploads(uploads: List[UploadFile]) -> List[Tuple[str, IO[bytes]]]:
+    """
+    Copia cada carga a un archivo temporal en disco que vive lo que dure la respuesta
+    """
+    spooled = []
+    try:
+        for upload in uploads:
+            upload.file.seek(0)
+            copy = tempfile.TemporaryFile()
+            spooled.append((upload.filename or 'archivo.pdf', copy))
+            shutil.copyfileobj(upload.file, copy)
+    except BaseException:
+        close_files(spooled)
+        raise
+    return spooled
+
+
+def close_files(files: List[Tuple[str, IO[bytes]]]) -> None:
+    for _, file in files:
+        file.close()
+
+
+def lazy_jobs(files: List[Tuple[str, IO[bytes]]]) -> Iterator[Tuple[int, str, bytes]]:
+    """
+    Trabajos para map_keyed; cada PDF se lee cuando el pipeline lo admite (en su hilo)
+    """
+    for index, (filename, file) in enumerate(files):
+        file.seek(0)
+        yield index, filename, file.read()
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que siempre cierra su iterador y libera sus recursos, aunque el
+    cliente se desconecte o la respuesta se cancele antes de empezar el cuerpo
+    """
+
+    def __init__(self, content: AsyncIterator[str], release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self.release()
+
+
+def produce_results(executor: PipelinedExecutor, jobs: Iterator[Tuple[int, str, bytes]], stages: frozenset,
+                    loop: asyncio.AbstractEventLoop, output: asyncio.Queue, cancelled: threading.Event) -> None:
+    """
+    Hilo productor: pasa los resultados del pipeline a la cola asyncio conforme terminan
+    """
+    results = executor.map_keyed(jobs, stages)
+    try:
+        for _, result in results:
+            if cancelled.is_set():
+                break
+            loop.call_soon_threadsafe(output.put_nowait, result)
+    except Exception as e:
+        loop.call_soon_threadsafe(output.put_nowait, error_result('', str(e)))
+    finally:
+        results.close()
+        loop.call_soon_threadsafe(output.put_nowait, _END)
+
+
+async def stream_results(executor: PipelinedExecutor, jobs: Iterator[Tuple[int, str, bytes]],
+                         stages: frozenset) -> AsyncIterator[Dict]:
+    loop = asyncio.get_running_loop()
+    output: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    loop.run_in_executor(None, produce_results, executor, jobs, stages, loop, output, cancelled)
+    try:
+        while True:
+            item = await output.get()
+            if item is _END:
+                return
+            yield item
+    finally:
+        # Cliente desconectado: dejar de esperar resultados que nadie leerá
+        cancelled.set()
+
+
+@app.post('/v1/csf')
+async def process_single(request: Request, archivo: UploadFile = File(...),
+                         etapas: str = Query('qr,pdf_text,web')) -> Dict:
+    stages = parse_stages(etapas)
+    check_sizes([archivo])
+    slots = await acquire_slot(request)
+    try:
+        files = [(archivo.filename or 'archivo.pdf', archivo.file)]
+        async with aclosing(stream_results(request.app.state.executor, lazy_jobs(files), stages)) as results:
+            async for result in results:
+                return result
+    finally:
+        slots.release()
+    raise HTTPException(status_code=500, detail='El pipeline no produjo resultado')
+
+
+@app.post('/v1/csf/lote')
+async def process_batch(request: Request, archivos: List[UploadFile] = File(...),
+                        etapas: str = Query('qr,pdf_text,web')) -> StreamingResponse:
+    stages = parse_stages(etapas)
+    if len(archivos) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f'Máximo {MAX_BATCH_FILES} archivos por lote')
+    check_sizes(archivos)
+    slots = await acquire_slot(request)
+    try:
+        files = await asyncio.to_thread(spool_uploads, archivos)
+    except BaseException:
+        slots.release()
+        raise
+
+    released = False
+
+    def release() -> None:
+        # Desde el fin del cuerpo o desde la respuesta (si el cuerpo nunca empezó): una sola vez
+        nonlocal released
+        if not released:
+            released = True
+            close_files(files)
+            slots.release()
+
+    async def ndjson() -> AsyncIterator[str]:
+        try:
+            async with aclosing(stream_results(request.app.state.executor, lazy_jobs(files), stages)) as results:
+                async for result in results:
+                    yield json.dumps(result, ensure_ascii=False) + '\n'
+        finally:
+            release()
+
+    return ReleasingStreamingResponse(ndjson(), release, media_type='application/x-ndjson')
+
+
+@app.get('/metrics')
+async def metrics_endpoint(request: Request) -> Response:
+    openmetrics = 'application/openmetrics-text' in request.headers.get('accept', '')
+    return Response(metrics.REGISTRY.render(openmetrics),
+                    media_type=metrics.OPENMETRICS_CONTENT_TYPE if openmetrics else metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get('/salud')
+async def health() -> Dict:
+    return {'estado': 'ok'}
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host=os.environ.get('SERVICE_HOST', '127.0.0.1'), port=int(os.environ.get('SERVICE_PORT', 8000)))
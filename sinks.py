@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Destinos de resultados para los comandos por lotes: JSONL, CSV y Excel
+
+JSONL escribe cada resultado al recibirlo (sirve como estado para la siguiente
+ejecución); CSV y Excel necesitan todas las columnas, así que acumulan y escriben
+al cerrar.
+"""
+
+import csv
+import json
+import os
+from typing import Dict, List, Optional
+
+
+class JsonlSink:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, result: Dict) -> None:
+        self._file.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class CsvSink:
+    """
+    Columnas: unión de las llaves de todos los resultados, en orden de aparición.
+    Los valores que no son texto (p. ej. diagnóstico) se escriben como JSON
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._results: List[Dict] = []
+
+    def write(self, result: Dict) -> None:
+        self._results.append(result)
+
+    def close(self) -> None:
+        fieldnames = list(dict.fromkeys(key for result in self._results for key in result))
+        with open(self.path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            for result in self._results:
+                writer.writerow({key: value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+                                 for key, value in result.items()})
+
+
+class ExcelSink:
+    """
+    Libro con las hojas de SATScraper.export_to_excel
+    """
+
+    def __init__(self, path: str, scraper):
+        self.path = path
+        self.scraper = scraper
+        self._results: List[Dict] = []
+
+    def write(self, result: Dict) -> None:
+        self._results.append(result)
+
+    def close(self) -> None:
+        # Se genera antes de abrir el archivo: un error no deja un .xlsx vacío o truncado
+        data = self.scraper.export_to_excel(self._results, os.path.basename(self.path))
+        if not data:
+            raise RuntimeError(f'La exportación a Excel no produjo datos: {self.path}')
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+
+class MultiSink:
+    """
+    Reparte cada resultado entre varios destinos
+    """
+
+    def __init__(self, sinks: List):
+        self.sinks = sinks
+
+    def write(self, result: Dict) -> None:
+        for sink in self.sinks:
+            sink.write(result)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+    def __bool__(self) -> bool:
+        return bool(self.sinks)
+
+    def __enter__(self) -> 'MultiSink':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def open_sinks(scraper=None, jsonl: Optional[str] = None, csv_path: Optional[str] = None,
+               excel: Optional[str] = None) -> MultiSink:
+    """
+    Destinos pedidos por línea de comandos (los que sean None se omiten)
+    """
+    sinks = []
+    if jsonl:
+        sinks.append(JsonlSink(jsonl))
+    if csv_path:
+        sinks.append(CsvSink(csv_path))
+    if excel:
+        sinks.append(ExcelSink(excel, scraper))
+    return MultiSink(sinks)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Medición de tiempos por etapa del pipeline y agregados para estadísticas
+"""
+
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Orden de presentación de las etapas medidas
+STAGE_ORDER = [
+    'busqueda_vectorial', 'apertura', 'renderizado', 'decodificacion_qr', 'escalera_qr', 'extraccion_texto', 'campos_pdf',
+    'estrategia1', 'estrategia2', 'estrategia3', 'estrategia4', 'espera_compartida', 'parseo',
+]
+
+# Límites superiores (ms) de las cubetas de los histogramas
+HISTOGRAM_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Diagnostics:
+    """
+    Bloque de diagnóstico de un archivo: tiempos por etapa (ms) y datos del proceso
+    (p. ej. la estrategia de descarga que tuvo éxito). Envuelve el diccionario que
+    se guarda en result['diagnostico'], así ambas etapas del pipeline escriben en él
+    """
+
+    def __init__(self, block: Optional[Dict] = None):
+        self.block = block if block is not None else {}
+        self.block.setdefault('tiempos_ms', {})
+
+    @classmethod
+    def from_result(cls, result: Dict) -> Optional['Diagnostics']:
+        block = result.get('diagnostico')
+        return cls(block) if block is not None else None
+
+    def add(self, stage: str, seconds: float) -> None:
+        tiempos = self.block['tiempos_ms']
+        tiempos[stage] = round(tiempos.get(stage, 0.0) + seconds * 1000, 3)
+
+    def set(self, key: str, value) -> None:
+        self.block[key] = value
+
+
+def record(diagnostics: Optional[Diagnostics], stage: str, start: float) -> None:
+    """
+    Acumula el tiempo transcurrido desde start (time.perf_counter) en la etapa dada
+    """
+    if diagnostics is not None:
+        diagnostics.add(stage, time.perf_counter() - start)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Percentil por rango más cercano (values no necesita estar ordenado)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def collect_stage_timings(results: List[Dict]) -> Dict[str, List[float]]:
+    """
+    Agrupa los tiempos (ms) de todos los resultados por etapa, en orden de presentación
+    """
+    collected: Dict[str, List[float]] = {}
+    for result in results:
+        tiempos = (result.get('diagnostico') or {}).get('tiempos_ms', {})
+        for stage, ms in tiempos.items():
+            collected.setdefault(stage, []).append(ms)
+
+    ordered = {stage: collected.pop(stage) for stage in STAGE_ORDER if stage in collected}
+    ordered.update(sorted(collected.items()))
+    return ordered
+
+
+def summarize_stage_timings(results: List[Dict]) -> List[Dict]:
+    """
+    Filas con n, media, p50, p95 y máximo (ms) por etapa
+    """
+    rows = []
+    for stage, values in collect_stage_timings(results).items():
+        rows.append({
+            'Etapa': stage,
+            'N': len(values),
+            'Media (ms)': round(sum(values) / len(values), 1),
+            'p50 (ms)': round(percentile(values, 50), 1),
+            'p95 (ms)': round(percentile(values, 95), 1),
+            'Máx (ms)': round(max(values), 1),
+        })
+    return rows
+
+
+def histogram(values: List[float], buckets=HISTOGRAM_BUCKETS_MS) -> List[Tuple[str, int]]:
+    """
+    Conteos por cubeta: [('≤10ms', n), ..., ('>30000ms', n)]
+    """
+    counts = [0] * (len(buckets) + 1)
+    for value in values:
+        for i, upper in enumerate(buckets):
+            if value <= upper:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+
+    labels = [f"≤{upper}ms" for upper in buckets] + [f">{buckets[-1]}ms"]
+    return list(zip(labels, counts))
@@ -5,15 +5,77 @@ Utilidades para la aplicación Streamlit del Scraper SAT
 
 import streamlit as st
 import pandas as pd
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
-import gc
+from collections import OrderedDict
+import copy
+import hashlib
+import threading
+import time
 
-def clear_memory():
+import timing
+
+def is_success(value) -> bool:
+    """
+    Indica si un indicador de éxito del scraper ('True'/'False' o booleano) es positivo
+    """
+    return value is True or value == 'True'
+
+def content_hash(data: bytes) -> str:
+    """
+    Hash SHA-256 del contenido de un archivo (clave estable entre recargas y nombres)
+    """
+    return hashlib.sha256(data).hexdigest()
+
+class FileResultCache:
     """
-    Libera memoria no necesaria
+    Resultados por archivo indexados por (hash del contenido, etapas, timeout), con
+    expiración (TTL) y desalojo LRU. Seguro entre hilos: una sola instancia se comparte
+    entre sesiones vía st.cache_resource
     """
-    gc.collect()
+
+    def __init__(self, max_entries: int = 500, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Tuple, Tuple[float, Dict]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(digest: str, stages: Iterable[str], timeout: int) -> Tuple:
+        return (digest, tuple(sorted(stages)), timeout)
+
+    def get(self, key: Tuple, filename: str) -> Optional[Dict]:
+        """
+        Copia del resultado guardado (con el nombre de archivo actual) o None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+
+        result = copy.deepcopy(result)
+        result['archivo_pdf'] = filename
+        return result
+
+    def put(self, key: Tuple, result: Dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
 
 def format_status_icon(status: bool) -> str:
     """
@@ -27,51 +89,47 @@ def format_status_text(status: bool) -> str:
     """
     return "Exitoso" if status else "Fallido"
 
+def summary_row(result: Dict) -> Dict:
+    """
+    Fila del resumen para un resultado (usada por la tabla final y la vista en vivo)
+    """
+    # Construir nombre completo
+    nombre_completo = ""
+    if result.get('web_nombre') and result.get('web_apellido_paterno'):
+        nombre_completo = f"{result.get('web_nombre', '')} {result.get('web_apellido_paterno', '')} {result.get('web_apellido_materno', '')}".strip()
+    elif result.get('pdf_nombre') and result.get('pdf_primer_apellido'):
+        nombre_completo = f"{result.get('pdf_nombre', '')} {result.get('pdf_primer_apellido', '')} {result.get('pdf_segundo_apellido', '')}".strip()
+
+    # Obtener datos principales
+    rfc = result.get('web_rfc') or result.get('pdf_rfc') or result.get('rfc', '')
+    curp = result.get('web_curp') or result.get('pdf_curp') or result.get('curp', '')
+    situacion = result.get('web_situacion_contribuyente', '')
+    municipio = result.get('web_municipio') or result.get('pdf_municipio', '')
+    estado = result.get('web_entidad_federativa') or result.get('pdf_entidad_federativa', '')
+
+    return {
+        '📄 Archivo': result.get('archivo_pdf', ''),
+        '🆔 RFC': rfc,
+        '🌐 Scraping Web': format_status_icon(is_success(result.get('scraping_exitoso'))),
+        '📋 Nombre': nombre_completo,
+        '🆔 CURP': curp,
+        '📊 Situación': situacion,
+        '🏘️ Municipio': municipio,
+        '🏛️ Estado': estado,
+        '❌ Error': result.get('error', ''),
+        '🔗 URL': result.get('url', '')[:50] + '...' if len(result.get('url', '')) > 50 else result.get('url', '')
+    }
+
 def create_summary_dataframe(results: List[Dict]) -> pd.DataFrame:
     """
-    Crea un DataFrame de resumen para mostrar en Streamlit (optimizado para memoria)
+    Crea un DataFrame de resumen para mostrar en Streamlit
     """
     if not results:
         return pd.DataFrame()
 
-    # Usar dictionary comprehension más eficiente
-    summary_data = []
-
-    for result in results:
-        # Construir nombre completo
-        nombre_completo = ""
-        if result.get('web_nombre') and result.get('web_apellido_paterno'):
-            nombre_completo = f"{result.get('web_nombre', '')} {result.get('web_apellido_paterno', '')} {result.get('web_apellido_materno', '')}".strip()
-        elif result.get('pdf_nombre') and result.get('pdf_primer_apellido'):
-            nombre_completo = f"{result.get('pdf_nombre', '')} {result.get('pdf_primer_apellido', '')} {result.get('pdf_segundo_apellido', '')}".strip()
-        
-        # Obtener datos principales
-        rfc = result.get('web_rfc') or result.get('pdf_rfc') or result.get('rfc', '')
-        curp = result.get('web_curp') or result.get('pdf_curp') or result.get('curp', '')
-        situacion = result.get('web_situacion_contribuyente', '')
-        municipio = result.get('web_municipio') or result.get('pdf_municipio', '')
-        estado = result.get('web_entidad_federativa') or result.get('pdf_entidad_federativa', '')
-        
-        summary_row = {
-            '📄 Archivo': result.get('archivo_pdf', ''),
-            '🆔 RFC': rfc,
-            '🌐 Scraping Web': format_status_icon(result.get('scraping_exitoso', False)),
-            '📋 Nombre': nombre_completo,
-            '🆔 CURP': curp,
-            '📊 Situación': situacion,
-            '🏘️ Municipio': municipio,
-            '🏛️ Estado': estado,
-            '❌ Error': result.get('error', ''),
-            '🔗 URL': result.get('url', '')[:50] + '...' if len(result.get('url', '')) > 50 else result.get('url', '')
-            }
-        summary_data.append(summary_row)
-
-    # Crear DataFrame y liberar memoria
-    df = pd.DataFrame(summary_data)
-    del summary_data  # Liberar memoria de la lista
-    clear_memory()    # Liberar memoria adicional
-
-    return df
+    # Sin gc.collect(): una recolección completa por render costaba más que la
+    # memoria que liberaba (la vista se memoiza por versión de resultados)
+    return pd.DataFrame([summary_row(result) for result in results])
 
 def create_detailed_dataframe(results: List[Dict]) -> pd.DataFrame:
     """
@@ -80,7 +138,7 @@ def create_detailed_dataframe(results: List[Dict]) -> pd.DataFrame:
     detailed_data = []
     
     for result in results:
-        if result.get('scraping_exitoso'):
+        if is_success(result.get('scraping_exitoso')):
             detailed_row = {
                 'Archivo PDF': result.get('archivo_pdf', ''),
                 'RFC': result.get('rfc', ''),
@@ -117,7 +175,7 @@ def create_pdf_dataframe(results: List[Dict]) -> pd.DataFrame:
     pdf_data = []
     
     for result in results:
-        if result.get('extraccion_pdf_exitosa'):
+        if is_success(result.get('extraccion_pdf_exitosa')):
             pdf_row = {
                 'Archivo PDF': result.get('archivo_pdf', ''),
                 'RFC (PDF)': result.get('pdf_rfc', result.get('pdf_rfc_alt', '')),
@@ -144,13 +202,35 @@ def create_pdf_dataframe(results: List[Dict]) -> pd.DataFrame:
     
     return pd.DataFrame(pdf_data)
 
-def create_stats_dataframe(results: List[Dict]) -> pd.DataFrame:
+def count_results(results: List[Dict]) -> Dict[str, int]:
+    """
+    Conteos de éxito en una sola pasada: total, scraping, pdf y qr
+    """
+    counts = {'total': 0, 'scraping': 0, 'pdf': 0, 'qr': 0}
+    for result in results:
+        add_to_counts(counts, result)
+    return counts
+
+def add_to_counts(counts: Dict[str, int], result: Dict) -> None:
+    """
+    Suma un resultado a los conteos de count_results (actualización incremental)
+    """
+    counts['total'] += 1
+    if is_success(result.get('scraping_exitoso')):
+        counts['scraping'] += 1
+    if is_success(result.get('extraccion_pdf_exitosa')):
+        counts['pdf'] += 1
+    if is_success(result.get('url_encontrada')):
+        counts['qr'] += 1
+
+def create_stats_dataframe(results: List[Dict], counts: Optional[Dict[str, int]] = None) -> pd.DataFrame:
     """
     Crea un DataFrame con estadísticas del procesamiento
     """
-    successful_scraping = len([r for r in results if r.get('scraping_exitoso')])
-    successful_pdf_extraction = len([r for r in results if r.get('extraccion_pdf_exitosa')])
-    total_files = len(results)
+    counts = counts or count_results(results)
+    successful_scraping = counts['scraping']
+    successful_pdf_extraction = counts['pdf']
+    total_files = counts['total']
     
     # Crear DataFrame con datos y columnas por separado para evitar conflictos de tipos
     df = pd.DataFrame([
@@ -168,6 +248,45 @@ def create_stats_dataframe(results: List[Dict]) -> pd.DataFrame:
     df.columns = ['Métrica', 'Valor']
     return df
 
+def create_timing_dataframe(results: List[Dict]) -> pd.DataFrame:
+    """
+    Crea un DataFrame con los tiempos por etapa (n, media, p50, p95, máximo)
+    """
+    return pd.DataFrame(timing.summarize_stage_timings(results))
+
+def create_histogram_dataframe(results: List[Dict], stage: str) -> pd.DataFrame:
+    """
+    Crea un DataFrame con el histograma de tiempos de una etapa
+    """
+    values = timing.collect_stage_timings(results).get(stage, [])
+    df = pd.DataFrame(timing.histogram(values), columns=['Rango', 'Archivos'])
+    return df.set_index('Rango')
+
+def format_eta(seconds: float) -> str:
+    """
+    Tiempo restante legible: '45s', '3m 20s', '1h 05m'
+    """
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+def page_count(total_rows: int, page_size: int) -> int:
+    """
+    Número de páginas (al menos 1) para mostrar total_rows filas
+    """
+    return max(1, -(-total_rows // page_size))
+
+def paginate_dataframe(df: pd.DataFrame, page: int, page_size: int) -> pd.DataFrame:
+    """
+    Filas de la página indicada (1-based); solo esas se envían al navegador
+    """
+    page = min(max(1, page), page_count(len(df), page_size))
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size]
+
 def display_file_info(uploaded_file) -> None:
     """
     Muestra información del archivo cargado
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+Cola de trabajo distribuida: un coordinador reparte PDFs y workers sin estado en
+cualquier número de nodos los procesan con SATScraper.process_pdf
+
+Cada trabajo lleva el hash del contenido y la ubicación del PDF (blob), no los
+bytes. Un worker reserva un trabajo por visibility_timeout segundos: si no
+confirma a tiempo (se cayó el nodo, se colgó el proceso) el trabajo vuelve a la
+cola; tras max_attempts intentos se entrega como fallido. Los errores se
+reintentan con una espera creciente. La entrega es "al menos una vez": el
+coordinador descarta resultados duplicados por id de trabajo.
+
+Backends (por URL):
+    sqlite:///ruta/cola.db   un host, varios procesos; blobs en <ruta>/blobs
+    redis://host:6379/0      varios nodos; cualquier servidor con protocolo Redis
+                             (blobs en el propio servidor o en un directorio compartido)
+
+Para pruebas locales sin Redis: python -m benchmarks.resp_stub
+"""
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from memory_governor import estimate_footprint, shared_governor
+from pipeline import error_result
+
+DEFAULT_VISIBILITY_TIMEOUT = 300
+DEFAULT_MAX_ATTEMPTS = 3
+# Espera antes de reintentar un trabajo que falló: RETRY_DELAY × intentos (s)
+RETRY_DELAY = 5.0
+# Espera máxima (s) entre reintentos cuando la cola falla
+MAX_ERROR_BACKOFF = 30.0
+
+# Estados de un trabajo en SQLite
+PENDING = 'pendiente'
+RESERVED = 'reservado'
+DONE = 'hecho'
+FAILED = 'fallido'
+
+
+class Job(NamedTuple):
+    id: str
+    batch: str
+    payload: Dict
+    attempts: int
+
+
+def _failed_result(payload: Dict, message: str) -> Dict:
+    return error_result(payload.get('archivo', ''), message)
+
+
+# --- SQLite (un host) -------------------------------------------------------
+
+class SQLiteQueue:
+    """
+    Cola en un archivo SQLite compartido por los procesos de un mismo host
+    """
+
+    def __init__(self, path: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS trabajos (id INTEGER PRIMARY KEY AUTOINCREMENT, lote TEXT, "
+                         f"datos TEXT, estado TEXT DEFAULT '{PENDING}', intentos INTEGER DEFAULT 0, "
+                         f"visible_en REAL DEFAULT 0, resultado TEXT, entregado INTEGER DEFAULT 0)")
+            conn.execute('CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado, visible_en)')
+            conn.execute('CREATE INDEX IF NOT EXISTS trabajos_lote ON trabajos (lote, entregado)')
+
+    def _conn(self):
+        import sqlite3
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        queue = self
+
+        class Transaction:
+            def __enter__(self):
+                self.conn = queue._conn()
+                # IMMEDIATE: dos workers no pueden reservar el mismo trabajo
+                self.conn.execute('BEGIN IMMEDIATE')
+                return self.conn
+
+            def __exit__(self, exc_type, exc, tb):
+                self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+        return Transaction()
+
+    def put_many(self, batch: str, payloads: Iterable[Dict]) -> int:
+        rows = [(batch, json.dumps(payload, ensure_ascii=False)) for payload in payloads]
+        with self._transaction() as conn:
+            conn.executemany('INSERT INTO trabajos (lote, datos) VALUES (?, ?)', rows)
+        return len(rows)
+
+    def reserve(self, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT) -> Optional[Job]:
+        now = time.time()
+        with self._transaction() as conn:
+            # Reservas vencidas sin intentos restantes: se entregan como fallidas
+            expired = conn.execute('SELECT id, datos FROM trabajos WHERE estado = ? AND visible_en <= ? '
+                                   'AND intentos >= ?', (RESERVED, now, self.max_attempts)).fetchall()
+            for job_id, data in expired:
+                result = _failed_result(json.loads(data), 'Tiempo de procesamiento agotado en todos los intentos')
+                conn.execute('UPDATE trabajos SET estado = ?, resultado = ? WHERE id = ?',
+                             (FAILED, json.dumps(result, ensure_ascii=False), job_id))
+
+            row = conn.execute('SELECT id, lote, datos, intentos FROM trabajos WHERE estado IN (?, ?) '
+                               'AND visible_en <= ? ORDER BY id LIMIT 1', (PENDING, RESERVED, now)).fetchone()
+            if row is None:
+                return None
+            job_id, batch, data, attempts = row
+            conn.execute('UPDATE trabajos SET estado = ?, intentos = intentos + 1, visible_en = ? WHERE id = ?',
+                         (RESERVED, now + visibility_timeout, job_id))
+        return Job(str(job_id), batch, json.loads(data), attempts + 1)
+
+    def ack(self, job: Job, result: Dict) -> None:
+        with self._transaction() as conn:
+            conn.execute('UPDATE trabajos SET estado = ?, resultado = ? WHERE id = ? AND estado = ?',
+                         (DONE, json.dumps(result, ensure_ascii=False), int(job.id), RESERVED))
+
+    def nack(self, job: Job, message: str) -> None:
+        with self._transaction() as conn:
+            if job.attempts >= self.max_attempts:
+                result = json.dumps(_failed_result(job.payload, message), ensure_ascii=False)
+                conn.execute('UPDATE trabajos SET estado = ?, resultado = ? WHERE id = ?',
+                             (FAILED, result, int(job.id)))
+            else:
+                conn.execute('UPDATE trabajos SET estado = ?, visible_en = ? WHERE id = ?',
+                             (PENDING, time.time() + RETRY_DELAY * job.attempts, int(job.id)))
+
+    def pop_results(self, batch: str, limit: int = 100) -> List[Tuple[str, Dict]]:
+        with self._transaction() as conn:
+            rows = conn.execute('SELECT id, resultado FROM trabajos WHERE lote = ? AND entregado = 0 '
+                                'AND estado IN (?, ?) LIMIT ?', (batch, DONE, FAILED, limit)).fetchall()
+            conn.executemany('UPDATE trabajos SET entregado = 1 WHERE id = ?', [(row[0],) for row in rows])
+        return [(str(job_id), json.loads(result)) for job_id, result in rows]
+
+
+# --- Protocolo Redis (varios nodos) -----------------------------------------
+
+class RespError(Exception):
+    """
+    Error reportado por el servidor (respuesta "-ERR ...")
+    """
+
+
+class RespClient:
+    """
+    Cliente mínimo del protocolo Redis (RESP2) con una conexión por hilo
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379, db: int = 0, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = (sock, sock.makefile('rb'))
+            self._local.conn = conn
+            if self.db:
+                self.execute('SELECT', self.db)
+        return conn
+
+    def execute(self, *args):
+        sock, reader = self._connection()
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        try:
+            sock.sendall(b''.join(parts))
+            return self._read_reply(reader)
+        except (OSError, ConnectionError):
+            # Conexión rota: se descarta para que la siguiente llamada reconecte
+            self._local.conn = None
+            raise
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('El servidor cerró la conexión')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RespError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read_reply(reader) for _ in range(length)]
+        raise RespError(f'Respuesta desconocida: {line!r}')
+
+
+class RedisQueue:
+    """
+    Cola sobre un servidor con protocolo Redis, compartida por todos los nodos.
+    pendientes: lista de ids; reservados: conjunto ordenado por vencimiento;
+    trabajo:<id>: hash con lote, datos e intentos; resultados:<lote>: lista JSON.
+    Reservar mueve el id de forma atómica a la lista procesando hasta registrarlo
+    en reservados: si el worker cae entre ambos pasos, otro lo adopta (ver
+    _adopt_orphans) y el trabajo no se pierde
+    """
+
+    def __init__(self, client: RespClient, max_attempts: int = DEFAULT_MAX_ATTEMPTS, prefix: str = 'csf'):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.prefix = prefix
+
+    def _key(self, *parts) -> str:
+        return ':'.join((self.prefix,) + tuple(str(part) for part in parts))
+
+    def put_many(self, batch: str, payloads: Iterable[Dict]) -> int:
+        count = 0
+        for payload in payloads:
+            job_id = self.client.execute('INCR', self._key('secuencia'))
+            self.client.execute('HSET', self._key('trabajo', job_id), 'lote', batch,
+                                'datos', json.dumps(payload, ensure_ascii=False), 'intentos', 0)
+            self.client.execute('LPUSH', self._key('pendientes'), job_id)
+            count += 1
+        return count
+
+    def _adopt_orphans(self, visibility_timeout: float) -> None:
+        """
+        Ids en procesando sin reserva (worker caído tras sacarlos de pendientes): se
+        reservan a su nombre y vuelven a la cola al vencer
+        """
+        for raw_id in self.client.execute('LRANGE', self._key('procesando'), 0, -1) or []:
+            job_id = raw_id.decode()
+            if self.client.execute('ZSCORE', self._key('reservados'), job_id) is None:
+                # NX: si el worker sigue vivo y ya lo registró, su reserva se respeta
+                self.client.execute('ZADD', self._key('reservados'), 'NX', time.time() + visibility_timeout, job_id)
+            self.client.execute('LREM', self._key('procesando'), 0, job_id)
+
+    def _requeue_expired(self) -> None:
+        expired = self.client.execute('ZRANGEBYSCORE', self._key('reservados'), '-inf', time.time())
+        for raw_id in expired or []:
+            job_id = raw_id.decode()
+            # Solo quien logra quitarlo de reservados lo reencola (evita duplicarlo)
+            if self.client.execute('ZREM', self._key('reservados'), job_id) != 1:
+                continue
+            fields = self._fields(job_id)
+            if fields is None:
+                continue
+            if int(fields['intentos']) >= self.max_attempts:
+                payload = json.loads(fields['datos'])
+                self._finish(job_id, fields['lote'],
+                             _failed_result(payload, 'Tiempo de procesamiento agotado en todos los intentos'))
+            else:
+                self.client.execute('RPUSH', self._key('pendientes'), job_id)
+
+    def _fields(self, job_id: str) -> Optional[Dict[str, str]]:
+        values = self.client.execute('HGETALL', self._key('trabajo', job_id))
+        if not values:
+            return None
+        return {values[i].decode(): values[i + 1].decode('utf-8') for i in range(0, len(values), 2)}
+
+    def reserve(self, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT) -> Optional[Job]:
+        self._adopt_orphans(visibility_timeout)
+        self._requeue_expired()
+        while True:
+            raw_id = self.client.execute('RPOPLPUSH', self._key('pendientes'), self._key('procesando'))
+            if raw_id is None:
+                return None
+            job_id = raw_id.decode()
+            self.client.execute('ZADD', self._key('reservados'), time.time() + visibility_timeout, job_id)
+            self.client.execute('LREM', self._key('procesando'), 0, job_id)
+            attempts = self.client.execute('HINCRBY', self._key('trabajo', job_id), 'intentos', 1)
+            fields = self._fields(job_id)
+            if fields is None or 'datos' not in fields:
+                # Ya confirmado por otro worker tras un vencimiento
+                self.client.execute('ZREM', self._key('reservados'), job_id)
+                self.client.execute('DEL', self._key('trabajo', job_id))
+                continue
+            return Job(job_id, fields['lote'], json.loads(fields['datos']), attempts)
+
+    def _finish(self, job_id: str, batch: str, result: Dict) -> None:
+        self.client.execute('RPUSH', self._key('resultados', batch),
+                            json.dumps({'id': job_id, 'resultado': result}, ensure_ascii=False))
+        self.client.execute('DEL', self._key('trabajo', job_id))
+
+    def ack(self, job: Job, result: Dict) -> None:
+        self.client.execute('ZREM', self._key('reservados'), job.id)
+        self._finish(job.id, job.batch, result)
+
+    def nack(self, job: Job, message: str) -> None:
+        if job.attempts >= self.max_attempts:
+            self.client.execute('ZREM', self._key('reservados'), job.id)
+            self._finish(job.id, job.batch, _failed_result(job.payload, message))
+        else:
+            # Vuelve a la cola cuando venza esta reserva más corta (espera antes de reintentar)
+            self.client.execute('ZADD', self._key('reservados'), time.time() + RETRY_DELAY * job.attempts, job.id)
+
+    def pop_results(self, batch: str, limit: int = 100) -> List[Tuple[str, Dict]]:
+        results = []
+        for _ in range(limit):
+            raw = self.client.execute('LPOP', self._key('resultados', batch))
+            if raw is None:
+                break
+            item = json.loads(raw)
+            results.append((item['id'], item['resultado']))
+        return results
+
+
+# --- Blobs ------------------------------------------------------------------
+
+class FileBlobStore:
+    """
+    PDFs en un directorio (local o montado en todos los nodos), por hash
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def put(self, digest: str, data: bytes) -> str:
+        path = os.path.join(self.root, digest[:2], f'{digest}.pdf')
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        return f'file:{path}'
+
+
+class RedisBlobStore:
+    """
+    PDFs en el propio servidor Redis, con expiración (no requiere disco compartido)
+    """
+
+    def __init__(self, client: RespClient, prefix: str = 'csf', ttl: int = 7 * 24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def put(self, digest: str, data: bytes) -> str:
+        key = f'{self.prefix}:blob:{digest}'
+        self.client.execute('SET', key, data, 'EX', self.ttl)
+        return f'redis:{key}'
+
+
+def read_blob(location: str, client: Optional[RespClient] = None) -> bytes:
+    scheme, _, target = location.partition(':')
+    if scheme == 'file':
+        with open(target, 'rb') as f:
+            return f.read()
+    if scheme == 'redis' and client is not None:
+        data = client.execute('GET', target)
+        if data is None:
+            raise FileNotFoundError(f'Blob expirado o inexistente: {target}')
+        return data
+    raise ValueError(f'Ubicación de blob no soportada: {location}')
+
+
+def open_queue(url: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS, blobs: Optional[str] = None):
+    """
+    Cola y almacén de blobs para una URL sqlite:///ruta o redis://host:puerto/db.
+    blobs: directorio para los PDFs (por defecto junto a la base SQLite o en Redis)
+    """
+    from urllib.parse import urlparse
+
+    parsed = urlparse(url)
+    if parsed.scheme == 'sqlite':
+        path = parsed.path
+        queue = SQLiteQueue(path, max_attempts)
+        return queue, FileBlobStore(blobs or os.path.join(os.path.dirname(os.path.abspath(path)), 'blobs'))
+    if parsed.scheme == 'redis':
+        db = int(parsed.path.strip('/') or 0)
+        client = RespClient(parsed.hostname or '127.0.0.1', parsed.port or 6379, db)
+        queue = RedisQueue(client, max_attempts)
+        return queue, FileBlobStore(blobs) if blobs else RedisBlobStore(client)
+    raise ValueError(f'URL de cola no soportada: {url} (usa sqlite:///ruta o redis://host:puerto/db)')
+
+
+# --- Coordinador y worker ---------------------------------------------------
+
+def submit_batch(queue, blobs, files: Iterable[Tuple[str, bytes]], stages=None) -> Tuple[str, int]:
+    """
+    Sube los PDFs y encola un trabajo por archivo. Retorna (lote, trabajos)
+    """
+    batch = uuid.uuid4().hex[:12]
+    stage_names = sorted(stages) if stages is not None else None
+
+    def payloads():
+        for filename, data in files:
+            digest = hashlib.sha256(data).hexdigest()
+            yield {'archivo': filename, 'hash': digest, 'blob': blobs.put(digest, data), 'etapas': stage_names}
+
+    return batch, queue.put_many(batch, payloads())
+
+
+def collect_results(queue, batch: str, total: int, poll_interval: float = 0.5) -> Iterator[Dict]:
+    """
+    Entrega los resultados del lote conforme los workers terminan (sin duplicados)
+    """
+    seen = set()
+    while len(seen) < total:
+        items = queue.pop_results(batch)
+        if not items:
+            time.sleep(poll_interval)
+            continue
+        for job_id, result in items:
+            if job_id not in seen:
+                seen.add(job_id)
+                yield result
+
+
+class QueueWorker:
+    """
+    Worker sin estado: threads hilos reservan trabajos, procesan el PDF y
+    publican el resultado
+    """
+
+    def __init__(self, queue, scraper, threads: int = 4,
+                 visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT, idle_sleep: float = 1.0):
+        self.queue = queue
+        self.scraper = scraper
+        self.threads = max(1, threads)
+        self.visibility_timeout = visibility_timeout
+        self.idle_sleep = idle_sleep
+        self.processed = 0
+        self._count_lock = threading.Lock()
+        self.memory_governor = shared_governor()
+
+    def handle(self, job: Job) -> Dict:
+        payload = job.payload
+        data = read_blob(payload['blob'], getattr(self.queue, 'client', None))
+        if hashlib.sha256(data).hexdigest() != payload['hash']:
+            raise ValueError('El contenido del blob no coincide con su hash')
+        if self.memory_governor is None:
+            return self.scraper.process_pdf(data, payload['archivo'], payload.get('etapas'))
+        with self.memory_governor.reserve(estimate_footprint(data)):
+            return self.scraper.process_pdf(data, payload['archivo'], payload.get('etapas'))
+
+    def _loop(self, stop: threading.Event) -> None:
+        failures = 0
+        while not stop.is_set():
+            try:
+                worked = self._step()
+                failures = 0
+            except Exception as e:
+                # Cualquier error de la cola (red, RespError, SQLite bloqueada) se
+                # reintenta: el hilo nunca muere y el trabajo reservado vence y vuelve
+                failures += 1
+                print(f"Error con la cola: {type(e).__name__}: {str(e)}")
+                stop.wait(min(self.idle_sleep * 2 ** failures, MAX_ERROR_BACKOFF))
+                continue
+            if not worked:
+                stop.wait(self.idle_sleep)
+
+    def _step(self) -> bool:
+        """
+        Reserva y procesa un trabajo; False si la cola estaba vacía
+        """
+        job = self.queue.reserve(self.visibility_timeout)
+        if job is None:
+            return False
+        try:
+            result = self.handle(job)
+        except Exception as e:
+            self.queue.nack(job, str(e))
+            return True
+        self.queue.ack(job, result)
+        with self._count_lock:
+            self.processed += 1
+        return True
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """
+        Procesa hasta que se active stop (o indefinidamente)
+        """
+        stop = stop or threading.Event()
+        threads = [threading.Thread(target=self._loop, args=(stop,), name=f'csf-worker_{i}', daemon=True)
+                   for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()